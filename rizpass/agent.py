@@ -0,0 +1,264 @@
+import os
+import json
+import socket
+import struct
+import tempfile
+from sys import stderr
+from threading import Lock, Thread
+from time import monotonic
+from typing import List, Tuple, Union
+
+from .credentials import Credential, DecryptionError, decrypt_credentials, iter_decrypted_credentials
+from .db_manager import DbManager
+from .output import print_red, print_verbose
+from .passwords import VaultKey
+from .validator import ensure_type
+
+# Path of the socket of the agent to use instead of the default one
+AGENT_SOCKET_ENV = "RIZPASS_AGENT_SOCK"
+# Seconds without a request after which the agent stops and forgets the vault key
+DEFAULT_IDLE_TIMEOUT = 900.0
+
+
+class AgentError(Exception):
+    pass
+
+
+def is_agent_supported() -> bool:
+    return hasattr(socket, "AF_UNIX") and hasattr(os, "getuid")
+
+
+def get_socket_path() -> str:
+    """Returns the path of the agent's socket, in a directory that only the user can access."""
+    if os.environ.get(AGENT_SOCKET_ENV):
+        return os.environ[AGENT_SOCKET_ENV]
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"rizpass-{os.getuid()}", "agent.sock")
+
+
+def get_peer_uid(connection: socket.socket) -> Union[int, None]:
+    """Returns the id of the user on the other end of a Unix domain socket or None if the platform cannot tell."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid
+
+
+class Agent:
+    """
+    Keeps a vault unlocked and answers requests for its decrypted credentials over a Unix domain socket, so that
+    running rizpass again neither has to ask for the master password, derive the vault key nor connect to the database.
+
+    The socket is only accessible by the user, and connections from other users are refused on platforms that can tell
+    who is connecting. The agent stops once no request has been made for idle_timeout seconds.
+    Requests and responses are JSON objects, one per line. source names the vault, so that clients can tell whether the
+    agent holds the vault they are looking for.
+    """
+
+    def __init__(self, vault_key: VaultKey, creds_manager: DbManager, source: str, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        ensure_type(vault_key, VaultKey, "vault_key", "VaultKey")
+        ensure_type(creds_manager, DbManager, "creds_manager", "DbManager")
+        ensure_type(source, str, "source", "string")
+        ensure_type(idle_timeout, Union[int, float], "idle_timeout", "float")
+
+        self.vault_key = vault_key
+        self.creds_manager = creds_manager
+        self.source = source
+        self.idle_timeout = idle_timeout
+        self.last_request = monotonic()
+        # Managers are not shared between threads, so requests are answered one at a time
+        self.lock = Lock()
+
+    def handle(self, request: dict) -> dict:
+        """Answers a single request."""
+        action = request.get("action")
+
+        if action == "ping":
+            return {"ok": True, "source": self.source}
+
+        if action == "get":
+            id = request.get("id")
+            if not isinstance(id, int) or isinstance(id, bool):
+                return {"ok": False, "error": "Invalid credential id!"}
+
+            raw_cred = self.creds_manager.get_credential(id)
+            if raw_cred is None:
+                return {"ok": True, "credential": None}
+
+            cred, decrypted = decrypt_credentials(self.vault_key, [raw_cred])[0]
+            if not decrypted:
+                return {"ok": False, "error": str(DecryptionError()), "decrypted": False}
+            return {"ok": True, "credential": cred.get_obj()}
+
+        if action == "list":
+            filters = [request.get(name, "") for name in ("title", "username", "email")]
+            if not all(isinstance(value, str) for value in filters):
+                return {"ok": False, "error": "Invalid filter!"}
+
+            creds = []
+            failed_ids = []
+            for cred, decrypted in iter_decrypted_credentials(self.vault_key, self.creds_manager.iter_credentials()):
+                # Credentials that cannot be decrypted are always listed, as there is no telling whether they match
+                if not decrypted:
+                    failed_ids.append(cred.id)
+                    creds.append(cred.get_obj())
+                elif cred.matches(*filters):
+                    creds.append(cred.get_obj())
+
+            return {"ok": True, "credentials": creds, "failed": failed_ids}
+
+        return {"ok": False, "error": f"Unknown action: {action}"}
+
+    def __serve_connection(self, connection: socket.socket) -> None:
+        with connection:
+            if get_peer_uid(connection) not in [None, os.getuid()]:
+                print_verbose("Refused a connection from another user")
+                return
+
+            stream = connection.makefile("rwb")
+            for line in stream:
+                self.last_request = monotonic()
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Requests must be JSON objects")
+                    with self.lock:
+                        response = self.handle(request)
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+
+                stream.write(json.dumps(response).encode("utf-8") + b"\n")
+                stream.flush()
+
+    def serve(self, socket_path: str) -> None:
+        """Answers requests on the socket until the agent has been idle for idle_timeout seconds."""
+        ensure_type(socket_path, str, "socket_path", "string")
+
+        directory = os.path.dirname(socket_path) or "."
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        directory_stat = os.stat(directory)
+        if directory_stat.st_uid != os.getuid() or directory_stat.st_mode & 0o077:
+            raise AgentError(f"The directory of the agent's socket must only be accessible by you: {directory}")
+
+        if os.path.exists(socket_path):
+            running_agent = connect_agent(socket_path)
+            if running_agent is not None:
+                running_agent.close()
+                raise AgentError("An agent is already running!")
+            # Left behind by an agent that did not stop cleanly
+            os.remove(socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            server.bind(socket_path)
+        finally:
+            os.umask(old_umask)
+
+        try:
+            server.listen()
+            while True:
+                remaining = self.idle_timeout - (monotonic() - self.last_request)
+                if remaining <= 0:
+                    break
+                server.settimeout(remaining)
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    continue
+                connection.settimeout(None)
+                Thread(target=self.__serve_connection, args=(connection, ), daemon=True).start()
+        finally:
+            server.close()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+class AgentClient:
+    """A connection to a running agent. Any number of requests can be made over it."""
+
+    def __init__(self, socket_path: str):
+        ensure_type(socket_path, str, "socket_path", "string")
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.connect(socket_path)
+        except OSError:
+            self.socket.close()
+            raise
+        self.stream = self.socket.makefile("rwb")
+
+    def request(self, action: str, **params) -> dict:
+        """
+        Sends a request to the agent and returns its response, raising AgentError if it could not be answered
+        or DecryptionError if the credential asked for could not be decrypted.
+        """
+        self.stream.write(json.dumps({"action": action, **params}).encode("utf-8") + b"\n")
+        self.stream.flush()
+
+        line = self.stream.readline()
+        if not line:
+            raise AgentError("The agent closed the connection!")
+
+        response = json.loads(line)
+        if not response.get("ok"):
+            if response.get("decrypted") is False:
+                raise DecryptionError(response.get("error"))
+            raise AgentError(response.get("error"))
+        return response
+
+    def get_credential(self, id: int) -> Union[Credential, None]:
+        ensure_type(id, int, "id", "int")
+
+        cred = self.request("get", id=id)["credential"]
+        return Credential(**cred) if cred else None
+
+    def get_credentials(self, title_filter: str = "", username_filter: str = "", email_filter: str = "") -> List[Tuple[Credential, bool]]:
+        """
+        Returns a (credential, decrypted successfully) pair for the credentials that match the filters, see Credential.matches.
+        The agent does the filtering. Credentials that could not be decrypted are always returned.
+        """
+        response = self.request("list", title=title_filter, username=username_filter, email=email_filter)
+        return [(Credential(**cred), cred["id"] not in response["failed"]) for cred in response["credentials"]]
+
+    def close(self) -> None:
+        try:
+            self.stream.close()
+        except BrokenPipeError:
+            # A request that is still buffered cannot be sent to an agent that has hung up
+            pass
+        except Exception as e:
+            print_red("There was an error while closing the connection to the agent:", file=stderr)
+            print_red(e, file=stderr)
+        finally:
+            self.socket.close()
+
+
+def connect_agent(socket_path: Union[str, None] = None, source: Union[str, None] = None) -> Union[AgentClient, None]:
+    """Returns a connection to the running agent or None if there is none or it holds a vault other than source."""
+    if not is_agent_supported():
+        return None
+
+    socket_path = socket_path or get_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+
+    client = None
+    try:
+        client = AgentClient(socket_path)
+        agent_source = client.request("ping").get("source")
+    except (OSError, ValueError, AgentError) as e:
+        print_verbose(f"Could not connect to the agent: {e}")
+        if client is not None:
+            client.close()
+        return None
+
+    if source is not None and agent_source != source:
+        print_verbose(f"The agent holds another vault: {agent_source}")
+        client.close()
+        return None
+
+    return client
@@ -0,0 +1,152 @@
+from base64 import b64decode, b64encode
+from binascii import Error as Base64Error
+from json import loads as load_json_str, dumps as dump_json_str
+from mmap import ACCESS_READ, mmap
+from struct import Struct
+from typing import BinaryIO, Dict, Iterable, List, Tuple
+
+from .credentials import RawCredential
+from .validator import ensure_type
+
+# Layout of a binary vault file:
+#   header | records | meta (JSON) | index
+# Every record is made up of the title, username, email, password and salt fields, each stored as a flag, a length and the bytes.
+# The index holds the id, offset and length of every record sorted by id.
+MAGIC = b"RZPV"
+VERSION = 1
+HEADER = Struct("<4sHHQQQQQ")
+FIELD_HEADER = Struct("<BI")
+INDEX_ENTRY = Struct("<QQI")
+
+# Fields that are base64 are stored as the raw bytes they encode, anything else is stored as utf-8
+FIELD_TEXT = 0
+FIELD_BASE64 = 1
+
+RECORD_FIELDS = ("title", "username", "email", "password", "salt")
+
+
+def is_binary_vault(file_path: str) -> bool:
+    """
+    Returns True if the file at file_path is a binary vault.
+    """
+    ensure_type(file_path, str, "file_path", "string")
+
+    with open(file_path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def encode_field(value: str) -> bytes:
+    try:
+        data = b64decode(value, validate=True)
+        # Only strings that encode back to themselves can be stored as raw bytes
+        if b64encode(data).decode("ascii") == value:
+            return FIELD_HEADER.pack(FIELD_BASE64, len(data)) + data
+    except (Base64Error, ValueError):
+        pass
+
+    data = value.encode("utf-8")
+    return FIELD_HEADER.pack(FIELD_TEXT, len(data)) + data
+
+
+def encode_record(cred: RawCredential) -> bytes:
+    """
+    Returns the bytes a credential is stored as in a binary vault.
+    """
+    return b"".join(encode_field(getattr(cred, field)) for field in RECORD_FIELDS)
+
+
+def decode_record(id: int, data: bytes) -> RawCredential:
+    """
+    Returns the credential stored in the bytes of a record.
+    """
+    values: List[str] = []
+    offset = 0
+
+    for _ in RECORD_FIELDS:
+        flag, length = FIELD_HEADER.unpack_from(data, offset)
+        offset += FIELD_HEADER.size
+        value = data[offset:offset + length]
+        offset += length
+        values.append(b64encode(value).decode("ascii") if flag == FIELD_BASE64 else value.decode("utf-8"))
+
+    return RawCredential(id, *values)
+
+
+def write_binary_vault(file: BinaryIO, records: Iterable[Tuple[int, bytes]], meta: Dict[str, str], next_id: int) -> None:
+    """
+    Writes a binary vault to file. records must yield the id and the encoded bytes of every credential sorted by id.
+    """
+    file.write(bytes(HEADER.size))
+    offset = HEADER.size
+    index: List[bytes] = []
+
+    for id, data in records:
+        file.write(data)
+        index.append(INDEX_ENTRY.pack(id, offset, len(data)))
+        offset += len(data)
+
+    meta_data = dump_json_str(meta).encode("utf-8")
+    meta_offset = offset
+    file.write(meta_data)
+
+    index_offset = meta_offset + len(meta_data)
+    file.write(b"".join(index))
+
+    file.seek(0)
+    file.write(HEADER.pack(MAGIC, VERSION, 0, next_id, len(index), index_offset, meta_offset, len(meta_data)))
+    file.seek(0, 2)
+
+
+class BinaryVault:
+    """
+    Reads a binary vault through mmap, so only the records that are asked for are ever read from the disk.
+    """
+    meta: Dict[str, str]
+    next_id: int
+
+    def __init__(self, file_path: str):
+        ensure_type(file_path, str, "file_path", "string")
+
+        self.file = open(file_path, "rb")
+        self.mmap = mmap(self.file.fileno(), 0, access=ACCESS_READ)
+
+        magic, version, _, self.next_id, count, index_offset, meta_offset, meta_length = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"'{file_path}' is not a binary vault")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported binary vault version: {version}")
+
+        self.meta = load_json_str(self.mmap[meta_offset:meta_offset + meta_length].decode("utf-8"))
+        self.offsets: Dict[int, Tuple[int, int]] = {
+            id: (offset, length)
+            for id, offset, length in INDEX_ENTRY.iter_unpack(self.mmap[index_offset:index_offset + count * INDEX_ENTRY.size])
+        }
+
+    def get_ids(self) -> List[int]:
+        """
+        Returns the ids of the credentials in the vault sorted by id.
+        """
+        return list(self.offsets)
+
+    def get_record(self, id: int) -> bytes:
+        """
+        Returns the encoded bytes of the credential with the given id.
+        """
+        offset, length = self.offsets[id]
+        return self.mmap[offset:offset + length]
+
+    def get_credential(self, id: int) -> RawCredential:
+        """
+        Returns the credential with the given id. Only the bytes of that credential are read.
+        """
+        return decode_record(id, self.get_record(id))
+
+    def close(self):
+        if hasattr(self, "mmap"):
+            self.mmap.close()
+            del self.mmap
+        if hasattr(self, "file"):
+            self.file.close()
+            del self.file
@@ -0,0 +1,205 @@
+from collections import OrderedDict
+from threading import RLock
+from time import monotonic
+from typing import Dict, Iterator, List, Tuple, Union
+
+from .credentials import RawCredential
+from .validator import ensure_type
+from .db_manager import DEFAULT_BATCH_SIZE, DbManager
+
+DEFAULT_CACHE_SIZE = 1024
+# Cached credentials are used without asking the database for this many seconds after they were last checked
+DEFAULT_MAX_AGE = 10.0
+
+
+class CachingManager(DbManager):
+    """
+    Wraps another DbManager and keeps up to size of the credentials read through it in memory, so that reading a credential
+    again does not have to go to the database. The least recently used credentials are dropped first.
+
+    Changes are written through to the wrapped manager and drop the credentials they touch from the cache.
+    Changes made by other clients are noticed by comparing the versions of cached credentials that are older than max_age
+    with the versions in the database, which is much cheaper than reading the credentials again.
+    Storages that do not keep versions have their credentials read again once they are older than max_age.
+    """
+
+    def __init__(self, manager: DbManager, size: int = DEFAULT_CACHE_SIZE, max_age: float = DEFAULT_MAX_AGE):
+        ensure_type(manager, DbManager, "manager", "DbManager")
+        ensure_type(size, int, "size", "int")
+        ensure_type(max_age, Union[int, float], "max_age", "float")
+
+        self.manager = manager
+        self.size = size
+        self.max_age = max_age
+        self.lock = RLock()
+        # id -> (credential, version, time it was last known to be up to date)
+        self.entries: "OrderedDict[int, Tuple[RawCredential, Union[int, None], float]]" = OrderedDict()
+
+    def __store(self, raw_creds: List[RawCredential], versions: Dict[int, int]) -> None:
+        now = monotonic()
+        with self.lock:
+            for raw_cred in raw_creds:
+                self.entries[raw_cred.id] = (raw_cred, versions.get(raw_cred.id, None), now)
+                self.entries.move_to_end(raw_cred.id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def __invalidate(self, ids: List[int]) -> None:
+        with self.lock:
+            for id in ids:
+                self.entries.pop(id, None)
+
+    def __read(self, ids: List[int]) -> Dict[int, RawCredential]:
+        """Returns the credentials with the given ids that exist, reading only the ones that are not cached or out of date."""
+        now = monotonic()
+        found: Dict[int, RawCredential] = dict()
+        stale: Dict[int, Tuple[RawCredential, Union[int, None]]] = dict()
+        missing: List[int] = []
+
+        with self.lock:
+            for id in ids:
+                entry = self.entries.get(id)
+                if entry is None:
+                    missing.append(id)
+                elif now - entry[2] < self.max_age:
+                    found[id] = entry[0]
+                    self.entries.move_to_end(id)
+                else:
+                    stale[id] = (entry[0], entry[1])
+
+        # The versions are read before the credentials themselves, so a credential that changes in between is only ever
+        # cached with an older version than its own and is read again the next time it is checked
+        versions: Dict[int, int] = dict()
+        changed: List[int] = []
+
+        if stale:
+            stale_versions = self.manager.get_versions(list(stale))
+            if stale_versions is None:
+                missing.extend(stale)
+            else:
+                unchanged: List[RawCredential] = []
+                for id, (raw_cred, version) in stale.items():
+                    if id not in stale_versions:
+                        # Removed by another client
+                        self.__invalidate([id])
+                    elif version is not None and stale_versions[id] == version:
+                        unchanged.append(raw_cred)
+                        found[id] = raw_cred
+                    else:
+                        changed.append(id)
+                versions.update(stale_versions)
+                self.__store(unchanged, versions)
+
+        if missing:
+            versions.update(self.manager.get_versions(missing) or dict())
+
+        if missing or changed:
+            raw_creds = self.manager.get_many(missing + changed)
+            self.__store(raw_creds, versions)
+            for raw_cred in raw_creds:
+                found[raw_cred.id] = raw_cred
+
+        return found
+
+    def add_credential(self, title: str, username: str, email: str, password: str, salt: str) -> int:
+        return self.manager.add_credential(title, username, email, password, salt)
+
+    def get_all_credentials(self) -> Union[List[RawCredential], None]:
+        # Reading all credentials is not cached, it would only push out the credentials that are actually read again
+        return self.manager.get_all_credentials()
+
+    def iter_credentials(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[RawCredential]:
+        return self.manager.iter_credentials(batch_size)
+
+    def get_credential(self, id: int) -> Union[RawCredential, None]:
+        ensure_type(id, int, "id", "int")
+
+        return self.__read([id]).get(id, None)
+
+    def get_many(self, ids: List[int]) -> List[RawCredential]:
+        ensure_type(ids, list, "ids", "list")
+        for id in ids:
+            ensure_type(id, int, "id", "int")
+
+        raw_creds = self.__read(ids)
+        return [raw_creds[id] for id in ids if id in raw_creds]
+
+    def exists(self, id: int) -> bool:
+        # Reading the credential costs about as much as checking whether it exists and it is usually read right after
+        return self.get_credential(id) is not None
+
+    def count(self) -> int:
+        return self.manager.count()
+
+    def list_ids(self) -> List[int]:
+        return self.manager.list_ids()
+
+    def get_versions(self, ids: List[int]) -> Union[Dict[int, int], None]:
+        return self.manager.get_versions(ids)
+
+    def remove_credential(self, id: int) -> None:
+        try:
+            self.manager.remove_credential(id)
+        finally:
+            self.__invalidate([id])
+
+    def remove_all_credentials(self) -> None:
+        try:
+            self.manager.remove_all_credentials()
+        finally:
+            self.clear()
+
+    def modify_credential(self, id: int, title: str, username: str, email: str, password: str, salt: str) -> None:
+        try:
+            self.manager.modify_credential(id, title, username, email, password, salt)
+        finally:
+            self.__invalidate([id])
+
+    def add_many(self, raw_creds: List[RawCredential]) -> None:
+        self.manager.add_many(raw_creds)
+
+    def modify_many(self, raw_creds: List[RawCredential]) -> None:
+        try:
+            self.manager.modify_many(raw_creds)
+        finally:
+            self.__invalidate([raw_cred.id for raw_cred in raw_creds])
+
+    def remove_many(self, ids: List[int]) -> None:
+        try:
+            self.manager.remove_many(ids)
+        finally:
+            self.__invalidate(ids)
+
+    def get_meta(self, name: str) -> Union[str, None]:
+        return self.manager.get_meta(name)
+
+    def set_meta(self, name: str, value: str) -> None:
+        self.manager.set_meta(name, value)
+
+    def add_meta(self, name: str, value: str) -> str:
+        return self.manager.add_meta(name, value)
+
+    def begin(self) -> None:
+        self.manager.begin()
+
+    def commit(self) -> None:
+        self.manager.commit()
+
+    def rollback(self) -> None:
+        # Credentials read during the batch may have been changed by it
+        try:
+            self.manager.rollback()
+        finally:
+            self.clear()
+
+    def clear(self) -> None:
+        """Drops all cached credentials."""
+        with self.lock:
+            self.entries.clear()
+
+    def close(self):
+        self.clear()
+        self.manager.close()
+
+    def get_mode(self) -> str:
+        return self.manager.get_mode()
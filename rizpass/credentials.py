@@ -1,39 +1,164 @@
 from sys import stderr
-from base64 import b64decode, b64encode
-from typing import Tuple
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+from functools import partial
 from cryptography.fernet import InvalidToken
 import pyperclip
 
 from .validator import ensure_type
+from .passwords import VaultKey
 from .output import print_colored, print_red, print_green, format_colors, print_verbose
 
 
-def decode_decrypt_with_exception_handling(field_name: str, master_password: str,  encrypted_value: str, salt: str) -> Tuple[bool, str]:
-    from .passwords import decode_and_decrypt
-    try:
-        ret_val = decode_and_decrypt(
-            master_password,
-            encrypted_value,
-            b64decode(salt)
-        )
-    except InvalidToken:
+class DecryptionError(Exception):
+    """Raised when a credential that was asked for cannot be decrypted."""
+    def __init__(self, message: str = "Could not decrypt credential!"):
+        super().__init__(message)
+
+
+def report_decryption_error(field_name: str, encrypted_value: str, error: Exception) -> str:
+    """Prints the error that occurred while decrypting a field and returns the value to be shown in its place."""
+    if isinstance(error, InvalidToken):
         ret_val = format_colors(f"{{red}}DECRYPTION ERROR{{reset}}")
         print_red(f"Error while decrypting the {field_name}!", file=stderr)
         print_red(f"This is probably because the {field_name} is not encrypted with the master password.", file=stderr)
         print_colored(f"{{red}}Encrypted and encoded {field_name}:{{reset}} {encrypted_value}", file=stderr)
         print()
-        return False, ret_val
+        return ret_val
+
+    ret_val = f"Error while decrypting the {field_name}"
+    print_red(f"Error while decrypting the {field_name}:", file=stderr)
+    print_red(error, file=stderr)
+    print_colored(f"{{red}}Encrypted and encoded {field_name}:{{reset}} {encrypted_value}", file=stderr)
+    print()
+    return ret_val
+
+
+def decode_decrypt_with_exception_handling(field_name: str, master_password: Union[str, VaultKey],  encrypted_value: str, salt: str, cipher=None) -> Tuple[bool, str]:
+    from .passwords import decode_and_decrypt, decode_salt, get_cipher
+    try:
+        salt, kdf_params = decode_salt(salt)
+        if cipher is None and encrypted_value:
+            cipher = get_cipher(master_password, salt, kdf_params)
+
+        ret_val = decode_and_decrypt(
+            master_password,
+            encrypted_value,
+            salt,
+            cipher
+        )
     except Exception as e:
-        ret_val = f"Error while decrypting the {field_name}"
-        print_red(f"Error while decrypting the {field_name}:", file=stderr)
-        print_red(e, file=stderr)
-        print_colored(f"{{red}}Encrypted and encoded {field_name}:{{reset}} {encrypted_value}", file=stderr)
-        print()
-        return False, ret_val
+        return False, report_decryption_error(field_name, encrypted_value, e)
     print_verbose(format_colors(f"{{green}}Successfully decrypted {field_name}!{{reset}}"))
     return True, ret_val
 
 
+CREDENTIAL_FIELDS = ("title", "username", "email", "password")
+
+
+def decrypt_credential_fields(master_password: Union[str, VaultKey], fields: Tuple[str, ...], raw_cred: "RawCredential") -> Tuple[Dict[str, Union[str, None]], List[Tuple[str, Exception]]]:
+    """
+    Decrypts the given fields of a credential without printing anything so that it can be run by a worker.
+    Returns the decrypted values (None for the fields that failed) and the errors that occurred.
+    """
+    from .passwords import decode_and_decrypt, decode_salt
+
+    values: Dict[str, Union[str, None]] = dict()
+    errors: List[Tuple[str, Exception]] = []
+    cipher = raw_cred.get_cipher(master_password)
+
+    for field_name in fields:
+        try:
+            values[field_name] = decode_and_decrypt(master_password, getattr(raw_cred, field_name), decode_salt(raw_cred.salt)[0], cipher)
+        except Exception as e:
+            values[field_name] = None
+            errors.append((field_name, e))
+
+    return values, errors
+
+
+def decrypt_credentials(master_password: Union[str, VaultKey], raw_creds: List["RawCredential"], fields: Tuple[str, ...] = CREDENTIAL_FIELDS) -> List[Tuple["Credential", bool]]:
+    """
+    Decrypts the credentials using the worker pool and returns a (credential, decrypted successfully) pair for each one in the same order.
+    Errors are reported per credential in the same order and the same way as decode_decrypt_with_exception_handling reports them.
+    Fields that were not asked for are left empty.
+    """
+    from .parallel import parallel_map
+
+    ensure_type(master_password, Union[str, VaultKey], "master_password", "string | VaultKey")
+    ensure_type(raw_creds, list, "raw_creds", "list")
+
+    results = parallel_map(partial(decrypt_credential_fields, master_password, fields), raw_creds)
+
+    return [to_decrypted_credential(raw_cred, values, errors) for raw_cred, (values, errors) in zip(raw_creds, results)]
+
+
+def iter_decrypted_credentials(master_password: Union[str, VaultKey], raw_creds: Iterable["RawCredential"], fields: Tuple[str, ...] = CREDENTIAL_FIELDS) -> Iterator[Tuple["Credential", bool]]:
+    """
+    Decrypts the credentials like decrypt_credentials, but raw_creds is read by a background thread while the worker pool
+    decrypts the credentials read before. Every credential is yielded as soon as it and the ones before it are decrypted.
+    """
+    from .db_manager import DEFAULT_BATCH_SIZE
+    from .parallel import pipeline_map
+
+    ensure_type(master_password, Union[str, VaultKey], "master_password", "string | VaultKey")
+
+    for raw_cred, (values, errors) in pipeline_map(partial(decrypt_credential_fields, master_password, fields), raw_creds, DEFAULT_BATCH_SIZE):
+        yield to_decrypted_credential(raw_cred, values, errors)
+
+
+def to_decrypted_credential(raw_cred: "RawCredential", values: Dict[str, Union[str, None]], errors: List[Tuple[str, Exception]]) -> Tuple["Credential", bool]:
+    """Reports the errors returned by decrypt_credential_fields and returns the (credential, decrypted successfully) pair."""
+    print_verbose(f"Decrypting credential with id {raw_cred.id}...")
+
+    for field_name, error in errors:
+        values[field_name] = report_decryption_error(field_name, getattr(raw_cred, field_name), error)
+
+    if errors:
+        print_verbose("{red}Credential decryption failed!{reset}", file=stderr)
+    else:
+        print_verbose("{green}Credential decryption successful!{reset}")
+
+    return (
+        Credential(
+            raw_cred.id,
+            values.get("title", ""),
+            values.get("username", ""),
+            values.get("email", ""),
+            values.get("password", "")
+        ),
+        not errors
+    )
+
+
+def encrypt_credential(master_pass: Union[str, VaultKey], cred: "Credential") -> "RawCredential":
+    from .passwords import generate_salt
+    return cred.get_raw_credential(master_pass, generate_salt(16))
+
+
+def encrypt_credentials(master_pass: Union[str, VaultKey], creds: List["Credential"]) -> List["RawCredential"]:
+    """Encrypts each credential with a new salt using the worker pool and returns them in the same order."""
+    from .parallel import parallel_map
+
+    ensure_type(master_pass, Union[str, VaultKey], "master_pass", "string | VaultKey")
+    ensure_type(creds, list, "creds", "list")
+
+    return parallel_map(partial(encrypt_credential, master_pass), creds)
+
+
+def reencrypt_credentials(old_master_pass: Union[str, VaultKey], new_master_pass: Union[str, VaultKey], raw_creds: List["RawCredential"]) -> List["RawCredential"]:
+    """
+    Decrypts the credentials with the old master password and encrypts them with the new one using the worker pool.
+    Credentials that cannot be decrypted are reported and left out.
+    """
+    decrypted_creds = decrypt_credentials(old_master_pass, raw_creds)
+
+    for cred, decrypted in decrypted_creds:
+        if not decrypted:
+            print_colored(f"Credential {{red}}{cred.id}{{reset}} could not be decrypted and has been skipped!", file=stderr)
+
+    return encrypt_credentials(new_master_pass, [cred for cred, decrypted in decrypted_creds if decrypted])
+
+
 class RawCredential:
     """This takes in encrypted and base64 encoded credentials and returns a RawCredential object."""
     def __init__(self, id: int, title: str, username: str, email: str, password: str, salt: str):
@@ -62,13 +187,26 @@ class RawCredential:
         output += f"{{blue}}-------------------------------{{reset}}"
         return format_colors(output)
 
-    def get_credential(self, master_password: str):
+    def get_cipher(self, master_password: Union[str, VaultKey]):
+        """
+        Derives the key for this credential once so that it can be used for all of its fields.
+        Returns None if the key could not be derived, in which case each field reports the error on its own.
+        """
+        from .passwords import get_cipher, decode_salt
+        try:
+            return get_cipher(master_password, *decode_salt(self.salt))
+        except Exception:
+            return None
+
+    def get_credential(self, master_password: Union[str, VaultKey]):
         print_verbose(f"Decrypting credential with id {self.id}...")
 
-        title = decode_decrypt_with_exception_handling("title", master_password, self.title, self.salt)[1]
-        username = decode_decrypt_with_exception_handling("username", master_password, self.username, self.salt)[1]
-        email = decode_decrypt_with_exception_handling("email", master_password, self.email, self.salt)[1]
-        password = decode_decrypt_with_exception_handling("password", master_password, self.password, self.salt)[1]
+        cipher = self.get_cipher(master_password)
+
+        title = decode_decrypt_with_exception_handling("title", master_password, self.title, self.salt, cipher)[1]
+        username = decode_decrypt_with_exception_handling("username", master_password, self.username, self.salt, cipher)[1]
+        email = decode_decrypt_with_exception_handling("email", master_password, self.email, self.salt, cipher)[1]
+        password = decode_decrypt_with_exception_handling("password", master_password, self.password, self.salt, cipher)[1]
 
         if title != None and username != None and email != None and password != None:
             print_verbose("{green}Credential decryption successful!{reset}")
@@ -77,17 +215,17 @@ class RawCredential:
 
         return Credential(self.id, title, username, email, password)
 
-    def get_title(self, master_password: str):
-        return decode_decrypt_with_exception_handling("title", master_password, self.title, self.salt)[1]
+    def get_title(self, master_password: Union[str, VaultKey], cipher=None):
+        return decode_decrypt_with_exception_handling("title", master_password, self.title, self.salt, cipher)[1]
 
-    def get_username(self, master_password: str):
-        return decode_decrypt_with_exception_handling("username", master_password, self.username, self.salt)[1]
+    def get_username(self, master_password: Union[str, VaultKey], cipher=None):
+        return decode_decrypt_with_exception_handling("username", master_password, self.username, self.salt, cipher)[1]
 
-    def get_email(self, master_password: str):
-        return decode_decrypt_with_exception_handling("email", master_password, self.email, self.salt)[1]
+    def get_email(self, master_password: Union[str, VaultKey], cipher=None):
+        return decode_decrypt_with_exception_handling("email", master_password, self.email, self.salt, cipher)[1]
 
-    def get_password(self, master_password: str):
-        return decode_decrypt_with_exception_handling("password", master_password, self.password, self.salt)[1]
+    def get_password(self, master_password: Union[str, VaultKey], cipher=None):
+        return decode_decrypt_with_exception_handling("password", master_password, self.password, self.salt, cipher)[1]
 
     def get_obj(self):
         return {
@@ -99,20 +237,6 @@ class RawCredential:
             "salt": self.salt,
         }
 
-    def copy_pass(self, master_pass: str):
-        decrypted_password = decode_decrypt_with_exception_handling("password", master_pass, self.password, self.salt)
-
-        if not decrypted_password[0]:
-            return
-
-        try:
-            pyperclip.copy(decrypted_password[1])
-        except Exception as e:
-            print_red("This password could not be copied to your clipboard due to the following error:", file=stderr)
-            print_red(e, file=stderr)
-        else:
-            print_green(f"This password has been copied to your clipboard!")
-
 
 class Credential:
     def __init__(self,  id: int, title: str, username: str, email: str, password: str) -> None:
@@ -139,33 +263,55 @@ class Credential:
         string += f"{{blue}}-------------------------------{{reset}}"
         return format_colors(string)
 
-    def get_raw_credential(self, master_pass: str, salt: bytes) -> RawCredential:
-        ensure_type(master_pass, str, "master_pass", "string")
+    def get_obj(self):
+        return {
+            "id": self.id,
+            "title": self.title,
+            "username": self.username,
+            "email": self.email,
+            "password": self.password,
+        }
+
+    def matches(self, title_filter: str = "", username_filter: str = "", email_filter: str = "") -> bool:
+        """Returns True if the title, username and email contain the given filters, ignoring case."""
+        return (
+            title_filter.lower() in self.title.lower()
+            and username_filter.lower() in self.username.lower()
+            and email_filter.lower() in self.email.lower()
+        )
+
+    def get_raw_credential(self, master_pass: Union[str, VaultKey], salt: bytes) -> RawCredential:
+        ensure_type(master_pass, Union[str, VaultKey], "master_pass", "string | VaultKey")
         ensure_type(salt, bytes, "salt", "bytes")
-        from .passwords import encrypt_and_encode
+        from .passwords import encrypt_and_encode, encode_salt, get_cipher, get_kdf_params
+
+        # Credentials encrypted with a password carry the parameters of the KDF used in their salt
+        kdf_params = None if isinstance(master_pass, VaultKey) else get_kdf_params()
+        cipher = get_cipher(master_pass, salt, kdf_params)
 
         title = encrypt_and_encode(
             master_pass,
             self.title,
-            salt
+            salt,
+            cipher
         )
         username = encrypt_and_encode(
-
             master_pass,
             self.username,
-            salt
+            salt,
+            cipher
         )
         email = encrypt_and_encode(
             master_pass,
             self.email,
-            salt
-
-
+            salt,
+            cipher
         )
         password = encrypt_and_encode(
             master_pass,
             self.password,
-            salt
+            salt,
+            cipher
         )
         if title != None and username != None and email != None and password != None:
             print_verbose("{green}Encryption sucessful!{reset}")
@@ -176,7 +322,7 @@ class Credential:
             username,
             email,
             password,
-            b64encode(salt).decode()
+            encode_salt(salt, kdf_params)
         )
 
     def copy_pass(self, suppress_output: bool = False) -> None:
@@ -1,10 +1,29 @@
-from typing import List, Union
+from contextlib import contextmanager
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
 
 from .credentials import RawCredential
 from .validator import ensure_type
 
 from .credentials import RawCredential
 
+# Number of credentials read from the storage at a time when iterating over them
+DEFAULT_BATCH_SIZE = 500
+# Seconds by which the point in time returned with changes lies in the past, so that changes made by transactions that
+# were committed a little after they were made, or by clients whose clocks are a little behind, are not missed
+CHANGE_OVERLAP = 60.0
+
+
+def iter_chunks(items: Iterable, size: int) -> Iterator[List]:
+    """Yields the items in lists of up to size items."""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 class DbConfig:
     def __init__(self, host: str, user: str, password: str, db: str, port: Union[int, None] = None):
         ensure_type(host, str, "host", "string")
@@ -30,9 +49,49 @@ class DbManager:
     def get_all_credentials(self) -> Union[List[RawCredential], None]:
         pass
 
+    def iter_credentials(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[RawCredential]:
+        """
+        Yields the credentials while reading up to batch_size of them from the storage at a time,
+        so that they never have to be in memory all at once.
+        """
+        yield from self.get_all_credentials() or []
+
     def get_credential(self, id: int) -> Union[RawCredential, None]:
         pass
 
+    def get_many(self, ids: List[int]) -> List[RawCredential]:
+        """Returns the credentials with the given ids that exist in the order of ids."""
+        raw_creds = (self.get_credential(id) for id in ids)
+        return [raw_cred for raw_cred in raw_creds if raw_cred is not None]
+
+    def exists(self, id: int) -> bool:
+        """Returns True if a credential with the given id exists."""
+        return self.get_credential(id) is not None
+
+    def count(self) -> int:
+        """Returns the number of credentials."""
+        return sum(1 for _ in self.iter_credentials())
+
+    def list_ids(self) -> List[int]:
+        """Returns the ids of all credentials."""
+        return [raw_cred.id for raw_cred in self.iter_credentials()]
+
+    def get_versions(self, ids: List[int]) -> Union[Dict[int, int], None]:
+        """
+        Returns the versions of the credentials with the given ids that exist. The version of a credential changes
+        whenever it is modified, so it can be used to check whether a copy of it is still up to date.
+        Returns None if the storage does not keep versions.
+        """
+        return None
+
+    def get_changes(self, since: Union[float, None]) -> Union[Tuple[List[RawCredential], List[int], float], None]:
+        """
+        Returns the credentials that were added or modified and the ids of the credentials that were removed since the
+        given point in time, along with the point in time to pass the next time. Passing None returns all credentials.
+        The same change may be returned more than once. Returns None if the storage does not keep track of changes.
+        """
+        return None
+
     def remove_credential(self, id: int) -> None:
         pass
 
@@ -42,6 +101,69 @@ class DbManager:
     def modify_credential(self, id: int, title: str, username: str, email: str, password: str, salt: str) -> None:
         pass
 
+    def add_many(self, raw_creds: List[RawCredential]) -> None:
+        """Adds the encrypted credentials in a single batch. The ids of the given credentials are ignored."""
+        with self.batch():
+            for raw_cred in raw_creds:
+                self.add_credential(raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt)
+
+    def modify_many(self, raw_creds: List[RawCredential]) -> None:
+        """Replaces the credentials with the same ids as the given encrypted credentials in a single batch."""
+        with self.batch():
+            for raw_cred in raw_creds:
+                self.modify_credential(raw_cred.id, raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt)
+
+    def remove_many(self, ids: List[int]) -> None:
+        """Removes the credentials with the given ids in a single batch."""
+        with self.batch():
+            for id in ids:
+                self.remove_credential(id)
+
+    def get_meta(self, name: str) -> Union[str, None]:
+        """Returns the value of a vault metadata record (e.g. the wrapped vault key) or None if it does not exist."""
+        pass
+
+    def set_meta(self, name: str, value: str) -> None:
+        """Creates or replaces a vault metadata record."""
+        pass
+
+    def add_meta(self, name: str, value: str) -> str:
+        """
+        Creates a vault metadata record unless there is one already and returns the value that is stored afterwards,
+        which is not value if another client stored one first. This relies on batches keeping other clients from writing,
+        managers whose batches do not do that store the record in a single step instead.
+        """
+        with self.batch():
+            stored_value = self.get_meta(name)
+            if stored_value is not None:
+                return stored_value
+
+            self.set_meta(name, value)
+            return value
+
+    def begin(self) -> None:
+        """Starts a batch. Changes made until the matching commit may be written in one go."""
+        pass
+
+    def commit(self) -> None:
+        """Ends a batch and writes the changes made during it."""
+        pass
+
+    def rollback(self) -> None:
+        """Ends a batch and discards the changes made during it, if the storage supports it."""
+        pass
+
+    @contextmanager
+    def batch(self):
+        """Runs the body of a with statement as a batch that is rolled back if an exception is raised."""
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
     def close(self):
         pass
 
@@ -50,3 +172,34 @@ class DbManager:
 
     def __del__(self):
         pass
+
+
+def open_remote_manager(config: dict, password: str) -> DbManager:
+    """
+    Connects to the MySQL or MongoDB database described by the config. Reads are served from a local replica if the config
+    names one and credentials that are read again are served from memory otherwise.
+    """
+    ensure_type(config, dict, "config", "dict")
+    ensure_type(password, str, "password", "string")
+
+    db_config = DbConfig(config.get("db_host"), config.get("db_user"), password, config.get("db_name"), config.get("db_port"))
+
+    def connect() -> DbManager:
+        if config.get("db_type") == "mysql":
+            from .mysql_manager import MysqlManager, DEFAULT_POOL_SIZE
+            return MysqlManager(db_config, config.get("db_pool_size") or DEFAULT_POOL_SIZE)
+
+        from .mongo_manager import MongoManager
+        return MongoManager(db_config)
+
+    if config.get("db_replica"):
+        from .sqlite_manager import SqliteManager
+        from .replica_manager import ReplicaManager
+        source = f"{config.get('db_type')}://{db_config.user}@{db_config.host}:{db_config.port}/{db_config.db}"
+        return ReplicaManager(SqliteManager(config.get("db_replica")), connect, config.get("db_type"), source)
+
+    # Every read from a remote database is a round trip, so credentials that are read again are served from memory
+    from .caching_manager import CachingManager, DEFAULT_CACHE_SIZE
+    if config.get("db_cache_size") == 0:
+        return connect()
+    return CachingManager(connect(), config.get("db_cache_size") or DEFAULT_CACHE_SIZE)
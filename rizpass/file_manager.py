@@ -1,21 +1,66 @@
-from os import path
+from contextlib import contextmanager
+from os import O_CREAT, O_RDONLY, O_RDWR, O_TRUNC, O_WRONLY, chmod, close as close_fd, fdopen, fsync, open as open_fd, path, remove, replace, stat
+from stat import S_IMODE
+from io import SEEK_END
 from sys import stderr
-from json import load as load_json, dump as dump_json
-from typing import List, Union
+from json import load as load_json, loads as load_json_str, dumps as dump_json_str
+from typing import Dict, Iterator, List, Union
 
+from .binary_vault import BinaryVault, encode_record, is_binary_vault, write_binary_vault
+from .json_vault import META_PREFIX, META_SUFFIX, RECORD_SEPARATOR, JsonVault
 from .credentials import RawCredential
 from .validator import ensure_type
-from .output import format_colors, print_red, print_verbose
-from .db_manager import DbManager
+from .output import format_colors, print_red, print_verbose, print_yellow
+from .db_manager import DEFAULT_BATCH_SIZE, DbManager, iter_chunks
 
-# TODO: Convert credentials from an array to an object with id as key
+try:
+    import fcntl
+except ImportError:
+    # Files are not locked on platforms without fcntl
+    fcntl = None
+
+NEXT_ID_META = "next_id"
+
+JOURNAL_SUFFIX = ".journal"
+TEMP_SUFFIX = ".tmp"
+LOCK_SUFFIX = ".lock"
+# The journal is merged into the credential file once it grows past JOURNAL_MAX_SIZE or past JOURNAL_MAX_RATIO times
+# the size of the file. Small journals are never merged, since replaying them costs next to nothing.
+JOURNAL_MIN_SIZE = 64 * 1024
+JOURNAL_MAX_SIZE = 4 * 1024 * 1024
+JOURNAL_MAX_RATIO = 1.0
 
 
 class FileManager(DbManager):
-    credentials: List[RawCredential]
+    # Credentials are indexed by id. Ids are handed out in increasing order, so the insertion order of the dict
+    # is also the order of the ids and the credentials never need to be sorted after loading.
+    # Credentials that have not been read from the file yet are None.
+    __credentials: Dict[int, Union[RawCredential, None]]
+    meta: Dict[str, str]
+    next_id: int
+    vault_reader: Union[BinaryVault, JsonVault, None] = None
+    lock_fd: Union[int, None] = None
+    lock_depth: int = 0
+
+    def __init__(self, file_path: str, journal: bool = False, binary: bool = False, lazy: bool = False):
+        """
+        If journal is True, changes are appended to a journal next to the credential file instead of rewriting the whole file.
+        If binary is True, a new credential file is created in the binary format. Existing files keep their format.
+        If lazy is True, credentials of a JSON file are only parsed when they are needed. Binary files are always read lazily.
+        """
+        ensure_type(journal, bool, "journal", "boolean")
+        ensure_type(binary, bool, "binary", "boolean")
+        ensure_type(lazy, bool, "lazy", "boolean")
 
-    def __init__(self, file_path: str):
         self.file_path = file_path
+        self.journal_path = file_path + JOURNAL_SUFFIX
+        self.lock_path = file_path + LOCK_SUFFIX
+        self.lock_exclusive = False
+        self.journal = journal
+        self.binary = binary
+        self.lazy = lazy
+        self.batch_depth = 0
+        self.batch_records: List[dict] = []
         self.load_creds()
 
     def __del__(self):
@@ -54,49 +99,476 @@ class FileManager(DbManager):
         """
         Opens the file and loads the credentials from it.
         """
+        # Creating the file and merging a journal left behind by journal mode are writes, everything else only needs a shared lock
+        new_file = not path.isfile(self.file_path) or path.getsize(self.file_path) == 0
+        with self.locked(new_file or (not self.journal and path.isfile(self.journal_path))):
+            self.__load_creds()
+
+    def __load_creds(self):
+        self.close_vault_reader()
+        self.__credentials = dict()
+
+        if path.isfile(self.file_path) and is_binary_vault(self.file_path):
+            self.binary = True
+            self.__load_binary_creds()
+            new_file = False
+        else:
+            new_file = not path.isfile(self.file_path) or path.getsize(self.file_path) == 0
+            self.binary = self.binary and new_file
+            if self.lazy and not new_file and self.__open_json_vault():
+                self.__load_lazy_json_creds()
+            else:
+                self.__load_json_creds()
+
+        self.file_size = path.getsize(self.file_path)
+        self.journal_size = 0
+        self.replay_journal()
+        self.file_stamp = self.__get_file_stamp()
+        print_verbose(format_colors("{green}Credentials loaded successfully{reset}"))
+
+        # A journal left behind by journal mode is merged into the file when journal mode is not in use
+        if not self.lock_exclusive:
+            return
+        if self.journal_size and (not self.journal or self.__journal_too_large()):
+            self.compact_journal()
+        elif self.binary and new_file:
+            self.dump_creds()
+
+    def __get_file_stamp(self):
+        """
+        Returns a value that changes whenever the file or the journal is written to, by this or any other process.
+        The file is always replaced rather than rewritten and the journal is only ever appended to or removed.
+        """
+        try:
+            file_stat = stat(self.file_path)
+        except FileNotFoundError:
+            return None
+
+        journal_size = path.getsize(self.journal_path) if path.isfile(self.journal_path) else -1
+        return (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size, journal_size)
+
+    def refresh(self) -> None:
+        """
+        Reloads the credentials if another process has changed the file since they were loaded.
+        """
+        # Changes of a batch that have not been written yet would be lost, and no other process can write during a batch anyway
+        if self.batch_depth or self.__get_file_stamp() == self.file_stamp:
+            return
+
+        print_verbose("The file has been changed by another process, reloading credentials")
+        self.load_creds()
+
+    def __lock(self, exclusive: bool) -> None:
+        """
+        Locks the file against other processes. Readers share the lock, writers get it to themselves.
+        Locks can be nested, in which case the outermost lock decides whether it is shared.
+        """
+        self.lock_depth += 1
+        if self.lock_depth > 1:
+            return
+
+        self.lock_exclusive = exclusive
+        if fcntl is None:
+            self.lock_exclusive = True
+            return
+
+        try:
+            self.lock_fd = open_fd(self.lock_path, O_RDWR | O_CREAT, 0o600)
+        except OSError as e:
+            # The file can still be read from a directory that cannot be written to
+            print_verbose(f"Cannot lock the file: {e}")
+            return
+
+        fcntl.flock(self.lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def __unlock(self) -> None:
+        if not self.lock_depth:
+            return
+
+        self.lock_depth -= 1
+        if self.lock_depth or self.lock_fd is None:
+            return
+
+        # Closing the lock file releases the lock
+        close_fd(self.lock_fd)
+        self.lock_fd = None
+
+    @contextmanager
+    def locked(self, exclusive: bool = False):
+        """
+        Locks the file for the duration of a with statement.
+        """
+        self.__lock(exclusive)
+        try:
+            yield
+        finally:
+            self.__unlock()
+
+    @contextmanager
+    def __writing(self):
+        """
+        Locks the file for writing and makes sure that the credentials in memory are up to date before they are changed.
+        """
+        with self.locked(True):
+            self.refresh()
+            yield
+
+    def __load_binary_creds(self):
+        """
+        Opens the binary file and reads its index. Credentials are only read from the file when they are needed.
+        """
+        print_verbose("Loading credentials from binary file")
+        try:
+            self.vault_reader = BinaryVault(self.file_path)
+        except Exception as e:
+            print_red(f"There was an error while reading the file \"{self.file_path}\":", file=stderr)
+            print_red(e, file=stderr)
+            exit(1)
+
+        self.meta = dict(self.vault_reader.meta)
+        self.__credentials = dict.fromkeys(self.vault_reader.get_ids())
+        self.next_id = max(self.vault_reader.next_id, self.__get_max_id() + 1)
+
+    def __open_json_vault(self) -> bool:
+        """
+        Indexes the JSON file. Returns False if the file cannot be indexed and has to be parsed as a whole.
+        """
+        try:
+            self.vault_reader = JsonVault(self.file_path)
+        except ValueError as e:
+            print_verbose(f"Cannot read the credentials lazily: {e}")
+            return False
+        return True
+
+    def __load_lazy_json_creds(self):
+        """
+        Loads the ids and the metadata of the JSON file. Credentials are only parsed when they are needed.
+        """
+        print_verbose("Indexing credentials in file")
+        self.meta = dict(self.vault_reader.meta)
+        self.__credentials = dict.fromkeys(sorted(self.vault_reader.get_ids()))
+        self.next_id = max(int(self.meta.pop(NEXT_ID_META, 1)), self.__get_max_id() + 1)
+
+    def __load_json_creds(self):
+        self.__credentials = dict()
         self.open_file()
         print_verbose("Loading credentials from file")
-        self.credentials: List[RawCredential] = []
         self.file.seek(0, 0)
-        import_creds = load_json(self.file)
+        file_content = load_json(self.file)
+
+        # Files without any metadata are stored as a plain array of credentials
+        if isinstance(file_content, dict):
+            self.meta = file_content.get("meta", dict())
+            import_creds = file_content.get("credentials", [])
+        else:
+            self.meta = dict()
+            import_creds = file_content
+
+        is_sorted = True
+        last_id = 0
         for import_cred in import_creds:
-            self.credentials.append(RawCredential(
+            is_sorted = is_sorted and import_cred["id"] > last_id
+            last_id = import_cred["id"]
+            self.__credentials[import_cred["id"]] = RawCredential(
                 import_cred["id"],
                 import_cred["title"],
                 import_cred["username"],
                 import_cred["email"],
                 import_cred["password"],
                 import_cred["salt"]
-            ))
-        self.credentials.sort(key=lambda x: x.id)
+            )
+
+        # Files written by rizpass are always sorted, only files edited by hand need to be sorted here
+        if not is_sorted:
+            self.__credentials = {id: self.__credentials[id] for id in sorted(self.__credentials)}
+
+        # Ids of removed credentials are never handed out again
+        self.next_id = max(int(self.meta.pop(NEXT_ID_META, 1)), self.__get_max_id() + 1)
+
         self.close_file()
-        print_verbose(format_colors("{green}Credentials loaded successfully{reset}"))
+
+    def replay_journal(self):
+        """
+        Applies the changes recorded in the journal to the credentials in memory.
+        """
+        if not path.isfile(self.journal_path):
+            return
+
+        print_verbose("Replaying journal")
+        with open(self.journal_path, "rb") as journal_file:
+            for line in journal_file:
+                try:
+                    self.__apply_journal_record(load_json_str(line))
+                except Exception:
+                    # Only the last record can be incomplete, if rizpass was stopped while writing it
+                    print_yellow(f"Ignoring incomplete record at the end of the journal: '{self.journal_path}'", file=stderr)
+                    break
+                self.journal_size += len(line)
+
+        # Records appended later would otherwise be glued onto the incomplete one and lost with it
+        if self.lock_exclusive and path.getsize(self.journal_path) > self.journal_size:
+            with open(self.journal_path, "r+b") as journal_file:
+                journal_file.truncate(self.journal_size)
+
+    def __apply_journal_record(self, record: dict):
+        operation = record["op"]
+
+        if operation == "add" or operation == "modify":
+            cred = record["cred"]
+            self.__credentials[cred["id"]] = RawCredential(
+                cred["id"],
+                cred["title"],
+                cred["username"],
+                cred["email"],
+                cred["password"],
+                cred["salt"]
+            )
+            self.next_id = max(self.next_id, cred["id"] + 1)
+        elif operation == "remove":
+            self.__credentials.pop(record["id"], None)
+        elif operation == "remove_all":
+            self.__credentials = dict()
+        elif operation == "batch":
+            for batch_record in record["records"]:
+                self.__apply_journal_record(batch_record)
+        elif operation == "meta":
+            self.meta[record["name"]] = record["value"]
+        else:
+            raise ValueError(f"Unknown journal operation: {operation}")
+
+    def __write_journal_record(self, record: dict):
+        """
+        Appends a change to the journal, or writes all credentials to the file if journal mode is not in use.
+        Changes made during a batch are held back until the batch is committed.
+        """
+        if self.batch_depth:
+            self.batch_records.append(record)
+            return
+
+        if not self.journal:
+            self.dump_creds()
+            return
+
+        line = (dump_json_str(record) + "\n").encode("utf-8")
+        with open(self.journal_path, "a+b") as journal_file:
+            self.__drop_incomplete_record(journal_file)
+            journal_file.write(line)
+            journal_file.flush()
+            fsync(journal_file.fileno())
+        self.journal_size += len(line)
+        self.file_stamp = self.__get_file_stamp()
+
+        if self.__journal_too_large():
+            self.compact_journal()
+
+    def __drop_incomplete_record(self, journal_file):
+        """
+        Cuts off a record left incomplete at the end of the journal by a writer that was stopped, so that the next record
+        starts on a line of its own. Only the last record can be incomplete, it starts after the last line break.
+        """
+        end = journal_file.seek(0, SEEK_END)
+        if end == 0:
+            return
+        journal_file.seek(end - 1)
+        if journal_file.read(1) == b"\n":
+            return
+
+        print_verbose("Dropping an incomplete record at the end of the journal")
+        position = end
+        while position > 0:
+            start = max(0, position - 4096)
+            journal_file.seek(start)
+            index = journal_file.read(position - start).rfind(b"\n")
+            if index != -1:
+                journal_file.truncate(start + index + 1)
+                return
+            position = start
+        journal_file.truncate(0)
+
+    def __journal_too_large(self) -> bool:
+        if self.journal_size <= JOURNAL_MIN_SIZE:
+            return False
+        return self.journal_size > JOURNAL_MAX_SIZE or self.journal_size > self.file_size * JOURNAL_MAX_RATIO
+
+    def compact_journal(self):
+        """
+        Writes all credentials to the file and removes the journal.
+        """
+        print_verbose("Compacting journal")
+        self.dump_creds()
 
     def dump_creds(self):
         """
         Dumps the credentials in the memory to the file.
         """
-        self.open_file()
         print_verbose("Dumping credentials to file")
-        self.file.truncate(0)
-        export_creds = []
+        self.write_file(self.file_path, self.binary)
+
+        # Everything in the journal is in the file now. Replaying the journal again is harmless if rizpass stops before it is removed.
+        self.file_size = path.getsize(self.file_path)
+        if path.isfile(self.journal_path):
+            remove(self.journal_path)
+        self.journal_size = 0
+        self.file_stamp = self.__get_file_stamp()
+        print_verbose(format_colors("{green}Credentials dumped successfully{reset}"))
 
-        for cred in self.credentials:
-            export_creds.append(cred.get_obj())
+    def write_file(self, file_path: str, binary: bool) -> None:
+        """
+        Writes the credentials in memory to the file at file_path in the binary or the JSON format.
+        The credentials are written to a temporary file first, which then replaces the file, so the file is never left half written.
+        """
+        ensure_type(file_path, str, "file_path", "string")
+        ensure_type(binary, bool, "binary", "boolean")
 
-        dump_json(export_creds, self.file)
-        self.close_file()
-        print_verbose(format_colors("{green}Credentials dumped successfully{reset}"))
+        temp_path = file_path + TEMP_SUFFIX
+        try:
+            file_mode = S_IMODE(stat(file_path).st_mode) if path.isfile(file_path) else 0o600
+            with fdopen(open_fd(temp_path, O_WRONLY | O_CREAT | O_TRUNC, file_mode), "wb") as temp_file:
+                # The mode given to open is ignored if the temporary file was left behind by an earlier run
+                chmod(temp_path, file_mode)
+                if binary:
+                    write_binary_vault(temp_file, self.__get_records(True), self.meta, self.next_id)
+                else:
+                    self.__write_json_file(temp_file)
+                temp_file.flush()
+                fsync(temp_file.fileno())
+
+            # The old file has to be closed before it can be replaced on some platforms
+            replacing_file = self.vault_reader is not None and path.abspath(file_path) == path.abspath(self.file_path)
+            replacing_file and self.close_vault_reader()
+            replace(temp_path, file_path)
+            self.__sync_directory(file_path)
+        except PermissionError:
+            print_red(f"Permission denied to create/modify file: \'{file_path}\'", file=stderr)
+            exit(1)
+
+        # Credentials that have not been read yet have to be read from the new file from now on
+        if replacing_file and binary:
+            self.vault_reader = BinaryVault(self.file_path)
+        elif replacing_file and not self.__open_json_vault():
+            self.__load_json_creds()
+
+    def __write_json_file(self, file):
+        """
+        Writes the credentials in the same layout as json.dump, so that the file can be indexed by JsonVault.
+        """
+        meta = dict(self.meta)
+        # The next id only needs to be stored if it cannot be worked out from the credentials
+        if self.next_id != self.__get_max_id() + 1:
+            meta[NEXT_ID_META] = str(self.next_id)
+
+        file.write((META_PREFIX + dump_json_str(meta) + META_SUFFIX if meta else "[").encode("utf-8"))
+        for index, (_, record) in enumerate(self.__get_records(False)):
+            index and file.write(RECORD_SEPARATOR)
+            file.write(record)
+        file.write(b"]}" if meta else b"]")
+
+    def __get_records(self, binary: bool):
+        """
+        Yields the id and the encoded bytes of every credential in the binary or the JSON format.
+        """
+        for id, cred in self.__credentials.items():
+            # Credentials that have not been read from a file of the same format are copied over as they are
+            if cred is None and isinstance(self.vault_reader, BinaryVault) == binary:
+                yield id, self.vault_reader.get_record(id)
+                continue
+
+            cred = cred or self.vault_reader.get_credential(id)
+            yield id, encode_record(cred) if binary else dump_json_str(cred.get_obj()).encode("utf-8")
+
+    def __get_credential(self, id: int) -> Union[RawCredential, None]:
+        """
+        Returns the credential with the given id, reading it from the file if it has not been read yet.
+        """
+        cred = self.__credentials.get(id, None)
+        if cred is None and id in self.__credentials:
+            cred = self.__credentials[id] = self.vault_reader.get_credential(id)
+        return cred
+
+    def __peek_credential(self, id: int) -> RawCredential:
+        """
+        Returns the credential with the given id without caching it if it has to be read from the file.
+        """
+        cred = self.__credentials[id]
+        return self.vault_reader.get_credential(id) if cred is None else cred
+
+    def close_vault_reader(self):
+        if self.vault_reader is not None:
+            self.vault_reader.close()
+            self.vault_reader = None
+
+    def __sync_directory(self, file_path: str):
+        """
+        Makes sure that the renaming of the temporary file survives a crash. Not all platforms support this.
+        """
+        try:
+            directory_fd = open_fd(path.dirname(path.abspath(file_path)), O_RDONLY)
+        except OSError:
+            return
+
+        try:
+            fsync(directory_fd)
+        except OSError:
+            pass
+        finally:
+            close_fd(directory_fd)
+
+    def begin(self) -> None:
+        """
+        Starts a batch. Changes are kept in memory until the matching commit, which writes them to the file in one go.
+        Batches can be nested, in which case the changes are written when the outermost batch is committed.
+        The file is locked for writing until the batch ends.
+        """
+        self.__lock(True)
+        self.refresh()
+        self.batch_depth += 1
+
+    def commit(self) -> None:
+        """
+        Ends a batch and writes the changes made during it to the file.
+        """
+        if not self.batch_depth:
+            return
+
+        self.batch_depth -= 1
+        try:
+            if self.batch_depth or not self.batch_records:
+                return
+
+            batch_records, self.batch_records = self.batch_records, []
+            # A single journal record is either replayed completely or not at all
+            self.__write_journal_record({"op": "batch", "records": batch_records})
+        finally:
+            self.__unlock()
+
+    def rollback(self) -> None:
+        """
+        Ends all batches and reloads the credentials from the file, discarding the changes made during them.
+        """
+        while self.batch_depth:
+            self.batch_depth -= 1
+            self.__unlock()
+        self.batch_records = []
+        self.load_creds()
 
     def __gen_id(self) -> int:
         """
         Generates a unique id for a new credential.
         """
-        id = len(self.credentials) + 1
-        while self.get_credential(id):
-            id += 1
+        id = self.next_id
+        self.next_id += 1
         return id
 
+    def __get_max_id(self) -> int:
+        return next(reversed(self.__credentials), 0)
+
+    @property
+    def credentials(self) -> List[RawCredential]:
+        """
+        The credentials sorted by id.
+        """
+        return [self.__get_credential(id) for id in self.__credentials]
+
     def close_file(self):
         """
         Closes the credential file if opened
@@ -107,6 +579,9 @@ class FileManager(DbManager):
 
     def close(self):
         self.close_file()
+        self.close_vault_reader()
+        while self.lock_depth:
+            self.__unlock()
 
     def add_credential(self, title: str, username: str, email: str, password: str, salt: str) -> int:
         """This method takes in the encrypted and encoded credentials and adds them to the file."""
@@ -116,18 +591,19 @@ class FileManager(DbManager):
         ensure_type(password, str, "password", "string")
         ensure_type(salt, str, "salt", "string")
 
-        id = self.__gen_id()
+        with self.__writing():
+            id = self.__gen_id()
 
-        self.credentials.append(RawCredential(
-            id,
-            title,
-            username,
-            email,
-            password,
-            salt
-        ))
+            self.__credentials[id] = RawCredential(
+                id,
+                title,
+                username,
+                email,
+                password,
+                salt
+            )
 
-        self.dump_creds()
+            self.__write_journal_record({"op": "add", "cred": self.__credentials[id].get_obj()})
 
         return id
 
@@ -135,40 +611,70 @@ class FileManager(DbManager):
         """
         Returns the credentials stored in memory.
         """
+        self.refresh()
         return self.credentials
 
+    def iter_credentials(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[RawCredential]:
+        """
+        Yields the credentials sorted by id, reading batch_size of them from the file at a time.
+        Credentials that have not been read yet are not kept in memory after they have been yielded.
+        """
+        ensure_type(batch_size, int, "batch_size", "int")
+
+        self.refresh()
+        for ids in iter_chunks(list(self.__credentials), batch_size):
+            # The file might have been reloaded since the ids were taken
+            raw_creds = [self.__peek_credential(id) for id in ids if id in self.__credentials]
+            yield from raw_creds
+
     def get_credential(self, id: int) -> Union[RawCredential, None]:
         """
         Returns a credential with the given id if it exists. Otherwise, returns None.
         """
-        query_result = None
-        for i in self.credentials:
-            if i.id == id:
-                query_result = i
-                break
+        self.refresh()
+        return self.__get_credential(id)
+
+    def get_many(self, ids: List[int]) -> List[RawCredential]:
+        ensure_type(ids, list, "ids", "list")
+
+        self.refresh()
+        return [self.__get_credential(id) for id in ids if id in self.__credentials]
+
+    def exists(self, id: int) -> bool:
+        """Returns True if a credential with the given id exists without reading it from the file."""
+        self.refresh()
+        return id in self.__credentials
 
-        return query_result
+    def count(self) -> int:
+        self.refresh()
+        return len(self.__credentials)
+
+    def list_ids(self) -> List[int]:
+        """Returns the ids of all credentials sorted by id."""
+        self.refresh()
+        return list(self.__credentials)
 
     def remove_credential(self, id: int) -> None:
         """
         Removes a credential with the given id if it exists.
         """
 
-        for index, cred in enumerate(self.credentials):
-            if cred.id == id:
-                self.credentials.pop(index)
-                break
-        else:
-            print_red(f"Credential with id {id} not found", file=stderr)
+        with self.__writing():
+            if id not in self.__credentials:
+                print_red(f"Credential with id {id} not found", file=stderr)
+                return
 
-        self.dump_creds()
+            del self.__credentials[id]
+
+            self.__write_journal_record({"op": "remove", "id": id})
 
     def remove_all_credentials(self) -> None:
         """
         Removes all credentials that may be present in the file.
         """
-        self.credentials = []
-        self.dump_creds()
+        with self.__writing():
+            self.__credentials = dict()
+            self.__write_journal_record({"op": "remove_all"})
 
     def modify_credential(self, id: int, title: str, username: str, email: str, password: str, salt: str) -> None:
         """
@@ -180,22 +686,65 @@ class FileManager(DbManager):
         ensure_type(password, str, "password", "string")
         ensure_type(salt, str, "salt", "string")
 
-        for index, cred in enumerate(self.credentials):
-            if cred.id == id:
-                self.credentials[index] = RawCredential(
-                    id,
-                    title,
-                    username,
-                    email,
-                    password,
-                    salt
-                )
-                break
+        with self.__writing():
+            if id not in self.__credentials:
+                return
 
-        self.dump_creds()
+            self.__credentials[id] = RawCredential(
+                id,
+                title,
+                username,
+                email,
+                password,
+                salt
+            )
+
+            self.__write_journal_record({"op": "modify", "cred": self.__credentials[id].get_obj()})
+
+    def get_meta(self, name: str) -> Union[str, None]:
+        """
+        Returns the value of the metadata record with the given name if it exists. Otherwise, returns None.
+        """
+        ensure_type(name, str, "name", "string")
+        self.refresh()
+        return self.meta.get(name, None)
+
+    def set_meta(self, name: str, value: str) -> None:
+        """
+        Creates or replaces the metadata record with the given name.
+        """
+        ensure_type(name, str, "name", "string")
+        ensure_type(value, str, "value", "string")
+
+        with self.__writing():
+            self.meta[name] = value
+            self.__write_journal_record({"op": "meta", "name": name, "value": value})
 
     def get_mode(self) -> str:
         """
         Returns the mode of credential storage.
         """
         return "file"
+
+
+def convert_file(file_path: str, binary: bool, output_path: Union[str, None] = None) -> None:
+    """
+    Converts the credential file at file_path to the binary or the JSON format.
+    The converted file is written to output_path, or replaces the file if output_path is None.
+    """
+    ensure_type(file_path, str, "file_path", "string")
+    ensure_type(binary, bool, "binary", "boolean")
+    ensure_type(output_path, Union[str, None], "output_path", "string | None")
+
+    manager = FileManager(file_path)
+    try:
+        # Other processes must not change the file while it is converted, or their changes would be lost
+        with manager.locked(True):
+            manager.refresh()
+            if output_path is None or path.abspath(output_path) == path.abspath(file_path):
+                manager.binary = binary
+                manager.dump_creds()
+            else:
+                manager.write_file(output_path, binary)
+    finally:
+        manager.close()
@@ -0,0 +1,95 @@
+import re
+from json import JSONDecoder, loads as load_json_str
+from mmap import ACCESS_READ, mmap
+from typing import Dict, List, Tuple
+
+from .credentials import RawCredential
+from .validator import ensure_type
+
+# Credentials written by rizpass always start with their id. A quote inside a JSON string is always escaped,
+# so these patterns can only ever match keys and never the contents of a string.
+RECORD_START = re.compile(rb'\{"id": (\d+), ')
+ID_KEY = re.compile(rb'"id"')
+META_PREFIX = '{"meta": '
+META_SUFFIX = ', "credentials": ['
+RECORD_SEPARATOR = b", "
+
+
+class JsonVault:
+    """
+    Indexes the credentials of a JSON credential file through mmap without parsing them.
+    Credentials are only parsed when they are asked for.
+    Raises ValueError if the file is not laid out the way rizpass writes it, in which case it has to be parsed as a whole.
+    """
+    meta: Dict[str, str]
+
+    def __init__(self, file_path: str):
+        ensure_type(file_path, str, "file_path", "string")
+
+        self.file = open(file_path, "rb")
+        try:
+            self.mmap = mmap(self.file.fileno(), 0, access=ACCESS_READ)
+            self.offsets: Dict[int, Tuple[int, int]] = dict()
+            self.__index()
+        except ValueError:
+            self.close()
+            raise
+
+    def __index(self):
+        starts = [(int(match.group(1)), match.start()) for match in RECORD_START.finditer(self.mmap)]
+        if not starts:
+            raise ValueError("The file does not contain any credentials")
+
+        # Every credential has an id, so every id key must belong to a credential that starts with it
+        if sum(1 for _ in ID_KEY.finditer(self.mmap)) != len(starts):
+            raise ValueError("The credentials of the file do not start with their id")
+
+        prefix = self.mmap[:starts[0][1]].decode("utf-8")
+        if prefix == "[":
+            self.meta = dict()
+        elif prefix.startswith(META_PREFIX) and prefix.endswith(META_SUFFIX):
+            self.meta, meta_end = JSONDecoder().raw_decode(prefix, len(META_PREFIX))
+            if prefix[meta_end:] != META_SUFFIX:
+                raise ValueError("Unexpected content after the metadata of the file")
+        else:
+            raise ValueError("Unexpected content before the credentials of the file")
+
+        # The last credential ends right before the closing bracket of the array
+        file_end = self.mmap.rfind(b"]")
+        ends = [start - len(RECORD_SEPARATOR) for _, start in starts[1:]] + [file_end]
+
+        for (id, start), end in zip(starts, ends):
+            if self.mmap[end - 1:end] != b"}" or (end != file_end and self.mmap[end:end + len(RECORD_SEPARATOR)] != RECORD_SEPARATOR):
+                raise ValueError(f"Unexpected content after the credential with id {id}")
+            self.offsets[id] = (start, end - start)
+
+        if len(self.offsets) != len(starts):
+            raise ValueError("The file contains duplicate ids")
+
+    def get_ids(self) -> List[int]:
+        """
+        Returns the ids of the credentials in the order they are stored in the file.
+        """
+        return list(self.offsets)
+
+    def get_record(self, id: int) -> bytes:
+        """
+        Returns the JSON of the credential with the given id as it is stored in the file.
+        """
+        offset, length = self.offsets[id]
+        return self.mmap[offset:offset + length]
+
+    def get_credential(self, id: int) -> RawCredential:
+        """
+        Returns the credential with the given id. Only the JSON of that credential is parsed.
+        """
+        cred = load_json_str(self.get_record(id))
+        return RawCredential(cred["id"], cred["title"], cred["username"], cred["email"], cred["password"], cred["salt"])
+
+    def close(self):
+        if hasattr(self, "mmap"):
+            self.mmap.close()
+            del self.mmap
+        if hasattr(self, "file"):
+            self.file.close()
+            del self.file
@@ -0,0 +1,358 @@
+import os
+import json
+from sys import stderr, stdin
+from typing import Callable, Dict, Iterator, List, TextIO, Union
+
+import pyperclip
+
+from .credentials import Credential, DecryptionError, encrypt_credentials, reencrypt_credentials
+from .db_manager import DbManager
+from .output import print_red
+from .validator import ensure_type
+from . import user_functions
+
+# Exit codes of batch mode. Scripts rely on them, so they must not change
+EXIT_OK = 0
+# The action failed, e.g. the database could not be reached or a credential could not be decrypted
+EXIT_FAILURE = 1
+# A credential that was asked for does not exist or a filter matched nothing
+EXIT_NOT_FOUND = 2
+# The master password is wrong or could not be read
+EXIT_AUTH = 3
+# The action cannot be run with the given parameters
+EXIT_USAGE = 129
+# Rizpass was stopped with Ctrl+C
+EXIT_INTERRUPTED = 130
+
+OUTPUT_FORMATS = ["json", "jsonl"]
+
+
+def is_secret_source(source: str) -> bool:
+    """Returns True if the source names an environment variable (env:NAME) or an open file descriptor (fd:N)."""
+    ensure_type(source, str, "source", "string")
+
+    return (source.startswith("env:") and len(source) > 4) or (source.startswith("fd:") and source[3:].isdigit())
+
+
+def read_secret(source: str) -> Union[str, None]:
+    """Reads a password from an environment variable or the first line of a file descriptor, see is_secret_source."""
+    ensure_type(source, str, "source", "string")
+
+    if source.startswith("env:"):
+        return os.environ.get(source[4:])
+
+    fd = int(source[3:])
+    if fd == 0:
+        # Read through stdin's own buffer, so that the lines after the password can still be read from it
+        line = stdin.readline()
+    else:
+        with open(fd, "r", closefd=False) as file:
+            line = file.readline()
+
+    return line.rstrip("\r\n") if line else None
+
+
+class RecordWriter:
+    """
+    Writes the results of batch actions as JSON objects. jsonl writes every object on its own line as soon as it is
+    produced, json writes the objects of each action as one array once the action is done.
+    """
+
+    def __init__(self, output_format: str, file: TextIO):
+        ensure_type(output_format, str, "output_format", "string")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+
+        self.output_format = output_format
+        self.file = file
+        self.records: List[dict] = []
+
+    def write(self, record: dict) -> None:
+        if self.output_format == "json":
+            self.records.append(record)
+            return
+
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.output_format == "json":
+            self.file.write(json.dumps(self.records) + "\n")
+            self.file.flush()
+            self.records = []
+
+
+def usage_error(message: str) -> int:
+    print_red(message, file=stderr)
+    return EXIT_USAGE
+
+
+def iter_ids(params: dict) -> Iterator[Union[int, str]]:
+    """Yields the ids given with --id, reading one id per line from stdin in place of '-'. Invalid lines are yielded as is."""
+    for id in params.get("ids", []):
+        if id != "-":
+            yield id
+            continue
+
+        for line in stdin:
+            line = line.strip()
+            if line:
+                yield int(line) if line.isdigit() else line
+
+
+def get_single_id(params: dict) -> Union[int, None]:
+    ids = params.get("ids", [])
+    return ids[0] if len(ids) == 1 and ids[0] != "-" else None
+
+
+def read_password_param(params: dict, name: str) -> Union[str, None]:
+    return read_secret(params[name]) if params.get(name) else None
+
+
+def generate_strong_password(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    from .passwords import generate_password as generate_random_password, follows_password_requirements
+
+    length = params.get("length") or 32
+    if length < 16:
+        return usage_error("Strong passwords must be at least 16 characters long!")
+
+    for _ in range(10):
+        generated_pass = generate_random_password(length, True, True, True, True, True)
+        if follows_password_requirements(generated_pass)[0]:
+            writer.write({"password": generated_pass})
+            return EXIT_OK
+
+    print_red("Could not generate a password! Failed 10 tries!", file=stderr)
+    return EXIT_FAILURE
+
+
+def generate_password(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    from .passwords import generate_password as generate_random_password
+
+    generated_pass = generate_random_password(
+        params.get("length") or 32,
+        params.get("uppercase", True),
+        params.get("lowercase", True),
+        params.get("digits", True),
+        params.get("specials", True),
+        True
+    )
+    if not generated_pass:
+        return usage_error("All characters have been excluded from the password!")
+
+    writer.write({"password": generated_pass})
+    return EXIT_OK
+
+
+def add_credential(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    password = read_password_param(params, "password")
+    if not params.get("title") or not password:
+        return usage_error("Adding a credential needs --title and --password!")
+
+    cred = Credential(0, params.get("title"), params.get("username") or "", params.get("email") or "", password)
+    raw_cred = encrypt_credentials(user_functions.vault_key, [cred])[0]
+    id = creds_manager.add_credential(raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt)
+
+    writer.write({"id": id})
+    return EXIT_OK
+
+
+def get_credentials(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    if not params.get("ids"):
+        return usage_error("Retrieving credentials needs --id!")
+
+    exit_code = EXIT_OK
+    for id in iter_ids(params):
+        try:
+            cred = user_functions.fetch_credential(creds_manager, id) if isinstance(id, int) else None
+        except DecryptionError as e:
+            writer.write({"id": id, "error": str(e)})
+            exit_code = EXIT_FAILURE
+            continue
+
+        if cred is None:
+            writer.write({"id": id, "error": "Credential not found!"})
+            # Credentials that could not be decrypted decide the exit code over the ones that were not found
+            if exit_code == EXIT_OK:
+                exit_code = EXIT_NOT_FOUND
+        else:
+            writer.write(cred.get_obj())
+
+    return exit_code
+
+
+def copy_password(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    id = get_single_id(params)
+    if id is None:
+        return usage_error("Copying a password needs exactly one --id!")
+
+    try:
+        cred = user_functions.fetch_credential(creds_manager, id)
+    except DecryptionError as e:
+        writer.write({"id": id, "error": str(e)})
+        return EXIT_FAILURE
+
+    if cred is None:
+        writer.write({"id": id, "error": "Credential not found!"})
+        return EXIT_NOT_FOUND
+
+    pyperclip.copy(cred.password)
+    writer.write({"id": id})
+    return EXIT_OK
+
+
+def filter_credentials(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    filters = (params.get("title_contains") or "", params.get("username_contains") or "", params.get("email_contains") or "")
+
+    exit_code = EXIT_NOT_FOUND
+    for cred, decrypted in user_functions.iter_credentials(creds_manager):
+        # There is no telling whether a credential that could not be decrypted matches
+        if not decrypted:
+            writer.write({"id": cred.id, "error": str(DecryptionError())})
+            exit_code = EXIT_FAILURE
+        elif cred.matches(*filters):
+            writer.write(cred.get_obj())
+            if exit_code == EXIT_NOT_FOUND:
+                exit_code = EXIT_OK
+
+    return exit_code
+
+
+def get_all_credentials(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    exit_code = EXIT_OK
+    for cred, decrypted in user_functions.iter_credentials(creds_manager):
+        if decrypted:
+            writer.write(cred.get_obj())
+        else:
+            writer.write({"id": cred.id, "error": str(DecryptionError())})
+            exit_code = EXIT_FAILURE
+
+    return exit_code
+
+
+def modify_credential(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    id = get_single_id(params)
+    if id is None:
+        return usage_error("Modifying a credential needs exactly one --id!")
+
+    old_cred = user_functions.fetch_credential(creds_manager, id)
+    if old_cred is None:
+        writer.write({"id": id, "error": "Credential not found!"})
+        return EXIT_NOT_FOUND
+
+    # Parameters that are not given keep their old values
+    cred = Credential(
+        id,
+        params.get("title") or old_cred.title,
+        params.get("username") or old_cred.username,
+        params.get("email") or old_cred.email,
+        read_password_param(params, "password") or old_cred.password
+    )
+    raw_cred = encrypt_credentials(user_functions.vault_key, [cred])[0]
+    creds_manager.modify_credential(id, raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt)
+
+    writer.write({"id": id})
+    return EXIT_OK
+
+
+def remove_credential(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    if not params.get("ids"):
+        return usage_error("Removing credentials needs --id!")
+
+    exit_code = EXIT_OK
+    for id in iter_ids(params):
+        if not isinstance(id, int) or not creds_manager.exists(id):
+            writer.write({"id": id, "error": "Credential not found!"})
+            exit_code = EXIT_NOT_FOUND
+            continue
+
+        creds_manager.remove_credential(id)
+        writer.write({"id": id})
+
+    return exit_code
+
+
+def remove_all_credentials(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    # Nothing is asked in batch mode, so removing everything has to be asked for explicitly
+    if not params.get("yes"):
+        return usage_error("Removing all credentials needs --yes!")
+
+    count = creds_manager.count()
+    creds_manager.remove_all_credentials()
+
+    writer.write({"removed": count})
+    return EXIT_OK
+
+
+def export_credentials(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    if not params.get("path"):
+        return usage_error("Exporting credentials needs --path!")
+
+    file_path = os.path.expanduser(params.get("path"))
+    count = user_functions.write_export_file(creds_manager, file_path, read_password_param(params, "file_master_pass") or master_pass)
+
+    writer.write({"path": file_path, "count": count})
+    return EXIT_OK
+
+
+def import_credentials(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    from .vault import check_master_password
+
+    if not params.get("path"):
+        return usage_error("Importing credentials needs --path!")
+
+    file_master_pass = read_password_param(params, "file_master_pass") or master_pass
+    raw_creds = user_functions.read_export_file(os.path.expanduser(params.get("path")))
+    if not check_master_password(file_master_pass, raw_creds):
+        print_red("Incorrect master password for file!", file=stderr)
+        return EXIT_AUTH
+
+    new_creds = reencrypt_credentials(file_master_pass, user_functions.vault_key, raw_creds)
+    creds_manager.add_many(new_creds)
+
+    writer.write({"count": len(new_creds)})
+    if len(new_creds) < len(raw_creds):
+        print_red(f"{len(raw_creds) - len(new_creds)} credential(s) could not be decrypted and have not been imported!", file=stderr)
+        return EXIT_FAILURE
+
+    return EXIT_OK
+
+
+def get_all_raw_credentials(params: dict, master_pass: str, creds_manager: DbManager, writer: RecordWriter) -> int:
+    for raw_cred in creds_manager.iter_credentials():
+        writer.write(raw_cred.get_obj())
+
+    return EXIT_OK
+
+
+# Actions that can be run in batch mode, by the same numbers as the menu items
+BATCH_ACTIONS: Dict[int, Callable[[dict, str, DbManager, RecordWriter], int]] = {
+    1: generate_strong_password,
+    2: generate_password,
+    3: add_credential,
+    4: get_credentials,
+    5: copy_password,
+    6: filter_credentials,
+    7: get_all_credentials,
+    8: modify_credential,
+    9: remove_credential,
+    10: remove_all_credentials,
+    12: export_credentials,
+    13: import_credentials,
+    14: get_all_raw_credentials,
+}
+
+
+def run_action(action: int, params: dict, master_pass: Union[str, None], creds_manager: Union[DbManager, None], writer: RecordWriter) -> int:
+    """Runs a batch action and returns its exit code. Errors are reported on stderr."""
+    ensure_type(action, int, "action", "int")
+    ensure_type(params, dict, "params", "dict")
+
+    try:
+        return BATCH_ACTIONS[action](params, master_pass, creds_manager, writer)
+    except Exception as e:
+        print_red("The action failed due to the following error:", file=stderr)
+        print_red(e, file=stderr)
+        return EXIT_FAILURE
+    finally:
+        writer.close()
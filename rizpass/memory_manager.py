@@ -0,0 +1,248 @@
+from threading import RLock
+from time import sleep
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+from .credentials import RawCredential
+from .validator import ensure_type
+from .db_manager import DEFAULT_BATCH_SIZE, DbManager, iter_chunks
+
+
+class FixedLatency:
+    """
+    A latency model for MemoryManager where every round trip takes round_trip seconds
+    plus per_row seconds for every credential that is sent or received.
+    """
+
+    def __init__(self, round_trip: float, per_row: float = 0.0):
+        ensure_type(round_trip, Union[int, float], "round_trip", "float")
+        ensure_type(per_row, Union[int, float], "per_row", "float")
+
+        self.round_trip = round_trip
+        self.per_row = per_row
+
+    def __call__(self, operation: str, rows: int) -> float:
+        return self.round_trip + self.per_row * rows
+
+
+class MemoryManager(DbManager):
+    """
+    Keeps the credentials in memory only, so that the cost of everything but the storage can be measured and large
+    workloads can be run quickly. A latency model can be given to simulate the round trips of a remote database:
+    it is called with the name of the operation and the number of credentials involved and returns the seconds to wait.
+    """
+
+    def __init__(self, raw_creds: Union[List[RawCredential], None] = None, latency: Union[Callable[[str, int], float], None] = None):
+        ensure_type(raw_creds, Union[list, None], "raw_creds", "list | None")
+
+        self.latency = latency
+        self.lock = RLock()
+        self.credentials: Dict[int, RawCredential] = {raw_cred.id: raw_cred for raw_cred in raw_creds or []}
+        self.versions: Dict[int, int] = {id: 1 for id in self.credentials}
+        # Points in time are counted in changes, see get_changes
+        self.clock = 0
+        self.changed_at: Dict[int, int] = {id: 0 for id in self.credentials}
+        self.removed_at: Dict[int, int] = dict()
+        self.meta: Dict[str, str] = dict()
+        self.next_id = max(self.credentials, default=0) + 1
+        self.batch_depth = 0
+        self.snapshot = None
+
+    def __round_trip(self, operation: str, rows: int = 1) -> None:
+        if self.latency is not None:
+            delay = self.latency(operation, rows)
+            if delay > 0:
+                sleep(delay)
+
+    def begin(self) -> None:
+        with self.lock:
+            if not self.batch_depth:
+                self.snapshot = (
+                    dict(self.credentials), dict(self.versions), dict(self.changed_at), dict(self.removed_at), dict(self.meta), self.next_id
+                )
+            self.batch_depth += 1
+
+    def commit(self) -> None:
+        with self.lock:
+            if not self.batch_depth:
+                return
+
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                self.snapshot = None
+
+    def rollback(self) -> None:
+        """Ends all batches and restores the credentials to what they were before the outermost batch began."""
+        with self.lock:
+            if not self.batch_depth:
+                return
+
+            self.batch_depth = 0
+            self.credentials, self.versions, self.changed_at, self.removed_at, self.meta, self.next_id = self.snapshot
+            self.snapshot = None
+
+    def __add(self, title: str, username: str, email: str, password: str, salt: str) -> int:
+        ensure_type(title, str, "title", "string")
+        ensure_type(username, str, "username", "string")
+        ensure_type(email, str, "email", "string")
+        ensure_type(password, str, "password", "string")
+        ensure_type(salt, str, "salt", "string")
+
+        with self.lock:
+            id = self.next_id
+            self.next_id += 1
+            self.credentials[id] = RawCredential(id, title, username, email, password, salt)
+            self.versions[id] = 1
+            self.__touch(id)
+            return id
+
+    def __modify(self, id: int, title: str, username: str, email: str, password: str, salt: str) -> None:
+        ensure_type(id, int, "id", "int")
+
+        with self.lock:
+            if id in self.credentials:
+                self.credentials[id] = RawCredential(id, title, username, email, password, salt)
+                self.versions[id] += 1
+                self.__touch(id)
+
+    def __touch(self, id: int) -> None:
+        self.clock += 1
+        self.changed_at[id] = self.clock
+
+    def __remove(self, id: int) -> None:
+        if self.credentials.pop(id, None) is None:
+            return
+
+        self.versions.pop(id)
+        self.changed_at.pop(id)
+        self.clock += 1
+        self.removed_at[id] = self.clock
+
+    def add_credential(self, title: str, username: str, email: str, password: str, salt: str) -> int:
+        self.__round_trip("add_credential")
+        return self.__add(title, username, email, password, salt)
+
+    def get_all_credentials(self) -> List[RawCredential]:
+        with self.lock:
+            raw_creds = list(self.credentials.values())
+        self.__round_trip("get_all_credentials", len(raw_creds))
+        return raw_creds
+
+    def iter_credentials(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[RawCredential]:
+        ensure_type(batch_size, int, "batch_size", "int")
+
+        with self.lock:
+            raw_creds = list(self.credentials.values())
+
+        for chunk in iter_chunks(raw_creds, batch_size):
+            self.__round_trip("iter_credentials", len(chunk))
+            yield from chunk
+
+    def get_credential(self, id: int) -> Union[RawCredential, None]:
+        ensure_type(id, int, "id", "int")
+
+        self.__round_trip("get_credential")
+        return self.credentials.get(id, None)
+
+    def get_many(self, ids: List[int]) -> List[RawCredential]:
+        ensure_type(ids, list, "ids", "list")
+
+        with self.lock:
+            raw_creds = [self.credentials[id] for id in ids if id in self.credentials]
+        self.__round_trip("get_many", len(raw_creds))
+        return raw_creds
+
+    def exists(self, id: int) -> bool:
+        ensure_type(id, int, "id", "int")
+
+        self.__round_trip("exists")
+        return id in self.credentials
+
+    def count(self) -> int:
+        self.__round_trip("count")
+        return len(self.credentials)
+
+    def list_ids(self) -> List[int]:
+        with self.lock:
+            ids = list(self.credentials)
+        self.__round_trip("list_ids", len(ids))
+        return ids
+
+    def get_versions(self, ids: List[int]) -> Union[Dict[int, int], None]:
+        ensure_type(ids, list, "ids", "list")
+
+        with self.lock:
+            versions = {id: self.versions[id] for id in ids if id in self.versions}
+        self.__round_trip("get_versions")
+        return versions
+
+    def get_changes(self, since: Union[float, None]) -> Union[Tuple[List[RawCredential], List[int], float], None]:
+        """Points in time are counted in changes, so no change is ever missed and there is no need for an overlap."""
+        ensure_type(since, Union[float, None], "since", "float | None")
+
+        with self.lock:
+            if since is None:
+                raw_creds, removed_ids = list(self.credentials.values()), []
+            else:
+                raw_creds = [self.credentials[id] for id, changed_at in self.changed_at.items() if changed_at > since]
+                removed_ids = [id for id, removed_at in self.removed_at.items() if removed_at > since]
+            clock = self.clock
+        self.__round_trip("get_changes", len(raw_creds))
+        return raw_creds, removed_ids, float(clock)
+
+    def remove_credential(self, id: int) -> None:
+        ensure_type(id, int, "id", "int")
+
+        self.__round_trip("remove_credential")
+        with self.lock:
+            self.__remove(id)
+
+    def remove_all_credentials(self) -> None:
+        self.__round_trip("remove_all_credentials")
+        with self.lock:
+            for id in list(self.credentials):
+                self.__remove(id)
+
+    def modify_credential(self, id: int, title: str, username: str, email: str, password: str, salt: str) -> None:
+        self.__round_trip("modify_credential")
+        self.__modify(id, title, username, email, password, salt)
+
+    def add_many(self, raw_creds: List[RawCredential]) -> None:
+        ensure_type(raw_creds, list, "raw_creds", "list")
+
+        self.__round_trip("add_many", len(raw_creds))
+        with self.batch():
+            for raw_cred in raw_creds:
+                self.__add(raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt)
+
+    def modify_many(self, raw_creds: List[RawCredential]) -> None:
+        ensure_type(raw_creds, list, "raw_creds", "list")
+
+        self.__round_trip("modify_many", len(raw_creds))
+        with self.batch():
+            for raw_cred in raw_creds:
+                self.__modify(raw_cred.id, raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt)
+
+    def remove_many(self, ids: List[int]) -> None:
+        ensure_type(ids, list, "ids", "list")
+
+        self.__round_trip("remove_many", len(ids))
+        with self.lock:
+            for id in ids:
+                self.__remove(id)
+
+    def get_meta(self, name: str) -> Union[str, None]:
+        ensure_type(name, str, "name", "string")
+
+        self.__round_trip("get_meta")
+        return self.meta.get(name, None)
+
+    def set_meta(self, name: str, value: str) -> None:
+        ensure_type(name, str, "name", "string")
+        ensure_type(value, str, "value", "string")
+
+        self.__round_trip("set_meta")
+        with self.lock:
+            self.meta[name] = value
+
+    def get_mode(self) -> str:
+        return "memory"
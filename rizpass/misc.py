@@ -17,17 +17,49 @@ def print_help(error: bool = False) -> None:
     print("   -v, --version           Prints the version number", file=file)
     print("   -s, --setup             Setup rizpass", file=file)
     print("   -f, --file <file_path>  Use file as credential storage", file=file)
+    print("   --journal               Append changes to a journal instead of rewriting the whole file (File mode only)", file=file)
+    print("   --binary                Create new credential files in the compact binary format (File mode only)", file=file)
+    print("   --lazy                  Only read the credentials that are needed from JSON files (File mode only)", file=file)
+    print("   --convert <format>      Convert the credential file to another format and exit (json, binary)", file=file)
     print("   --no-color              Disable color output", file=file)
     print("   --config-file           Specify alternative config file to use", file=file)
     print("   --clear                 Clear the console after execution", file=file)
     print("   --no-clear              Don't clear the console (Rec. for debugging purposes only)", file=file)
+    print("   --key-cache-size <n>    Max number of derived keys kept in memory (Default: 4096, 0 disables it)", file=file)
+    print("   --key-cache-ttl <secs>  Forget derived keys that have not been used for this many seconds", file=file)
+    print("   --workers <n>           Number of workers used to decrypt credentials in bulk (Default: number of cores)", file=file)
+    print("   --worker-type <type>    Type of workers used for bulk operations (thread, process)", file=file)
+    print("   --agent                 Keep the vault unlocked and answer retrieve, copy, filter and list-all from other runs", file=file)
+    print("   --agent-timeout <secs>  Stop the agent after this many seconds without a request (Default: 900)", file=file)
+    print("   --no-agent              Don't use a running agent", file=file)
     print()
     print("   Config Overrides:", file=file)
     print("   --db-host <host>        Database host", file=file)
-    print("   --db-type <type>        Database type (mongo, mysql)", file=file)
+    print("   --db-type <type>        Database type (mongo, mysql, sqlite)", file=file)
     print("   --db-user <user>        Database user", file=file)
-    print("   --db-name <name>        Database name", file=file)
+    print("   --db-name <name>        Database name (Path of the database file for sqlite)", file=file)
     print("   --db-port <port>        Database port", file=file)
+    print("   --db-replica <path>     Path of a local copy of the MySQL or Mongo vault to read from", file=file)
+    print("   --db-pool-size <n>      Max number of connections kept open to the database (MySQL only, Default: 4)", file=file)
+    print("   --db-cache-size <n>     Max number of credentials read from MySQL or Mongo kept in memory, 0 to disable (Default: 1024)", file=file)
+    print()
+    print("   Batch Mode:", file=file)
+    print("   --batch                 Run the actions without asking anything and print their results as JSON", file=file)
+    print("   --output <format>       Print the results as one JSON object per line or one array per action (jsonl, json)", file=file)
+    print("   --master-pass <source>  Read the master password from a variable or file descriptor (env:<name>, fd:<n>)", file=file)
+    print("   --id <id>               Id of the credential, can be given more than once, '-' reads ids from stdin", file=file)
+    print("   --title <title>         Title of the credential to add or modify", file=file)
+    print("   --username <username>   Username of the credential to add or modify", file=file)
+    print("   --email <email>         Email of the credential to add or modify", file=file)
+    print("   --password <source>     Read the password of the credential to add or modify (env:<name>, fd:<n>)", file=file)
+    print("   --title-contains <text> Only list credentials whose title contains the text (filter)", file=file)
+    print("   --username-contains <text>  Only list credentials whose username contains the text (filter)", file=file)
+    print("   --email-contains <text> Only list credentials whose email contains the text (filter)", file=file)
+    print("   --length <n>            Length of generated passwords (Default: 32)", file=file)
+    print("   --no-uppercase, --no-lowercase, --no-digits, --no-specials  Leave characters out of generated passwords", file=file)
+    print("   --path <path>           Path of the file to export to or import from", file=file)
+    print("   --file-master-pass <source>  Read the master password of the exported file (Default: master password)", file=file)
+    print("   --yes                   Allow remove-all to run", file=file)
     print()
     print("   Actions:", file=file)
     print("   generate-strong       Generate a strong password", file=file)
@@ -45,6 +77,7 @@ def print_help(error: bool = False) -> None:
     print("   import                Import credentials from a JSON file", file=file)
     print("   list-raw              List all credentials in their encrypted form", file=file)
     print("   pass-checkup          Perform a check for duplicate and weak passwords", file=file)
+    print("   calibrate             Tune the key derivation of the master password for this machine", file=file)
     print()
 
 
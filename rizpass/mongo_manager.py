@@ -1,13 +1,19 @@
 from sys import exit, stderr
-from typing import List
-from typing import List, Union
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Tuple, Union
 from urllib.parse import quote_plus
 
 
 from .credentials import RawCredential
 from .validator import ensure_type
 from .output import print_red
-from .db_manager import DbManager, DbConfig
+from .db_manager import CHANGE_OVERLAP, DEFAULT_BATCH_SIZE, DbManager, DbConfig
+
+# Name of the document in the counters collection that holds the last id handed out to a credential
+CREDENTIALS_COUNTER = "credentials"
+# Only the fields of a credential are sent back, not the _id of the document
+CREDENTIAL_PROJECTION = {"_id": 0, "id": 1, "title": 1, "username": 1, "email": 1, "password": 1, "salt": 1}
+
 
 class MongoManager(DbManager):
 
@@ -32,6 +38,16 @@ class MongoManager(DbManager):
             self.mongo_collection = self.mongo_db["credentials"]
 
             self.mongo_collection.create_index([("id", ASCENDING)], unique=True)
+
+            self.mongo_meta_collection = self.mongo_db["vault_meta"]
+            self.mongo_meta_collection.create_index([("name", ASCENDING)], unique=True)
+
+            self.mongo_counters_collection = self.mongo_db["counters"]
+            self.counter_synced = False
+
+            # Ids of removed credentials, so that copies of the vault can find out what was removed since they were last brought up to date
+            self.mongo_tombstones_collection = self.mongo_db["credential_tombstones"]
+            self.change_indexes_created = False
         except Exception as e:
             print()
             print_red("There was an error while connecting with MongoDB:", file=stderr)
@@ -40,12 +56,30 @@ class MongoManager(DbManager):
             print_red("Exiting with code 1!", file=stderr)
             exit(1)
 
-    def __gen_id(self) -> Union[int, None]:
-        """This method will generate a unique id for the credential. Note: To be used only with MongoDB"""
-        id = self.mongo_collection.estimated_document_count() + 1
-        while self.get_credential(id):
-            id += 1
-        return id
+    def __reserve_ids(self, count: int) -> List[int]:
+        """
+        Reserves count consecutive ids for new credentials with a single atomic increment of the credentials counter,
+        so that clients adding credentials at the same time never get the same id.
+        """
+        from pymongo import ReturnDocument
+
+        if not self.counter_synced:
+            # Credentials added before the counter existed or by older versions of rizpass must not get their ids reused
+            last_cred = self.mongo_collection.find_one({}, {"id": 1}, sort=[("id", -1)])
+            self.mongo_counters_collection.update_one(
+                {"_id": CREDENTIALS_COUNTER},
+                {"$max": {"seq": last_cred["id"] if last_cred else 0}},
+                upsert=True
+            )
+            self.counter_synced = True
+
+        counter = self.mongo_counters_collection.find_one_and_update(
+            {"_id": CREDENTIALS_COUNTER},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return list(range(counter["seq"] - count + 1, counter["seq"] + 1))
 
     def add_credential(self, title: str, username: str, email: str, password: str, salt: str) -> int:
         """This method takes in the encrypted and encoded credentials and adds them to the database."""
@@ -55,8 +89,7 @@ class MongoManager(DbManager):
         ensure_type(password, str, "password", "string")
         ensure_type(salt, str, "salt", "string")
 
-        # Encode to b64
-        cred_id = self.__gen_id()
+        cred_id = self.__reserve_ids(1)[0]
 
         # Add the password to the database
         self.mongo_collection.insert_one({
@@ -65,23 +98,27 @@ class MongoManager(DbManager):
             "username": username,
             "email": email,
             "password": password,
-            "salt": salt
+            "salt": salt,
+            "version": 1,
+            "updated_at": datetime.now(timezone.utc)
         })
 
         return cred_id
 
     def get_all_credentials(self) -> List[RawCredential]:
-        raw_creds: List[RawCredential] = []
+        return list(self.iter_credentials())
 
-        for i in self.mongo_collection.find():
-            raw_creds.append(RawCredential(i["id"], i["title"], i["username"], i["email"], i["password"], i["salt"]))
+    def iter_credentials(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[RawCredential]:
+        """Streams the credentials through a cursor that fetches batch_size documents at a time."""
+        ensure_type(batch_size, int, "batch_size", "int")
 
-        return raw_creds
+        for i in self.mongo_collection.find({}, CREDENTIAL_PROJECTION, batch_size=batch_size):
+            yield RawCredential(i["id"], i["title"], i["username"], i["email"], i["password"], i["salt"])
 
     def get_credential(self, id: int) -> Union[RawCredential, None]:
         ensure_type(id, int, "id", "int")
 
-        query_result = self.mongo_collection.find_one({"id": id})
+        query_result = self.mongo_collection.find_one({"id": id}, CREDENTIAL_PROJECTION)
         if not query_result:
             return None
 
@@ -94,13 +131,94 @@ class MongoManager(DbManager):
             query_result["salt"]
         )
 
+    def get_many(self, ids: List[int]) -> List[RawCredential]:
+        """Returns the credentials with the given ids that exist in the order of ids with a single query."""
+        ensure_type(ids, list, "ids", "list")
+        for id in ids:
+            ensure_type(id, int, "id", "int")
+
+        raw_creds: Dict[int, RawCredential] = dict()
+        if ids:
+            for i in self.mongo_collection.find({"id": {"$in": ids}}, CREDENTIAL_PROJECTION):
+                raw_creds[i["id"]] = RawCredential(i["id"], i["title"], i["username"], i["email"], i["password"], i["salt"])
+
+        return [raw_creds[id] for id in ids if id in raw_creds]
+
+    def exists(self, id: int) -> bool:
+        ensure_type(id, int, "id", "int")
+
+        return self.mongo_collection.count_documents({"id": id}, limit=1) > 0
+
+    def count(self) -> int:
+        return self.mongo_collection.count_documents({})
+
+    def list_ids(self) -> List[int]:
+        # The index on id covers this query, so no documents have to be read
+        return [i["id"] for i in self.mongo_collection.find({}, {"_id": 0, "id": 1}).sort("id", 1)]
+
+    def get_versions(self, ids: List[int]) -> Union[Dict[int, int], None]:
+        """Returns the versions of the credentials with the given ids that exist with a single query."""
+        ensure_type(ids, list, "ids", "list")
+        for id in ids:
+            ensure_type(id, int, "id", "int")
+
+        if not ids:
+            return dict()
+
+        # Credentials added before versions were introduced get their first version when they are modified
+        return {i["id"]: i.get("version", 0) for i in self.mongo_collection.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "version": 1})}
+
+    def get_changes(self, since: Union[float, None]) -> Union[Tuple[List[RawCredential], List[int], float], None]:
+        """
+        Finds the changes through the updated_at field of the credentials and the tombstones of removed credentials.
+        MongoDB cannot set a field to the time of the server when a document is inserted, so the points in time are read
+        from the clocks of the clients, which are expected to be within CHANGE_OVERLAP of each other.
+        """
+        from pymongo import ASCENDING
+        ensure_type(since, Union[float, None], "since", "float | None")
+
+        now = datetime.now(timezone.utc)
+        if since is None:
+            return self.get_all_credentials(), [], (now - timedelta(seconds=CHANGE_OVERLAP)).timestamp()
+
+        if not self.change_indexes_created:
+            # Vaults created before changes were tracked do not have these indexes yet
+            self.mongo_collection.create_index([("updated_at", ASCENDING)])
+            self.mongo_tombstones_collection.create_index([("id", ASCENDING)], unique=True)
+            self.mongo_tombstones_collection.create_index([("deleted_at", ASCENDING)])
+            self.change_indexes_created = True
+
+        since_time = datetime.fromtimestamp(since, timezone.utc)
+        raw_creds = [
+            RawCredential(i["id"], i["title"], i["username"], i["email"], i["password"], i["salt"])
+            for i in self.mongo_collection.find({"updated_at": {"$gte": since_time}}, CREDENTIAL_PROJECTION)
+        ]
+        removed_ids = [i["id"] for i in self.mongo_tombstones_collection.find({"deleted_at": {"$gte": since_time}}, {"_id": 0, "id": 1})]
+
+        return raw_creds, removed_ids, (now - timedelta(seconds=CHANGE_OVERLAP)).timestamp()
+
+    def __record_removals(self, ids: List[int]) -> None:
+        """Leaves tombstones behind for the removed credentials with the given ids."""
+        from pymongo import UpdateOne
+
+        if not ids:
+            return
+
+        now = datetime.now(timezone.utc)
+        self.mongo_tombstones_collection.bulk_write([
+            UpdateOne({"id": id}, {"$set": {"deleted_at": now}}, upsert=True) for id in ids
+        ], ordered=False)
+
     def remove_credential(self, id: int) -> None:
         ensure_type(id, int, "id", "int")
 
         self.mongo_collection.delete_one({"id": id})
+        self.__record_removals([id])
 
     def remove_all_credentials(self) -> None:
+        ids = self.list_ids()
         self.mongo_collection.delete_many({})
+        self.__record_removals(ids)
 
     def modify_credential(self, id: int, title: str, username: str, email: str, password: str, salt: str) -> None:
         ensure_type(id, int, "id", "int")
@@ -115,8 +233,87 @@ class MongoManager(DbManager):
             "username": username,
             "email": email,
             "password": password,
-            "salt": salt
-        }})
+            "salt": salt,
+            "updated_at": datetime.now(timezone.utc)
+        }, "$inc": {"version": 1}})
+
+    def add_many(self, raw_creds: List[RawCredential]) -> None:
+        """Adds the encrypted credentials with a single unordered bulk write. The ids of the given credentials are ignored."""
+        from pymongo import InsertOne
+        ensure_type(raw_creds, list, "raw_creds", "list")
+
+        if not raw_creds:
+            return
+
+        now = datetime.now(timezone.utc)
+        self.mongo_collection.bulk_write([
+            InsertOne({
+                "id": cred_id,
+                "title": raw_cred.title,
+                "username": raw_cred.username,
+                "email": raw_cred.email,
+                "password": raw_cred.password,
+                "salt": raw_cred.salt,
+                "version": 1,
+                "updated_at": now
+            })
+            for cred_id, raw_cred in zip(self.__reserve_ids(len(raw_creds)), raw_creds)
+        ], ordered=False)
+
+    def modify_many(self, raw_creds: List[RawCredential]) -> None:
+        """Replaces the credentials with the same ids with a single unordered bulk write."""
+        from pymongo import UpdateOne
+        ensure_type(raw_creds, list, "raw_creds", "list")
+
+        if not raw_creds:
+            return
+
+        now = datetime.now(timezone.utc)
+        self.mongo_collection.bulk_write([
+            UpdateOne({"id": raw_cred.id}, {"$set": {
+                "title": raw_cred.title,
+                "username": raw_cred.username,
+                "email": raw_cred.email,
+                "password": raw_cred.password,
+                "salt": raw_cred.salt,
+                "updated_at": now
+            }, "$inc": {"version": 1}})
+            for raw_cred in raw_creds
+        ], ordered=False)
+
+    def remove_many(self, ids: List[int]) -> None:
+        ensure_type(ids, list, "ids", "list")
+        for id in ids:
+            ensure_type(id, int, "id", "int")
+
+        if ids:
+            self.mongo_collection.delete_many({"id": {"$in": ids}})
+            self.__record_removals(ids)
+
+    def get_meta(self, name: str) -> Union[str, None]:
+        ensure_type(name, str, "name", "string")
+
+        query_result = self.mongo_meta_collection.find_one({"name": name})
+        return query_result["value"] if query_result else None
+
+    def set_meta(self, name: str, value: str) -> None:
+        ensure_type(name, str, "name", "string")
+        ensure_type(value, str, "value", "string")
+
+        self.mongo_meta_collection.update_one({"name": name}, {"$set": {"value": value}}, upsert=True)
+
+    def add_meta(self, name: str, value: str) -> str:
+        """Batches do not keep other clients from writing, so the unique index on the name rejects the record if another client stored it first."""
+        from pymongo.errors import DuplicateKeyError
+        ensure_type(name, str, "name", "string")
+        ensure_type(value, str, "value", "string")
+
+        try:
+            self.mongo_meta_collection.insert_one({"name": name, "value": value})
+        except DuplicateKeyError:
+            return self.mongo_meta_collection.find_one({"name": name})["value"]
+
+        return value
 
     def close(self):
         try:
@@ -1,34 +1,223 @@
 from sys import exit, stderr
-from typing import List
-from typing import List, Union
+from contextlib import contextmanager
+from threading import Condition, local
+from time import monotonic
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
 
 
 from .credentials import RawCredential
 from .validator import ensure_type
 from .output import format_colors, print_red, print_verbose
-from .db_manager import DbManager, DbConfig
+from .db_manager import CHANGE_OVERLAP, DEFAULT_BATCH_SIZE, DbManager, DbConfig, iter_chunks
+
+
+CREATE_META_TABLE_QUERY = """CREATE TABLE IF NOT EXISTS vault_meta(
+    name VARCHAR(64) NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY( name ));"""
+# Ids of removed credentials, so that copies of the vault can find out what was removed since they were last brought up to date
+CREATE_TOMBSTONES_TABLE_QUERY = """CREATE TABLE IF NOT EXISTS credential_tombstones(
+    id INT NOT NULL,
+    deleted_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    PRIMARY KEY( id ),
+    INDEX( deleted_at ));"""
+
+INSERT_CREDENTIAL_QUERY = "INSERT INTO credentials(title, username, email, password, salt) VALUES(%s, %s, %s, %s, %s)"
+SELECT_ALL_CREDENTIALS_QUERY = "SELECT id, title, username, email, password, salt FROM credentials"
+SELECT_CREDENTIAL_QUERY = "SELECT id, title, username, email, password, salt FROM credentials WHERE id = %s"
+DELETE_CREDENTIAL_QUERY = "DELETE FROM credentials WHERE id = %s"
+DELETE_ALL_CREDENTIALS_QUERY = "DELETE FROM credentials"
+UPDATE_CREDENTIAL_QUERY = "UPDATE credentials SET title = %s, username = %s, email = %s, password = %s, salt = %s{version} WHERE id = %s"
+SELECT_CREDENTIALS_QUERY = "SELECT id, title, username, email, password, salt FROM credentials WHERE id IN ({})"
+CREDENTIAL_EXISTS_QUERY = "SELECT EXISTS(SELECT 1 FROM credentials WHERE id = %s)"
+COUNT_CREDENTIALS_QUERY = "SELECT COUNT(*) FROM credentials"
+SELECT_IDS_QUERY = "SELECT id FROM credentials ORDER BY id"
+SELECT_VERSIONS_QUERY = "SELECT id, version FROM credentials WHERE id IN ({})"
+ADD_VERSION_COLUMN_QUERY = "ALTER TABLE credentials ADD COLUMN version INT NOT NULL DEFAULT 1"
+SELECT_TABLES_QUERY = "SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()"
+SELECT_COLUMNS_QUERY = "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'credentials'"
+SELECT_NOW_QUERY = "SELECT UNIX_TIMESTAMP(CURRENT_TIMESTAMP(6))"
+SELECT_CHANGED_CREDENTIALS_QUERY = "SELECT id, title, username, email, password, salt FROM credentials WHERE updated_at >= FROM_UNIXTIME(%s)"
+SELECT_REMOVED_IDS_QUERY = "SELECT id FROM credential_tombstones WHERE deleted_at >= FROM_UNIXTIME(%s)"
+ADD_UPDATED_AT_COLUMN_QUERY = """ALTER TABLE credentials
+    ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    ADD INDEX( updated_at )"""
+# Only credentials that exist get a tombstone
+INSERT_TOMBSTONES_QUERY = "INSERT INTO credential_tombstones(id) SELECT id FROM credentials WHERE id IN ({}) ON DUPLICATE KEY UPDATE deleted_at = CURRENT_TIMESTAMP(6)"
+INSERT_ALL_TOMBSTONES_QUERY = "INSERT INTO credential_tombstones(id) SELECT id FROM credentials ON DUPLICATE KEY UPDATE deleted_at = CURRENT_TIMESTAMP(6)"
+SELECT_META_QUERY = "SELECT value FROM vault_meta WHERE name = %s"
+UPSERT_META_QUERY = "INSERT INTO vault_meta(name, value) VALUES(%s, %s) ON DUPLICATE KEY UPDATE value = VALUES(value)"
+INSERT_META_QUERY = "INSERT INTO vault_meta(name, value) VALUES(%s, %s)"
+# Locking reads see the latest committed rows instead of the snapshot of the transaction
+SELECT_LATEST_META_QUERY = "SELECT value FROM vault_meta WHERE name = %s LOCK IN SHARE MODE"
+
+# Bulk operations send this many rows per statement
+BULK_CHUNK_SIZE = 500
+CREDENTIAL_VALUES = "(%s, %s, %s, %s, %s)"
+UPDATE_ROW = "SELECT %s AS id, %s AS title, %s AS username, %s AS email, %s AS password, %s AS salt"
+UPDATE_CREDENTIALS_QUERY = """UPDATE credentials JOIN ({rows}) AS new ON credentials.id = new.id
+    SET credentials.title = new.title, credentials.username = new.username, credentials.email = new.email,
+    credentials.password = new.password, credentials.salt = new.salt{version}"""
+# Added to the updates of vaults whose credentials have versions
+BUMP_VERSION = ", version = version + 1"
+BUMP_VERSIONS = ", credentials.version = credentials.version + 1"
+DELETE_CREDENTIALS_QUERY = "DELETE FROM credentials WHERE id IN ({})"
+
+DEFAULT_POOL_SIZE = 4
+# Connections that have been idle for this many seconds are pinged before they are used again
+PING_INTERVAL = 1.0
+# Error code of pymysql when a query could not be sent because the server closed the connection
+CR_SERVER_GONE_ERROR = 2006
+# Error code of MySQL when a table does not exist
+ER_NO_SUCH_TABLE = 1146
+# Error code of MySQL when a row with the same key exists already
+ER_DUP_ENTRY = 1062
+
+
+class ConnectionPool:
+    """
+    Keeps up to size connections open so that queries do not have to connect and authenticate every time.
+    Connections are created with connect when they are first needed and reconnected if they went stale while idle.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int = DEFAULT_POOL_SIZE):
+        ensure_type(size, int, "size", "int")
+        if size < 1:
+            raise ValueError("Invalid value provided for parameter 'size'")
+
+        self.connect = connect
+        self.size = size
+        # The most recently used connection is handed out first, so the other ones can time out if they are not needed
+        self.idle: List[Tuple[Any, float]] = []
+        self.open_count = 0
+        self.closed = False
+        self.condition = Condition()
+
+    def acquire(self) -> Any:
+        """
+        Returns an idle connection, opens a new one if there are less than size connections
+        or waits for another thread to release one.
+        """
+        with self.condition:
+            if self.closed:
+                raise ValueError("The connection pool has been closed")
+            while not self.idle and self.open_count >= self.size:
+                self.condition.wait()
+            if not self.idle:
+                self.open_count += 1
+                connection, last_used = None, None
+            else:
+                connection, last_used = self.idle.pop()
+
+        if connection is None:
+            try:
+                return self.connect()
+            except BaseException:
+                self.__forget()
+                raise
+
+        if monotonic() - last_used >= PING_INTERVAL:
+            try:
+                connection.ping(reconnect=True)
+            except BaseException:
+                self.discard(connection)
+                raise
+
+        return connection
+
+    def release(self, connection: Any) -> None:
+        """Puts a connection back into the pool."""
+        with self.condition:
+            if not self.closed:
+                self.idle.append((connection, monotonic()))
+                self.condition.notify()
+                return
+
+        self.discard(connection)
+
+    def discard(self, connection: Any) -> None:
+        """Closes a connection that cannot be used anymore instead of putting it back into the pool."""
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self.__forget()
+
+    def __forget(self) -> None:
+        with self.condition:
+            self.open_count -= 1
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """
+        Checks out a connection for the duration of the with block.
+        If the block raises, the connection is rolled back before it is reused, or discarded if that fails as well.
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        except BaseException:
+            try:
+                connection.rollback()
+            except Exception:
+                self.discard(connection)
+            else:
+                self.release(connection)
+            raise
+        else:
+            self.release(connection)
+
+    def close(self) -> None:
+        """Closes the idle connections. Connections that are in use are closed once they are released."""
+        with self.condition:
+            self.closed = True
+            idle = [connection for connection, _ in self.idle]
+            self.idle.clear()
+
+        for connection in idle:
+            self.discard(connection)
+
 
+class Transaction(local):
+    """The transaction a thread has started with MysqlManager.begin and the connection it runs on."""
+    depth = 0
+    connection = None
 
 
 class MysqlManager(DbManager):
 
-    def __init__(self,  db_config: DbConfig):
+    def __init__(self,  db_config: DbConfig, pool_size: int = DEFAULT_POOL_SIZE):
         from .output import print_verbose, format_colors
         ensure_type(db_config, DbConfig, "db_config", "DbConfig")
+        ensure_type(pool_size, int, "pool_size", "int")
 
         import pymysql
 
-        print_verbose("Begin connecting to mysql!")
-        try:
-            self.mysql_db = pymysql.connect(
+        def connect():
+            return pymysql.connect(
                 host=db_config.host,
                 user=db_config.user,
                 password=db_config.password,
                 db=db_config.db,
                 port=db_config.port if db_config.port else 3306,
+                # Queries outside of a transaction are committed right away and never read from an old snapshot
+                autocommit=True,
                 # connection_timeout=3
             )
-            self.mysql_cursor = self.mysql_db.cursor()
+
+        self.transaction = Transaction()
+        # Whether the credentials table has a version column, see upgrade_schema
+        self.versioned = False
+        # Whether changes are tracked through the updated_at column and the tombstones of removed credentials
+        self.tracks_changes = False
+        self.keeps_tombstones = False
+
+        print_verbose("Begin connecting to mysql!")
+        try:
+            self.pool = ConnectionPool(connect, pool_size)
+            # Connect right away so that wrong credentials are reported before anything else happens
+            self.pool.release(self.pool.acquire())
         except Exception as e:
             print()
             print_red("There was an error while connecting with MySQL:", file=stderr)
@@ -39,8 +228,139 @@ class MysqlManager(DbManager):
         else:
             print_verbose(format_colors("{green}Connection established successfully!{reset}"))
 
+        self.upgrade_schema()
+
+    def __get_schema(self) -> Tuple[List[str], List[str]]:
+        """Returns the names of the tables in the database and of the columns of the credentials table."""
+        tables = [i[0] for i in self.execute(SELECT_TABLES_QUERY).fetchall()]
+        columns = [i[0] for i in self.execute(SELECT_COLUMNS_QUERY).fetchall()]
+        return tables, columns
+
+    def upgrade_schema(self) -> None:
+        """
+        Adds the tables and columns that newer versions of rizpass rely on to vaults created before them.
+        This runs once when connecting, outside of any transaction, because MySQL commits the running transaction before
+        it changes a table. Whatever cannot be added, e.g. because the user is not allowed to alter tables, is not used.
+        """
+        import pymysql
+
+        try:
+            tables, columns = self.__get_schema()
+        except pymysql.err.MySQLError as e:
+            print_verbose(f"Could not read the schema of the vault: {e}")
+            return
+
+        # The credentials table is created by the setup, vaults without it are left alone
+        upgrades = [
+            ("vault_meta" not in tables, CREATE_META_TABLE_QUERY),
+            ("credentials" in tables and "version" not in columns, ADD_VERSION_COLUMN_QUERY),
+            ("credentials" in tables and "updated_at" not in columns, ADD_UPDATED_AT_COLUMN_QUERY),
+            ("credential_tombstones" not in tables, CREATE_TOMBSTONES_TABLE_QUERY),
+        ]
+        upgrades = [query for needed, query in upgrades if needed]
+
+        for query in upgrades:
+            try:
+                self.execute(query)
+            except pymysql.err.MySQLError as e:
+                print_verbose(f"Could not upgrade the vault: {e}")
+
+        if upgrades:
+            tables, columns = self.__get_schema()
+        self.versioned = "version" in columns
+        self.tracks_changes = "updated_at" in columns
+        self.keeps_tombstones = "credential_tombstones" in tables
+
+    @contextmanager
+    def __connection(self) -> Iterator[Any]:
+        """Yields the connection of the transaction this thread is in or a connection from the pool."""
+        if self.transaction.connection is not None:
+            yield self.transaction.connection
+            return
+
+        with self.pool.connection() as connection:
+            yield connection
+
+    def execute(self, query: str, args: Union[tuple, None] = None):
+        """
+        Executes the query with the args and returns the cursor.
+        pymysql has no server-side prepared statements: it escapes the args and quotes them into the query on the client.
+        The results are read before the connection goes back to the pool, so the cursor can still be fetched from.
+        """
+        import pymysql
+        ensure_type(query, str, "query", "string")
+
+        # Only the template is printed, the values are usually encrypted credentials
+        print_verbose("Begin execution of query: ")
+        print_verbose(query)
+
+        for attempt in range(2):
+            in_transaction = self.transaction.connection is not None
+            try:
+                with self.__connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(query, args)
+                    cursor.close()
+            except pymysql.err.OperationalError as e:
+                # The query never reached the server if the connection was already gone, so it is safe to send it again.
+                # A transaction cannot be resumed on another connection though.
+                if attempt or in_transaction or e.args[0] != CR_SERVER_GONE_ERROR:
+                    raise
+                print_verbose("Lost the connection to mysql, reconnecting...")
+            else:
+                break
+
+        print_verbose(format_colors("{green}Query executed successfully!{reset}"))
+        return cursor
+
+    def begin(self) -> None:
+        """
+        Starts a transaction. Queries made by this thread run on the same connection until the matching commit.
+        Transactions can be nested, in which case the changes are committed when the outermost transaction is committed.
+        """
+        if not self.transaction.depth:
+            connection = self.pool.acquire()
+            try:
+                connection.begin()
+            except BaseException:
+                self.pool.discard(connection)
+                raise
+            self.transaction.connection = connection
+
+        self.transaction.depth += 1
+
+    def commit(self) -> None:
+        if not self.transaction.depth:
+            return
+
+        self.transaction.depth -= 1
+        if self.transaction.depth:
+            return
+
+        connection, self.transaction.connection = self.transaction.connection, None
+        try:
+            connection.commit()
+        except BaseException:
+            self.pool.discard(connection)
+            raise
+        self.pool.release(connection)
+
+    def rollback(self) -> None:
+        """Ends all transactions of this thread and discards the changes made during them."""
+        if not self.transaction.depth:
+            return
+
+        self.transaction.depth = 0
+        connection, self.transaction.connection = self.transaction.connection, None
+        try:
+            connection.rollback()
+        except Exception:
+            # The server rolls back the transaction of a connection that goes away
+            self.pool.discard(connection)
+        else:
+            self.pool.release(connection)
+
     def add_credential(self, title: str, username: str, email: str, password: str, salt: str) -> int:
-        from .output import print_verbose, format_colors
         """This method takes in the encrypted and encoded credentials and adds them to the database."""
         ensure_type(title, str, "title", "string")
         ensure_type(username, str, "username", "string")
@@ -49,45 +369,45 @@ class MysqlManager(DbManager):
         ensure_type(salt, str, "salt", "string")
 
         # Add the credential to the database
-        query = "INSERT INTO credentials(title, username, email, password, salt) VALUES('%s', '%s', '%s', '%s', '%s');" % (
-            title, username, email, password, salt)
-        print_verbose("Begin execution of query: ")
-        print_verbose(query)
-
-        self.mysql_cursor.execute(query)
-        self.mysql_db.commit()
-
-        print_verbose(format_colors("{green}Query executed successfully!{reset}"))
-
-        return self.mysql_cursor.lastrowid
+        return self.execute(INSERT_CREDENTIAL_QUERY, (title, username, email, password, salt)).lastrowid
 
     def get_all_credentials(self) -> List[RawCredential]:
         raw_creds: List[RawCredential] = []
 
-        query = "SELECT * FROM credentials WHERE title LIKE '%' AND username LIKE '%' AND email LIKE '%'"
-        print_verbose("Begin execution of query: ")
-        print_verbose(query)
-
-        self.mysql_cursor.execute(query)
-
-        print_verbose(format_colors("{green}Query executed successfully!{reset}"))
-
-        for i in self.mysql_cursor.fetchall():
+        for i in self.execute(SELECT_ALL_CREDENTIALS_QUERY).fetchall():
             raw_creds.append(RawCredential(i[0], i[1], i[2], i[3], i[4], i[5]))
 
         return raw_creds
 
+    def iter_credentials(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[RawCredential]:
+        """
+        Streams the credentials through a server-side cursor, fetching batch_size rows at a time.
+        The connection is in use until the iteration is done, so no other queries should be made on this thread until then.
+        """
+        from pymysql.cursors import SSCursor
+        ensure_type(batch_size, int, "batch_size", "int")
+
+        print_verbose("Begin streaming query: ")
+        print_verbose(SELECT_ALL_CREDENTIALS_QUERY)
+
+        with self.__connection() as connection:
+            cursor = connection.cursor(SSCursor)
+            try:
+                cursor.execute(SELECT_ALL_CREDENTIALS_QUERY)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for i in rows:
+                        yield RawCredential(i[0], i[1], i[2], i[3], i[4], i[5])
+            finally:
+                # Rows that have not been read yet have to be skipped before the connection can be used again
+                cursor.close()
+
     def get_credential(self, id: int) -> Union[RawCredential, None]:
         ensure_type(id, int, "id", "int")
 
-        query = "SELECT * FROM credentials WHERE id = %s" % (id, )
-        print_verbose("Begin execution of query: ")
-        print_verbose(query)
-
-        self.mysql_cursor.execute(query)
-        print_verbose(format_colors("{green}Query executed successfully!{reset}"))
-
-        query_result = self.mysql_cursor.fetchone()
+        query_result = self.execute(SELECT_CREDENTIAL_QUERY, (id, )).fetchone()
         if not query_result:
             return None
 
@@ -100,28 +420,90 @@ class MysqlManager(DbManager):
             query_result[5]
         )
 
+    def get_many(self, ids: List[int]) -> List[RawCredential]:
+        """Returns the credentials with the given ids that exist in the order of ids, fetching up to a chunk of them per query."""
+        ensure_type(ids, list, "ids", "list")
+        for id in ids:
+            ensure_type(id, int, "id", "int")
+
+        raw_creds: Dict[int, RawCredential] = dict()
+        for chunk in iter_chunks(ids, BULK_CHUNK_SIZE):
+            query = SELECT_CREDENTIALS_QUERY.format(", ".join(["%s"] * len(chunk)))
+            for i in self.execute(query, tuple(chunk)).fetchall():
+                raw_creds[i[0]] = RawCredential(i[0], i[1], i[2], i[3], i[4], i[5])
+
+        return [raw_creds[id] for id in ids if id in raw_creds]
+
+    def exists(self, id: int) -> bool:
+        ensure_type(id, int, "id", "int")
+
+        return bool(self.execute(CREDENTIAL_EXISTS_QUERY, (id, )).fetchone()[0])
+
+    def count(self) -> int:
+        return self.execute(COUNT_CREDENTIALS_QUERY).fetchone()[0]
+
+    def list_ids(self) -> List[int]:
+        return [i[0] for i in self.execute(SELECT_IDS_QUERY).fetchall()]
+
+    def get_versions(self, ids: List[int]) -> Union[Dict[int, int], None]:
+        """
+        Returns the versions of the credentials with the given ids that exist, reading up to a chunk of them per query.
+        Returns None if the credentials table has no version column and it could not be added, see upgrade_schema.
+        """
+        ensure_type(ids, list, "ids", "list")
+        for id in ids:
+            ensure_type(id, int, "id", "int")
+
+        if not self.versioned:
+            return None
+
+        versions: Dict[int, int] = dict()
+        for chunk in iter_chunks(ids, BULK_CHUNK_SIZE):
+            query = SELECT_VERSIONS_QUERY.format(", ".join(["%s"] * len(chunk)))
+            for i in self.execute(query, tuple(chunk)).fetchall():
+                versions[i[0]] = i[1]
+
+        return versions
+
+    def get_changes(self, since: Union[float, None]) -> Union[Tuple[List[RawCredential], List[int], float], None]:
+        """
+        Finds the changes through the updated_at column of the credentials and the tombstones of removed credentials.
+        Points in time are read from the clock of the server, so the clocks of the clients do not matter.
+        Returns None if the updated_at column is missing and could not be added, see upgrade_schema.
+        """
+        ensure_type(since, Union[float, None], "since", "float | None")
+
+        if not self.tracks_changes:
+            return None
+
+        now = float(self.execute(SELECT_NOW_QUERY).fetchone()[0])
+        if since is None:
+            return self.get_all_credentials(), [], now - CHANGE_OVERLAP
+
+        rows = self.execute(SELECT_CHANGED_CREDENTIALS_QUERY, (since, )).fetchall()
+        # Credentials removed without a tombstone are found by the callers by comparing the ids
+        removed_ids = [i[0] for i in self.execute(SELECT_REMOVED_IDS_QUERY, (since, )).fetchall()] if self.keeps_tombstones else []
+
+        return [RawCredential(i[0], i[1], i[2], i[3], i[4], i[5]) for i in rows], removed_ids, now - CHANGE_OVERLAP
+
+    def __record_removals(self, query: str, args: Union[tuple, None] = None) -> None:
+        """Executes a query that adds tombstones for credentials that are about to be removed, if the vault keeps them."""
+        if self.keeps_tombstones:
+            self.execute(query, args)
+
     def remove_credential(self, id: int) -> None:
         ensure_type(id, int, "id", "int")
         if not id:
             raise ValueError("Invalid value provided for parameter 'id'")
 
-        query = "DELETE FROM credentials WHERE id=%s" % (id, )
-        print_verbose("Begin execution of query: ")
-        print_verbose(query)
-
-        self.mysql_cursor.execute(query)
-        self.mysql_db.commit()
-        print_verbose(format_colors("{green}Query executed successfully!{reset}"))
+        with self.batch():
+            self.__record_removals(INSERT_TOMBSTONES_QUERY.format("%s"), (id, ))
+            self.execute(DELETE_CREDENTIAL_QUERY, (id, ))
 
     def remove_all_credentials(self) -> None:
-        query = "DELETE FROM credentials"
-        print_verbose("Begin execution of query: ")
-        print_verbose(query)
-
-        self.mysql_cursor.execute(query)
-        self.mysql_db.commit()
-
-        print_verbose(format_colors("{green}Query executed successfully!{reset}"))
+        with self.batch():
+            self.__record_removals(INSERT_ALL_TOMBSTONES_QUERY)
+            self.execute(DELETE_ALL_CREDENTIALS_QUERY)
 
     def modify_credential(self, id: int, title: str, username: str, email: str, password: str, salt: str) -> None:
         ensure_type(id, int, "id", "int")
@@ -131,20 +513,91 @@ class MysqlManager(DbManager):
         ensure_type(password, str, "password", "string")
         ensure_type(salt, str, "salt", "string")
 
-        query = "UPDATE credentials SET title = '%s', username = '%s', email = '%s', password = '%s', salt = '%s' WHERE id = %s" % (
-            title, username, email, password, salt, id)
-        print_verbose("Begin execution of query: ")
-        print_verbose(query)
+        query = UPDATE_CREDENTIAL_QUERY.format(version=BUMP_VERSION if self.versioned else "")
+        self.execute(query, (title, username, email, password, salt, id))
+
+    def add_many(self, raw_creds: List[RawCredential]) -> None:
+        """Adds the encrypted credentials with one multi-row INSERT per chunk in a single transaction. The ids of the given credentials are ignored."""
+        ensure_type(raw_creds, list, "raw_creds", "list")
+
+        with self.batch():
+            for chunk in iter_chunks(raw_creds, BULK_CHUNK_SIZE):
+                query = INSERT_CREDENTIAL_QUERY + (", " + CREDENTIAL_VALUES) * (len(chunk) - 1)
+                self.execute(query, tuple(value for raw_cred in chunk for value in (
+                    raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt
+                )))
+
+    def modify_many(self, raw_creds: List[RawCredential]) -> None:
+        """Replaces the credentials with the same ids with one UPDATE per chunk in a single transaction."""
+        ensure_type(raw_creds, list, "raw_creds", "list")
+
+        with self.batch():
+            for chunk in iter_chunks(raw_creds, BULK_CHUNK_SIZE):
+                query = UPDATE_CREDENTIALS_QUERY.format(
+                    rows=" UNION ALL ".join([UPDATE_ROW] * len(chunk)),
+                    version=BUMP_VERSIONS if self.versioned else ""
+                )
+                self.execute(query, tuple(value for raw_cred in chunk for value in (
+                    raw_cred.id, raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt
+                )))
+
+    def remove_many(self, ids: List[int]) -> None:
+        """Removes the credentials with the given ids with one DELETE per chunk in a single transaction, leaving tombstones behind."""
+        ensure_type(ids, list, "ids", "list")
+        for id in ids:
+            ensure_type(id, int, "id", "int")
+
+        with self.batch():
+            for chunk in iter_chunks(ids, BULK_CHUNK_SIZE):
+                placeholders = ", ".join(["%s"] * len(chunk))
+                self.__record_removals(INSERT_TOMBSTONES_QUERY.format(placeholders), tuple(chunk))
+                self.execute(DELETE_CREDENTIALS_QUERY.format(placeholders), tuple(chunk))
+
+    def get_meta(self, name: str) -> Union[str, None]:
+        import pymysql
+        ensure_type(name, str, "name", "string")
+
+        try:
+            query_result = self.execute(SELECT_META_QUERY, (name, )).fetchone()
+        except pymysql.err.ProgrammingError as e:
+            # Vaults created before the metadata table was introduced do not have it
+            if e.args[0] == ER_NO_SUCH_TABLE:
+                return None
+            raise
+
+        return query_result[0] if query_result else None
+
+    def set_meta(self, name: str, value: str) -> None:
+        ensure_type(name, str, "name", "string")
+        ensure_type(value, str, "value", "string")
+
+        # The table is created by upgrade_schema if it is missing
+        self.execute(UPSERT_META_QUERY, (name, value))
+
+    def add_meta(self, name: str, value: str) -> str:
+        """
+        Transactions do not keep other clients from inserting the record, so it is inserted without replacing one
+        that exists already, which fails if another client inserted it first.
+        """
+        import pymysql
+        ensure_type(name, str, "name", "string")
+        ensure_type(value, str, "value", "string")
 
-        self.mysql_cursor.execute(query)
-        self.mysql_db.commit()
+        try:
+            self.execute(INSERT_META_QUERY, (name, value))
+        except pymysql.err.IntegrityError as e:
+            if e.args[0] != ER_DUP_ENTRY:
+                raise
+            return self.execute(SELECT_LATEST_META_QUERY, (name, )).fetchone()[0]
 
-        print_verbose(format_colors("{green}Query executed successfully!{reset}"))
+        return value
 
     def close(self):
         try:
-            if hasattr(self, "mysql_cursor"):
-                self.mysql_cursor.close()
+            if hasattr(self, "transaction"):
+                self.rollback()
+            if hasattr(self, "pool"):
+                self.pool.close()
         except Exception as e:
             print_red("There was an error while closing the connection:", file=stderr)
             print_red(e, file=stderr)
@@ -154,5 +607,3 @@ class MysqlManager(DbManager):
 
     def __del__(self):
         self.close()
-
-
@@ -0,0 +1,158 @@
+from os import cpu_count
+from typing import Any, Callable, Iterable, Iterator, List, Tuple, Union
+
+from .validator import ensure_type
+
+WORKER_TYPES = ["thread", "process"]
+
+workers: int = cpu_count() or 1
+worker_type: str = "thread"
+
+
+def set_workers(num_workers: Union[int, None] = None, type: str = "thread") -> None:
+    """
+    Sets the number and the type of workers used for bulk operations.
+    If num_workers is None, the number of cores on the machine is used.
+    """
+    ensure_type(num_workers, Union[int, None], "num_workers", "int | None")
+    ensure_type(type, str, "type", "string")
+
+    if num_workers is not None and num_workers < 1:
+        raise ValueError("Invalid value provided for parameter 'num_workers'")
+    if type not in WORKER_TYPES:
+        raise ValueError("Invalid value provided for parameter 'type'")
+
+    global workers, worker_type
+    workers = num_workers or cpu_count() or 1
+    worker_type = type
+
+
+def get_workers() -> int:
+    return workers
+
+
+def parallel_map(func: Callable, items: List) -> List:
+    """
+    Applies func to every item using the configured worker pool and returns the results in the same order as items.
+    When a process pool is used, func and items must be picklable.
+    """
+    ensure_type(items, list, "items", "list")
+
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    pool_size = min(workers, len(items))
+
+    if worker_type == "process":
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=pool_size) as executor:
+            # Send items in chunks so that the cost of pickling stays small compared to the work done
+            return list(executor.map(func, items, chunksize=max(1, len(items) // (pool_size * 4))))
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=pool_size) as executor:
+        return list(executor.map(func, items))
+
+
+def apply_to_all(func: Callable, items: List) -> List:
+    """Applies func to every item. Used to hand chunks of items to workers at once."""
+    return [func(item) for item in items]
+
+
+def pipeline_map(func: Callable, items: Iterable, chunk_size: int, prefetch: int = 2) -> Iterator[Tuple[Any, Any]]:
+    """
+    Applies func to every item like parallel_map and yields (item, result) pairs in the same order as items.
+    Reading the items, applying func and consuming the results overlap: a background thread reads the items in chunks of
+    chunk_size while the configured workers apply func to the chunks read before, and every result is yielded as soon as
+    it and the ones before it are ready. At most prefetch chunks are read ahead of the results that have been consumed.
+    Errors raised while reading the items are raised by the returned iterator.
+    """
+    from collections import deque
+    from itertools import chain
+    from queue import Empty, Full, Queue
+    from threading import Event, Thread
+    from .db_manager import iter_chunks
+
+    ensure_type(chunk_size, int, "chunk_size", "int")
+    ensure_type(prefetch, int, "prefetch", "int")
+    if chunk_size < 1:
+        raise ValueError("Invalid value provided for parameter 'chunk_size'")
+    if prefetch < 1:
+        raise ValueError("Invalid value provided for parameter 'prefetch'")
+
+    chunks: Queue = Queue(maxsize=prefetch)
+    stopped = Event()
+    done = object()
+
+    def put(chunk) -> bool:
+        # Give up if the results are not wanted anymore instead of waiting for room in the queue forever
+        while not stopped.is_set():
+            try:
+                chunks.put(chunk, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def read_items():
+        try:
+            for chunk in iter_chunks(items, chunk_size):
+                if not put(chunk):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+        finally:
+            # Generators are closed in the thread that reads them, so that whatever they hold is released there
+            if hasattr(items, "close"):
+                items.close()
+
+    if worker_type == "process":
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(chunk: List) -> List:
+        # Futures are kept instead of using executor.map, so that the ones that have not started yet can be cancelled
+        # Processes get the items in slices, so that the cost of pickling stays small compared to the work done
+        size = max(1, len(chunk) // (workers * 4)) if worker_type == "process" else 1
+        return [executor.submit(apply_to_all, func, chunk[start:start + size]) for start in range(0, len(chunk), size)]
+
+    reader = Thread(target=read_items, daemon=True)
+    reader.start()
+
+    pending = deque()
+    exhausted = False
+    try:
+        while True:
+            # Keep the workers busy with the next chunks while the results of the oldest one are consumed,
+            # but only wait for a chunk to be read if there are no results to hand out in the meantime
+            while not exhausted and len(pending) < prefetch:
+                try:
+                    chunk = chunks.get(block=not pending)
+                except Empty:
+                    break
+
+                if chunk is done:
+                    exhausted = True
+                elif isinstance(chunk, BaseException):
+                    raise chunk
+                else:
+                    pending.append((chunk, submit(chunk)))
+
+            if not pending:
+                return
+
+            # The chunk stays pending until all of its results have been consumed, so that closing the iterator cancels it
+            chunk, futures = pending[0]
+            yield from zip(chunk, chain.from_iterable(future.result() for future in futures))
+            pending.popleft()
+    finally:
+        stopped.set()
+        for _, futures in pending:
+            for future in futures:
+                future.cancel()
+        executor.shutdown(wait=True)
+        reader.join()
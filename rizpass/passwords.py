@@ -1,7 +1,12 @@
 import secrets
 from secrets import choice
 from typing import List, Dict, Tuple, Union
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
 import base64
+import hashlib
+import hmac
 import string
 
 from .output import format_colors
@@ -132,19 +137,268 @@ def generate_salt(length: int) -> Union[bytes,None]:
     return secrets.token_bytes(length)
 
 
-def get_custom_key(master_pass: str, salt: bytes) -> bytes:
-    from cryptography.hazmat.primitives import hashes
-    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-    master_pass = bytes(master_pass, "utf-8")
+KDF_PBKDF2 = "pbkdf2-sha256"
+KDF_SCRYPT = "scrypt"
+KDF_PARAM_NAMES: Dict[str, Tuple[str, ...]] = {
+    KDF_PBKDF2: ("iterations", ),
+    KDF_SCRYPT: ("n", "r", "p"),
+}
+# Parameters used for everything encrypted before the KDF became configurable
+LEGACY_KDF_PARAMS: Dict[str, Union[str, int]] = {"kdf": KDF_PBKDF2, "iterations": 100000}
+SALT_HEADER_VERSION = "rp1"
 
-    # Get custom key for Fernet using user's master password
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-    )
-    return kdf.derive(master_pass)
+MIN_PBKDF2_ITERATIONS = 100000
+MIN_SCRYPT_N = 2 ** 14
+# Bounds the memory used by scrypt (128 * n * r bytes) even for parameters read from untrusted files
+MAX_SCRYPT_N = 2 ** 20
+MAX_SCRYPT_R = 32
+MAX_SCRYPT_P = 16
+
+kdf_params: Dict[str, Union[str, int]] = dict(LEGACY_KDF_PARAMS)
+
+
+def validate_kdf_params(params: dict) -> Dict[str, Union[str, int]]:
+    """Returns a copy of the KDF parameters containing only the known fields. Raises ValueError if they are invalid."""
+    ensure_type(params, dict, "params", "dict")
+
+    kdf = params.get("kdf")
+    if kdf not in KDF_PARAM_NAMES:
+        raise ValueError(f"Unsupported key derivation function: {kdf}")
+
+    validated_params: Dict[str, Union[str, int]] = {"kdf": kdf}
+    for name in KDF_PARAM_NAMES[kdf]:
+        value = params.get(name)
+        if type(value) != int or value < 1:
+            raise ValueError(f"Invalid value for the '{name}' parameter of {kdf}: {value}")
+        validated_params[name] = value
+
+    if kdf == KDF_SCRYPT:
+        n, r, p = validated_params["n"], validated_params["r"], validated_params["p"]
+        if n < 2 or n & (n - 1) or n > MAX_SCRYPT_N:
+            raise ValueError(f"The 'n' parameter of {kdf} must be a power of 2 between 2 and 2^20")
+        if r > MAX_SCRYPT_R or p > MAX_SCRYPT_P:
+            raise ValueError(f"The 'r' and 'p' parameters of {kdf} must be at most {MAX_SCRYPT_R} and {MAX_SCRYPT_P}")
+
+    return validated_params
+
+
+def format_kdf_params(params: dict) -> str:
+    """Returns the parameters in the form 'name=value,...' in a fixed order."""
+    return ",".join(f"{name}={params[name]}" for name in KDF_PARAM_NAMES[params["kdf"]])
+
+
+def set_kdf_params(params: dict) -> None:
+    """Sets the KDF parameters used for everything that gets encrypted with a password from now on."""
+    global kdf_params
+    kdf_params = validate_kdf_params(params)
+
+
+def get_kdf_params() -> Dict[str, Union[str, int]]:
+    return dict(kdf_params)
+
+
+def encode_salt(salt: bytes, params: Union[dict, None] = None) -> str:
+    """
+    Encodes the salt of a credential along with the parameters of the KDF used to derive its key.
+    Credentials encrypted with the legacy parameters keep the plain base64 format.
+    """
+    ensure_type(salt, bytes, "salt", "bytes")
+
+    encoded_salt = base64.b64encode(salt).decode("ascii")
+    if params is None or validate_kdf_params(params) == LEGACY_KDF_PARAMS:
+        return encoded_salt
+
+    return f"${SALT_HEADER_VERSION}${params['kdf']}${format_kdf_params(params)}${encoded_salt}"
+
+
+def decode_salt(encoded_salt: str) -> Tuple[bytes, Dict[str, Union[str, int]]]:
+    """Returns the salt and the KDF parameters stored in an encoded salt."""
+    ensure_type(encoded_salt, str, "encoded_salt", "str")
+
+    if not encoded_salt.startswith("$"):
+        return base64.b64decode(encoded_salt), dict(LEGACY_KDF_PARAMS)
+
+    header = encoded_salt.split("$")
+    if len(header) != 5 or header[1] != SALT_HEADER_VERSION:
+        raise ValueError("Unsupported salt header")
+
+    params: Dict[str, Union[str, int]] = {"kdf": header[2]}
+    for param in header[3].split(","):
+        name, _, value = param.partition("=")
+        if not value.isdigit():
+            raise ValueError("Invalid salt header")
+        params[name] = int(value)
+
+    return base64.b64decode(header[4]), validate_kdf_params(params)
+
+
+def derive_key(master_pass: str, salt: bytes, params: dict) -> bytes:
+    """Derives a 32 byte key from the master password using the given KDF parameters. The key cache is not used."""
+    ensure_type(master_pass, str, "master_pass", "str")
+    ensure_type(salt, bytes, "salt", "bytes")
+
+    if params["kdf"] == KDF_SCRYPT:
+        from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+        kdf = Scrypt(salt=salt, length=32, n=params["n"], r=params["r"], p=params["p"])
+    else:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=params["iterations"])
+
+    return kdf.derive(bytes(master_pass, "utf-8"))
+
+
+def time_kdf(params: dict, rounds: int = 3) -> float:
+    """Returns the fastest time in seconds that a key derivation with the given parameters took on this machine."""
+    from time import perf_counter
+
+    params = validate_kdf_params(params)
+    fastest = None
+    for _ in range(rounds):
+        start = perf_counter()
+        derive_key("rizpass calibration", secrets.token_bytes(16), params)
+        elapsed = perf_counter() - start
+        fastest = elapsed if fastest is None else min(fastest, elapsed)
+
+    return fastest
+
+
+def calibrate_kdf_params(kdf: str, target_time: float) -> Dict[str, Union[str, int]]:
+    """
+    Benchmarks this machine and returns the strongest parameters for the given KDF that take about target_time seconds
+    per key derivation. The parameters are never weaker than the legacy ones (PBKDF2) or n=2^14, r=8, p=1 (scrypt).
+    """
+    ensure_type(kdf, str, "kdf", "str")
+    ensure_type(target_time, Union[float, int], "target_time", "float | int")
+
+    if kdf not in KDF_PARAM_NAMES:
+        raise ValueError(f"Unsupported key derivation function: {kdf}")
+    if target_time <= 0:
+        raise ValueError("Invalid value provided for parameter 'target_time'")
+
+    if kdf == KDF_PBKDF2:
+        sample_iterations = 50000
+        time_per_iteration = time_kdf({"kdf": KDF_PBKDF2, "iterations": sample_iterations}) / sample_iterations
+        iterations = int(target_time / time_per_iteration) // 1000 * 1000
+        return {"kdf": KDF_PBKDF2, "iterations": max(iterations, MIN_PBKDF2_ITERATIONS)}
+
+    # The cost of scrypt grows linearly with n, which must be a power of 2
+    n = MIN_SCRYPT_N
+    elapsed = time_kdf({"kdf": KDF_SCRYPT, "n": n, "r": 8, "p": 1})
+    while n < MAX_SCRYPT_N and elapsed * 2 <= target_time:
+        n *= 2
+        elapsed *= 2
+
+    return {"kdf": KDF_SCRYPT, "n": n, "r": 8, "p": 1}
+
+
+class KeyCache:
+    """
+    A bounded LRU cache of keys derived from the master password, keyed by salt and KDF parameters.
+    Entries that have not been used for idle_ttl seconds are dropped. Keys are kept in bytearrays
+    so that they can be overwritten with zeroes when they are evicted or the cache is cleared.
+    """
+
+    def __init__(self, max_size: int = 4096, idle_ttl: Union[float, int, None] = None):
+        ensure_type(max_size, int, "max_size", "int")
+        ensure_type(idle_ttl, Union[float, int, None], "idle_ttl", "float | int | None")
+
+        if max_size < 1:
+            raise ValueError("Invalid value provided for parameter 'max_size'")
+
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.__keys: "OrderedDict[bytes, Tuple[bytearray, float]]" = OrderedDict()
+        self.__lock = Lock()
+        # The master password is bound to each entry through a keyed hash so that it is never stored in the cache
+        self.__secret = secrets.token_bytes(32)
+
+    def __len__(self) -> int:
+        return len(self.__keys)
+
+    def __entry_key(self, master_pass: str, salt: bytes, params: Union[dict, None]) -> bytes:
+        params = params or LEGACY_KDF_PARAMS
+        return (
+            hmac.new(self.__secret, bytes(master_pass, "utf-8"), hashlib.sha256).digest() +
+            bytes(f"{params['kdf']}${format_kdf_params(params)}$", "utf-8") +
+            salt
+        )
+
+    @staticmethod
+    def __wipe(key: bytearray) -> None:
+        key[:] = bytes(len(key))
+
+    def get(self, master_pass: str, salt: bytes, params: Union[dict, None] = None) -> Union[bytes, None]:
+        entry_key = self.__entry_key(master_pass, salt, params)
+
+        with self.__lock:
+            entry = self.__keys.get(entry_key)
+            if entry is None:
+                return None
+
+            key, last_used = entry
+            now = monotonic()
+            if self.idle_ttl is not None and now - last_used > self.idle_ttl:
+                del self.__keys[entry_key]
+                self.__wipe(key)
+                return None
+
+            self.__keys[entry_key] = (key, now)
+            self.__keys.move_to_end(entry_key)
+            return bytes(key)
+
+    def put(self, master_pass: str, salt: bytes, key: bytes, params: Union[dict, None] = None) -> None:
+        entry_key = self.__entry_key(master_pass, salt, params)
+
+        with self.__lock:
+            old_entry = self.__keys.pop(entry_key, None)
+            if old_entry is not None:
+                self.__wipe(old_entry[0])
+
+            self.__keys[entry_key] = (bytearray(key), monotonic())
+
+            while len(self.__keys) > self.max_size:
+                self.__wipe(self.__keys.popitem(last=False)[1][0])
+
+    def clear(self) -> None:
+        with self.__lock:
+            for key, _ in self.__keys.values():
+                self.__wipe(key)
+            self.__keys.clear()
+
+
+key_cache: Union[KeyCache, None] = None
+
+
+def enable_key_cache(max_size: int = 4096, idle_ttl: Union[float, int, None] = None) -> None:
+    """Enables caching of derived keys for the rest of the session. A max_size of 0 disables the cache."""
+    global key_cache
+
+    clear_key_cache()
+    key_cache = KeyCache(max_size, idle_ttl) if max_size > 0 else None
+
+
+def clear_key_cache() -> None:
+    """Wipes all the keys held by the key cache. Must be called when the session ends or the master password changes."""
+    if key_cache is not None:
+        key_cache.clear()
+
+
+def get_custom_key(master_pass: str, salt: bytes, params: Union[dict, None] = None) -> bytes:
+    """Derives a key from the master password with the given KDF parameters (the legacy ones by default)."""
+    params = params or LEGACY_KDF_PARAMS
+
+    if key_cache is not None:
+        cached_key = key_cache.get(master_pass, salt, params)
+        if cached_key is not None:
+            return cached_key
+
+    derived_key = derive_key(master_pass, salt, params)
+
+    if key_cache is not None:
+        key_cache.put(master_pass, salt, derived_key, params)
+
+    return derived_key
 
 
 def generate_salt(length : int) -> bytes:
@@ -152,47 +406,91 @@ def generate_salt(length : int) -> bytes:
     return token_bytes(length)
 
 
-def encrypt_string(master_pass: str, raw_data: str, salt: bytes) -> Union[bytes, None]:
-    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+class VaultKey:
+    """
+    The random data key of a vault. Credentials are encrypted with keys derived from it through HKDF,
+    which is much cheaper than deriving a key from the master password.
+    """
 
-    derived_key = get_custom_key(master_pass, salt)
+    def __init__(self, data_key: bytes):
+        ensure_type(data_key, Union[bytes, bytearray], "data_key", "bytes")
+        if len(data_key) != 32:
+            raise ValueError("Invalid value provided for parameter 'data_key'")
 
-    encrypted_data = AESGCM(derived_key).encrypt(salt, bytes(raw_data, "utf-8"), b"")
+        self.data_key = bytearray(data_key)
 
-    return encrypted_data
+    def get_key(self, salt: bytes) -> bytes:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
+        return HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            info=b"rizpass credential key",
+        ).derive(bytes(self.data_key))
 
-def decrypt_string(master_pass: str, encrypted_data: bytes, salt: bytes) -> Union[str, None]:
+    def wipe(self) -> None:
+        self.data_key[:] = bytes(len(self.data_key))
+
+
+def generate_vault_key() -> VaultKey:
+    return VaultKey(secrets.token_bytes(32))
+
+
+def get_cipher(master_pass: Union[str, VaultKey], salt: bytes, params: Union[dict, None] = None):
+    """
+    Returns an AESGCM instance keyed with the key derived from the master password (or the vault key) and salt.
+    All the fields of a credential share the same salt so a single instance can be reused for all of them.
+    The KDF parameters are ignored for vault keys.
+    """
     from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
-    derived_key = get_custom_key(master_pass, salt)
+    if isinstance(master_pass, VaultKey):
+        return AESGCM(master_pass.get_key(salt))
+
+    return AESGCM(get_custom_key(master_pass, salt, params))
 
-    decrypted_data = AESGCM(derived_key).decrypt(salt, encrypted_data, b"")
+
+def encrypt_string(master_pass: Union[str, VaultKey], raw_data: str, salt: bytes, cipher=None) -> Union[bytes, None]:
+    if cipher is None:
+        cipher = get_cipher(master_pass, salt)
+
+    encrypted_data = cipher.encrypt(salt, bytes(raw_data, "utf-8"), b"")
+
+    return encrypted_data
+
+
+def decrypt_string(master_pass: Union[str, VaultKey], encrypted_data: bytes, salt: bytes, cipher=None) -> Union[str, None]:
+    if cipher is None:
+        cipher = get_cipher(master_pass, salt)
+
+    decrypted_data = cipher.decrypt(salt, encrypted_data, b"")
 
     return str(decrypted_data, "utf-8")
 
 
-def encrypt_and_encode(master_pass: str, data: str, salt: bytes) -> Union[str,None]:
+def encrypt_and_encode(master_pass: Union[str, VaultKey], data: str, salt: bytes, cipher=None) -> Union[str,None]:
     if not data:
         return ''
 
-    ensure_type(master_pass, str, "master_pass", "str")
+    ensure_type(master_pass, Union[str, VaultKey], "master_pass", "str | VaultKey")
     ensure_type(data, str, "data", "str")
     ensure_type(salt, bytes, "salt", "bytes")
 
-    encrypted_data = encrypt_string(master_pass, data, salt)
+    encrypted_data = encrypt_string(master_pass, data, salt, cipher)
 
     return  base64.b64encode(encrypted_data).decode("ascii")
 
 
-def decode_and_decrypt(master_pass: str, data: str, salt: bytes) -> Union[str,None]:
+def decode_and_decrypt(master_pass: Union[str, VaultKey], data: str, salt: bytes, cipher=None) -> Union[str,None]:
     if not data:
         return ''
 
-    ensure_type(master_pass, str, "master_pass", "str")
+    ensure_type(master_pass, Union[str, VaultKey], "master_pass", "str | VaultKey")
     ensure_type(data, str, "data", "str")
     ensure_type(salt, bytes, "salt", "bytes")
 
-    decrypted_data = decrypt_string(master_pass, base64.b64decode(data), salt)
+    decrypted_data = decrypt_string(master_pass, base64.b64decode(data), salt, cipher)
     return decrypted_data if decrypted_data else ""
 
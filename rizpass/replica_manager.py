@@ -0,0 +1,262 @@
+from sys import stderr
+from threading import Event, Lock, Thread
+from typing import Callable, Iterator, List, Union
+
+from .credentials import RawCredential
+from .validator import ensure_type
+from .output import print_red, print_verbose
+from .db_manager import DEFAULT_BATCH_SIZE, DbManager
+from .sqlite_manager import SqliteManager
+
+# Names of the records the replica keeps about itself next to the copies of the metadata of the remote vault
+REPLICA_SOURCE_META = "replica_source"
+REPLICA_MARK_META = "replica_mark"
+DEFAULT_REFRESH_INTERVAL = 30.0
+
+
+class ReplicaManager(DbManager):
+    """
+    Serves reads from a local SQLite copy of a remote vault, so that searching the credentials neither has to wait for
+    the connection to the remote database nor transfer all of them first. The copy holds the credentials as they are
+    stored in the remote database, encrypted with the vault key, and is only readable by the user.
+
+    The remote database is connected to in the background. The copy is then brought up to date with only the credentials
+    that changed since the last sync and refreshed every refresh_interval seconds. Changes are written to the remote
+    database and copied right after, or once the outermost batch is committed.
+
+    Syncs write to the copy through a connection of their own, so that reads never see a sync that is only half applied.
+    """
+
+    def __init__(
+        self,
+        replica: SqliteManager,
+        connect: Callable[[], DbManager],
+        mode: str,
+        source: str,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL
+    ):
+        ensure_type(replica, SqliteManager, "replica", "SqliteManager")
+        ensure_type(mode, str, "mode", "string")
+        ensure_type(source, str, "source", "string")
+        ensure_type(refresh_interval, Union[int, float], "refresh_interval", "float")
+
+        self.replica = replica
+        # Only used by sync, with sync_lock held
+        self.writer = SqliteManager(replica.file_path)
+        self.connect = connect
+        self.mode = mode
+        self.refresh_interval = refresh_interval
+
+        self.remote: Union[DbManager, None] = None
+        self.error: Union[BaseException, None] = None
+        self.connected = Event()
+        self.synced = Event()
+        self.stopped = Event()
+        self.sync_lock = Lock()
+        self.batch_depth = 0
+
+        if replica.get_meta(REPLICA_SOURCE_META) != source:
+            # The copy belongs to another vault, so it is started over
+            with replica.batch():
+                replica.remove_all_credentials()
+                for name in replica.get_meta_names():
+                    replica.remove_meta(name)
+                replica.set_meta(REPLICA_SOURCE_META, source)
+
+        if self.__get_mark() is not None:
+            self.synced.set()
+
+        self.thread = Thread(target=self.__refresh, daemon=True)
+        self.thread.start()
+
+    def __get_mark(self) -> Union[float, None]:
+        mark = self.replica.get_meta(REPLICA_MARK_META)
+        return float(mark) if mark else None
+
+    def __refresh(self) -> None:
+        try:
+            self.remote = self.connect()
+        except BaseException as e:
+            # The remote manager reports why it could not connect, the copy can still be read without it
+            self.error = e
+            self.synced.set()
+            return
+        finally:
+            self.connected.set()
+
+        if self.stopped.is_set():
+            self.remote.close()
+            return
+
+        while not self.stopped.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                self.error = e
+                print_verbose(f"Could not bring the replica up to date: {e}")
+            finally:
+                self.synced.set()
+            self.stopped.wait(self.refresh_interval)
+
+    def __get_remote(self) -> DbManager:
+        """Returns the remote manager once it has connected or raises the reason it could not."""
+        self.connected.wait()
+        if self.remote is None:
+            raise self.error
+        return self.remote
+
+    def __get_replica(self) -> SqliteManager:
+        """Returns the replica once it holds a copy of the vault."""
+        self.synced.wait()
+        if self.__get_mark() is None:
+            raise self.error
+        return self.replica
+
+    def sync(self) -> None:
+        """Copies the changes made to the remote vault since the last sync to the replica."""
+        remote = self.__get_remote()
+
+        with self.sync_lock:
+            mark = self.__get_mark()
+            changes = remote.get_changes(mark)
+            if changes is None:
+                # Storages that do not keep track of changes are copied as a whole every time
+                mark = None
+                changes = (remote.get_all_credentials(), [], 0.0)
+            raw_creds, removed_ids, new_mark = changes
+
+            with self.writer.batch():
+                if mark is None:
+                    self.writer.remove_all_credentials()
+                self.writer.remove_many(removed_ids)
+                self.writer.put_many(raw_creds)
+
+                # Credentials removed without leaving a tombstone behind, e.g. by older versions of rizpass,
+                # are found by comparing the ids whenever the number of credentials differs
+                if self.writer.count() != remote.count():
+                    remote_ids = set(remote.list_ids())
+                    replica_ids = set(self.writer.list_ids())
+                    self.writer.remove_many(sorted(replica_ids - remote_ids))
+                    self.writer.put_many(remote.get_many(sorted(remote_ids - replica_ids)))
+
+                for name in self.writer.get_meta_names():
+                    if name in [REPLICA_SOURCE_META, REPLICA_MARK_META]:
+                        continue
+                    value = remote.get_meta(name)
+                    if value is None:
+                        self.writer.remove_meta(name)
+                    else:
+                        self.writer.set_meta(name, value)
+
+                self.writer.set_meta(REPLICA_MARK_META, repr(new_mark))
+
+    def __changed(self) -> None:
+        # Changes made during a batch are only copied once it has been committed, as it may still be rolled back
+        if not self.batch_depth:
+            self.sync()
+
+    def add_credential(self, title: str, username: str, email: str, password: str, salt: str) -> int:
+        id = self.__get_remote().add_credential(title, username, email, password, salt)
+        self.__changed()
+        return id
+
+    def get_all_credentials(self) -> List[RawCredential]:
+        return self.__get_replica().get_all_credentials()
+
+    def iter_credentials(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[RawCredential]:
+        return self.__get_replica().iter_credentials(batch_size)
+
+    def get_credential(self, id: int) -> Union[RawCredential, None]:
+        return self.__get_replica().get_credential(id)
+
+    def get_many(self, ids: List[int]) -> List[RawCredential]:
+        return self.__get_replica().get_many(ids)
+
+    def exists(self, id: int) -> bool:
+        return self.__get_replica().exists(id)
+
+    def count(self) -> int:
+        return self.__get_replica().count()
+
+    def list_ids(self) -> List[int]:
+        return self.__get_replica().list_ids()
+
+    def remove_credential(self, id: int) -> None:
+        self.__get_remote().remove_credential(id)
+        self.__changed()
+
+    def remove_all_credentials(self) -> None:
+        self.__get_remote().remove_all_credentials()
+        self.__changed()
+
+    def modify_credential(self, id: int, title: str, username: str, email: str, password: str, salt: str) -> None:
+        self.__get_remote().modify_credential(id, title, username, email, password, salt)
+        self.__changed()
+
+    def add_many(self, raw_creds: List[RawCredential]) -> None:
+        self.__get_remote().add_many(raw_creds)
+        self.__changed()
+
+    def modify_many(self, raw_creds: List[RawCredential]) -> None:
+        self.__get_remote().modify_many(raw_creds)
+        self.__changed()
+
+    def remove_many(self, ids: List[int]) -> None:
+        self.__get_remote().remove_many(ids)
+        self.__changed()
+
+    def get_meta(self, name: str) -> Union[str, None]:
+        """Returns the copy of the metadata record if there is one, it is brought up to date by every sync."""
+        ensure_type(name, str, "name", "string")
+
+        value = self.replica.get_meta(name)
+        if value is None:
+            value = self.__get_remote().get_meta(name)
+            if value is not None:
+                self.replica.set_meta(name, value)
+        return value
+
+    def set_meta(self, name: str, value: str) -> None:
+        self.__get_remote().set_meta(name, value)
+        self.replica.set_meta(name, value)
+
+    def add_meta(self, name: str, value: str) -> str:
+        stored_value = self.__get_remote().add_meta(name, value)
+        self.replica.set_meta(name, stored_value)
+        return stored_value
+
+    def begin(self) -> None:
+        self.__get_remote().begin()
+        self.batch_depth += 1
+
+    def commit(self) -> None:
+        if not self.batch_depth:
+            return
+
+        # The batch is over even if the remote cannot commit it
+        self.batch_depth -= 1
+        self.__get_remote().commit()
+        self.__changed()
+
+    def rollback(self) -> None:
+        if not self.batch_depth:
+            return
+
+        self.batch_depth = 0
+        self.__get_remote().rollback()
+
+    def close(self):
+        self.stopped.set()
+        try:
+            # Waits for a sync that is running to finish
+            with self.sync_lock:
+                if self.remote is not None:
+                    self.remote.close()
+                self.writer.close()
+                self.replica.close()
+        except Exception as e:
+            print_red("There was an error while closing the replica:", file=stderr)
+            print_red(e, file=stderr)
+
+    def get_mode(self) -> str:
+        return self.mode
@@ -6,7 +6,7 @@ from sys import exit, argv, stderr
 from typing import Callable, List, Dict, NoReturn, Tuple, Union
 import signal
 
-from .output import print_blue, print_colored, print_red, set_colored_output, set_verbose_output
+from .output import print_blue, print_colored, print_green, print_red, set_colored_output, set_verbose_output
 from . import user_functions
 
 CONFIG_FILE_PATH = os.path.expanduser("~/.rizpass.json")
@@ -14,6 +14,11 @@ CONFIG_FILE_PATH = os.path.expanduser("~/.rizpass.json")
 master_pass:  str = None
 creds_file_path: str = None
 creds_manager = None
+vault_key = None
+agent = None
+
+# Actions that only read credentials, which a running agent can answer without the master password
+AGENT_ACTIONS = [4, 5, 6, 7]
 
 config: Dict[str, str] = {
     "file_path": None,
@@ -21,7 +26,8 @@ config: Dict[str, str] = {
     "db_host": None,
     "db_user": None,
     "db_name": None,
-    "db_port": None
+    "db_port": None,
+    "db_replica": None
 }
 
 
@@ -58,7 +64,8 @@ def load_db_config(
     db_type: Union[str, None] = None,
     db_user: Union[str, None] = None,
     db_name: Union[str, None] = None,
-    db_port: Union[int, None] = None
+    db_port: Union[int, None] = None,
+    db_replica: Union[str, None] = None
 ) -> bool:
     from .validator import validate_config, ensure_type
     from .output import print_yellow
@@ -68,9 +75,10 @@ def load_db_config(
     ensure_type(db_user, Union[str, None], "db_user", "string | None")
     ensure_type(db_name, Union[str, None], "db_name", "string | None")
     ensure_type(db_port, Union[int, None], "db_port", "int | None")
+    ensure_type(db_replica, Union[str, None], "db_replica", "string | None")
 
     # Deal with parameter overrides
-    required_overrides_present = db_host != None and db_type != None and db_user != None and db_name != None
+    required_overrides_present = db_type != None and db_name != None and (db_type == "sqlite" or (db_host != None and db_user != None))
     # overrides = []
     # if db_host:
     #     overrides.append("db_host")
@@ -86,7 +94,7 @@ def load_db_config(
     global config
     user_settings = {}
 
-    if required_overrides_present and db_port == None:
+    if required_overrides_present and db_port == None and db_type != "sqlite":
         print_yellow("Using default value for db_port depending on database")
 
     if not required_overrides_present:
@@ -125,14 +133,19 @@ def load_db_config(
     db_user = db_user or user_settings.get("db_user", None)
     db_name = db_name or user_settings.get("db_name", None)
     db_type = db_type or user_settings.get("db_type", None)
-    db_port = db_port or user_settings.get("db_port", None) or (3306 if db_type == "mysql" else 27017)
+    db_port = db_port or user_settings.get("db_port", None) or {"mysql": 3306, "mongo": 27017}.get(db_type)
+    db_replica = db_replica or user_settings.get("db_replica", None)
 
+    # Fields that have not been set are reported as missing by the validation
     config_validation = validate_config({
-        "db_host":  db_host,
-        "db_user":  db_user,
-        "db_name":  db_name,
-        "db_type":  db_type,
-        "db_port":  db_port,
+        key: value for key, value in {
+            "db_host":  db_host,
+            "db_user":  db_user,
+            "db_name":  db_name,
+            "db_type":  db_type,
+            "db_port":  db_port,
+            "db_replica":  db_replica,
+        }.items() if value is not None
     })
 
     if not config_validation[0]:
@@ -148,6 +161,7 @@ def load_db_config(
     config["db_name"] = db_name
     config["db_type"] = db_type
     config["db_port"] = db_port
+    config["db_replica"] = db_replica
 
     return True
 
@@ -157,16 +171,22 @@ def clear_console() -> None:
 
 
 def signal_handler(signum, frame):
+    from .machine import EXIT_INTERRUPTED
+
     signal.signal(signum, signal.SIG_IGN)
     print("\n\nExiting gracefully...")
-    exit_app(130)
+    exit_app(EXIT_INTERRUPTED)
 
 
 signal.signal(signal.SIGINT, signal_handler)
 
 
 def exit_app(exit_code=0) -> NoReturn:
+    from .passwords import clear_key_cache
+    clear_key_cache()
+    vault_key.wipe() if vault_key else None
     creds_manager.close() if creds_manager else None
+    agent.close() if agent else None
     exit(exit_code)
 
 
@@ -185,18 +205,77 @@ def process_args(args: List[str]) -> Dict[str, str]:
         "db_user": None,
         "db_name": None,
         "db_port": None,
+        "db_replica": None,
         "print_version": False,
         "print_help": False,
         "init_setup": False,
         "file_mode": False,
         "file_path": None,
+        "journal": False,
+        "binary": False,
+        "lazy": False,
+        "convert_format": None,
         "color_mode": True,
         "actions": [],
         "clear_console": False,
         "no_clear_console": False,
         "verbose": False,
+        "key_cache_size": 4096,
+        "key_cache_ttl": None,
+        "workers": None,
+        "db_pool_size": None,
+        "db_cache_size": None,
+        "worker_type": "thread",
+        "agent": False,
+        "agent_timeout": None,
+        "no_agent": False,
+        "batch": False,
+        "output": "jsonl",
+        "master_pass": None,
+        # Parameters of the actions in batch mode
+        "action_params": False,
+        "ids": [],
+        "title": None,
+        "username": None,
+        "email": None,
+        "password": None,
+        "title_contains": None,
+        "username_contains": None,
+        "email_contains": None,
+        "length": None,
+        "uppercase": True,
+        "lowercase": True,
+        "digits": True,
+        "specials": True,
+        "path": None,
+        "file_master_pass": None,
+        "yes": False,
     })
 
+    # Flags that only take a value
+    value_params = {
+        "--title": "title",
+        "--username": "username",
+        "--email": "email",
+        "--title-contains": "title_contains",
+        "--username-contains": "username_contains",
+        "--email-contains": "email_contains",
+        "--path": "path",
+    }
+    # Flags that take where a password is read from, e.g. env:RIZPASS_PASSWORD or fd:3
+    secret_params = {
+        "--master-pass": "master_pass",
+        "--password": "password",
+        "--file-master-pass": "file_master_pass",
+    }
+    # Flags that exclude characters from generated passwords
+    charset_params = {
+        "--no-uppercase": "uppercase",
+        "--no-lowercase": "lowercase",
+        "--no-digits": "digits",
+        "--no-specials": "specials",
+    }
+
     for index, arg in enumerate(args):
         if index in ignore_args:
             continue
@@ -216,6 +295,19 @@ def process_args(args: List[str]) -> Dict[str, str]:
                 exit_app(129)
             ignore_args.add(index + 1)
 
+        elif arg == "--journal":
+            args_dict["journal"] = True
+        elif arg == "--binary":
+            args_dict["binary"] = True
+        elif arg == "--lazy":
+            args_dict["lazy"] = True
+        elif arg == "--convert":
+            args_dict["convert_format"] = get_list_item_safely(args, index + 1)
+            if args_dict["convert_format"] == None or args_dict["convert_format"] not in ["json", "binary"]:
+                print_red("Invalid file format!", file=stderr)
+                exit_app(129)
+            ignore_args.add(index + 1)
+
         elif arg == "--config-file":
             args_dict["config_file_path"] = get_list_item_safely(args, index + 1)
             if args_dict["config_file_path"] == None:
@@ -234,7 +326,7 @@ def process_args(args: List[str]) -> Dict[str, str]:
 
         elif arg == "--db-type":
             args_dict["db_type"] = get_list_item_safely(args, index + 1)
-            if args_dict["db_type"] == None or args_dict["db_type"] not in ["mysql", "mongo"]:
+            if args_dict["db_type"] == None or args_dict["db_type"] not in ["mysql", "mongo", "sqlite"]:
                 print_red("Invalid database type!", file=stderr)
                 exit_app(129)
             ignore_args.add(index + 1)
@@ -261,6 +353,13 @@ def process_args(args: List[str]) -> Dict[str, str]:
             args_dict["db_port"] = int(args_dict["db_port"])
             ignore_args.add(index + 1)
 
+        elif arg == "--db-replica":
+            args_dict["db_replica"] = get_list_item_safely(args, index + 1)
+            if args_dict["db_replica"] == None:
+                print_red("Invalid replica path!", file=stderr)
+                exit_app(129)
+            ignore_args.add(index + 1)
+
         elif arg == "--no-color":
             args_dict["color_mode"] = False
         elif arg == "--clear":
@@ -270,6 +369,119 @@ def process_args(args: List[str]) -> Dict[str, str]:
         elif arg == "--verbose":
             args_dict["verbose"] = True
 
+        elif arg == "--key-cache-size":
+            args_dict["key_cache_size"] = get_list_item_safely(args, index + 1)
+            if args_dict["key_cache_size"] == None or not args_dict["key_cache_size"].isdigit():
+                print_red("Invalid key cache size!", file=stderr)
+                exit_app(129)
+            args_dict["key_cache_size"] = int(args_dict["key_cache_size"])
+            ignore_args.add(index + 1)
+
+        elif arg == "--key-cache-ttl":
+            args_dict["key_cache_ttl"] = get_list_item_safely(args, index + 1)
+            if args_dict["key_cache_ttl"] == None or not args_dict["key_cache_ttl"].isdigit():
+                print_red("Invalid key cache ttl!", file=stderr)
+                exit_app(129)
+            args_dict["key_cache_ttl"] = int(args_dict["key_cache_ttl"])
+            ignore_args.add(index + 1)
+
+        elif arg == "--workers":
+            args_dict["workers"] = get_list_item_safely(args, index + 1)
+            if args_dict["workers"] == None or not args_dict["workers"].isdigit() or int(args_dict["workers"]) < 1:
+                print_red("Invalid number of workers!", file=stderr)
+                exit_app(129)
+            args_dict["workers"] = int(args_dict["workers"])
+            ignore_args.add(index + 1)
+
+        elif arg == "--db-pool-size":
+            args_dict["db_pool_size"] = get_list_item_safely(args, index + 1)
+            if args_dict["db_pool_size"] == None or not args_dict["db_pool_size"].isdigit() or int(args_dict["db_pool_size"]) < 1:
+                print_red("Invalid database pool size!", file=stderr)
+                exit_app(129)
+            args_dict["db_pool_size"] = int(args_dict["db_pool_size"])
+            ignore_args.add(index + 1)
+
+        elif arg == "--db-cache-size":
+            args_dict["db_cache_size"] = get_list_item_safely(args, index + 1)
+            if args_dict["db_cache_size"] == None or not args_dict["db_cache_size"].isdigit():
+                print_red("Invalid database cache size!", file=stderr)
+                exit_app(129)
+            args_dict["db_cache_size"] = int(args_dict["db_cache_size"])
+            ignore_args.add(index + 1)
+
+        elif arg == "--worker-type":
+            args_dict["worker_type"] = get_list_item_safely(args, index + 1)
+            if args_dict["worker_type"] == None or args_dict["worker_type"] not in ["thread", "process"]:
+                print_red("Invalid worker type!", file=stderr)
+                exit_app(129)
+            ignore_args.add(index + 1)
+
+        elif arg == "--agent":
+            args_dict["agent"] = True
+        elif arg == "--no-agent":
+            args_dict["no_agent"] = True
+
+        elif arg == "--agent-timeout":
+            args_dict["agent_timeout"] = get_list_item_safely(args, index + 1)
+            if args_dict["agent_timeout"] == None or not args_dict["agent_timeout"].isdigit() or int(args_dict["agent_timeout"]) < 1:
+                print_red("Invalid agent timeout!", file=stderr)
+                exit_app(129)
+            args_dict["agent_timeout"] = int(args_dict["agent_timeout"])
+            ignore_args.add(index + 1)
+
+        elif arg == "--batch":
+            args_dict["batch"] = True
+
+        elif arg == "--output":
+            args_dict["output"] = get_list_item_safely(args, index + 1)
+            if args_dict["output"] == None or args_dict["output"] not in ["json", "jsonl"]:
+                print_red("Invalid output format!", file=stderr)
+                exit_app(129)
+            args_dict["action_params"] = True
+            ignore_args.add(index + 1)
+
+        elif arg in secret_params:
+            from .machine import is_secret_source
+            args_dict[secret_params[arg]] = get_list_item_safely(args, index + 1)
+            if args_dict[secret_params[arg]] == None or not is_secret_source(args_dict[secret_params[arg]]):
+                print_red(f"Invalid password source for {arg}! Use env:<variable> or fd:<number>", file=stderr)
+                exit_app(129)
+            args_dict["action_params"] = True
+            ignore_args.add(index + 1)
+
+        elif arg == "--id":
+            id = get_list_item_safely(args, index + 1)
+            if id == None or (id != "-" and (not id.isdigit() or int(id) < 1)):
+                print_red("Invalid credential id!", file=stderr)
+                exit_app(129)
+            args_dict["ids"].append(id if id == "-" else int(id))
+            args_dict["action_params"] = True
+            ignore_args.add(index + 1)
+
+        elif arg in value_params:
+            args_dict[value_params[arg]] = get_list_item_safely(args, index + 1)
+            if args_dict[value_params[arg]] == None:
+                print_red(f"Invalid value for {arg}!", file=stderr)
+                exit_app(129)
+            args_dict["action_params"] = True
+            ignore_args.add(index + 1)
+
+        elif arg == "--length":
+            args_dict["length"] = get_list_item_safely(args, index + 1)
+            if args_dict["length"] == None or not args_dict["length"].isdigit() or int(args_dict["length"]) < 1:
+                print_red("Invalid password length!", file=stderr)
+                exit_app(129)
+            args_dict["length"] = int(args_dict["length"])
+            args_dict["action_params"] = True
+            ignore_args.add(index + 1)
+
+        elif arg in charset_params:
+            args_dict[charset_params[arg]] = False
+            args_dict["action_params"] = True
+        elif arg == "--yes":
+            args_dict["yes"] = True
+            args_dict["action_params"] = True
+
         elif arg == "generate-strong":
             args_dict["actions"].append(1)
         elif arg == "generate":
@@ -300,11 +512,17 @@ def process_args(args: List[str]) -> Dict[str, str]:
             args_dict["actions"].append(14)
         elif arg == "pass-checkup":
             args_dict["actions"].append(15)
+        elif arg == "calibrate":
+            args_dict["actions"].append(16)
         else:
             print_red(f"Invalid argument: {arg}", file=stderr)
             print_help(True)
             exit_app(129)
 
+    if args_dict["action_params"] and not args_dict["batch"]:
+        print_red("Action parameters can only be used with --batch!", file=stderr)
+        exit_app(129)
+
     return args_dict
 
 
@@ -340,41 +558,189 @@ def handle_processed_args(options: Dict[str, str]) -> None:
     if options.get("verbose"):
         set_verbose_output(True)
 
+    from .passwords import enable_key_cache
+    enable_key_cache(options.get("key_cache_size", 4096), options.get("key_cache_ttl"))
+
+    from .parallel import set_workers
+    set_workers(options.get("workers"), options.get("worker_type", "thread"))
+
     if options.get("file_mode"):
         config["file_path"] = options.get("file_path")
+        config["journal"] = options.get("journal", False)
+        config["binary"] = options.get("binary", False)
+        config["lazy"] = options.get("lazy", False)
     else:
+        config["db_pool_size"] = options.get("db_pool_size")
+        config["db_cache_size"] = options.get("db_cache_size")
         exit(1) if not load_db_config(
             options.get("db_host"),
             options.get("db_type"),
             options.get("db_user"),
             options.get("db_name"),
             options.get("db_port"),
+            options.get("db_replica"),
         ) else None
 
+    if options.get("convert_format"):
+        if not options.get("file_mode"):
+            print_red("Only credential files can be converted!", file=stderr)
+            exit_app(129)
+
+        if not os.path.isfile(config["file_path"]):
+            print_red(f"\"{config['file_path']}\" does not exist!", file=stderr)
+            exit_app(1)
+
+        # The credentials stay encrypted, so no master password is needed
+        from .file_manager import convert_file
+        convert_file(config["file_path"], options.get("convert_format") == "binary")
+        print_green(f"Converted '{config['file_path']}' to the {options.get('convert_format')} format!")
+        exit_app(0)
+
+    if options.get("batch"):
+        run_batch(options)
+
+    global master_pass, creds_manager, vault_key, agent
+
+    actions = options.get("actions", [])
+    if actions and all(action in AGENT_ACTIONS for action in actions) and not options.get("agent") and not options.get("no_agent"):
+        from .agent import connect_agent
+        agent = connect_agent(source=get_vault_source())
+
     # Print license
     print_license()
     print()
 
-    # Login
-    global master_pass, creds_manager
+    if agent is not None:
+        print_blue("Running in action mode using the agent...\n")
+        user_functions.init(exit_app, config, None, agent)
+        run_actions(options)
 
+    # Login
     options.get("actions") and print_blue("Running in action mode...\n")
     master_pass = getpass("Master Password: ")
 
     setup_creds_manager()
 
-    user_functions.init(exit_app, config)
+    from .vault import unlock_vault
+    vault_key = unlock_vault(master_pass, creds_manager)
+    if vault_key is None:
+        print_red("Incorrect master password!", file=stderr)
+        exit_app(1)
 
-    action_len = len(options.get("actions", []))
+    user_functions.init(exit_app, config, vault_key)
+
+    if options.get("agent"):
+        start_agent(options.get("agent_timeout"))
 
     if options.get("actions"):
-        for index, action in enumerate(options.get("actions")):
-            print_blue(f"\nBegin action no: {index + 1} Remaining actions: {action_len - index - 1}\n")
-            menu_items[action][1](master_pass, creds_manager)
+        run_actions(options)
+
+
+def run_actions(options: Dict[str, str]) -> NoReturn:
+    action_len = len(options.get("actions", []))
+
+    for index, action in enumerate(options.get("actions")):
+        print_blue(f"\nBegin action no: {index + 1} Remaining actions: {action_len - index - 1}\n")
+        menu_items[action][1](master_pass, creds_manager)
+
+    if options.get("clear_console"):
+        clear_console()
+    exit_app()
+
+
+def run_batch(options: Dict[str, str]) -> NoReturn:
+    """
+    Runs the actions without asking anything, using the parameters given as flags. Only the results are written to
+    stdout, as JSON, and the exit code tells how the actions went, see machine.py.
+    """
+    from contextlib import redirect_stdout
+    from sys import stdout
+    from .machine import BATCH_ACTIONS, EXIT_AUTH, EXIT_OK, EXIT_USAGE, RecordWriter, read_secret, run_action
+
+    global master_pass, creds_manager, vault_key, agent
+
+    set_colored_output(False)
+
+    actions = options.get("actions", [])
+    if not actions:
+        print_red("No actions to run!", file=stderr)
+        exit_app(EXIT_USAGE)
 
-        if options.get("clear_console"):
-            clear_console()
-        exit_app()
+    for action in actions:
+        if action not in BATCH_ACTIONS:
+            print_red(f"'{menu_items[action][0]}' cannot be run with --batch!", file=stderr)
+            exit_app(EXIT_USAGE)
+
+    writer = RecordWriter(options.get("output"), stdout)
+
+    # Anything else that would be printed goes to stderr, so that stdout only holds the results
+    with redirect_stdout(stderr):
+        if all(action in AGENT_ACTIONS for action in actions) and not options.get("no_agent"):
+            from .agent import connect_agent
+            agent = connect_agent(source=get_vault_source())
+
+        if agent is not None:
+            user_functions.init(exit_app, config, None, agent)
+        else:
+            if not options.get("master_pass"):
+                print_red("The master password is needed, use --master-pass env:<variable> or --master-pass fd:<number>", file=stderr)
+                exit_app(EXIT_USAGE)
+
+            master_pass = read_secret(options.get("master_pass"))
+            if not master_pass:
+                print_red("Could not read the master password!", file=stderr)
+                exit_app(EXIT_AUTH)
+
+            setup_creds_manager()
+
+            from .vault import unlock_vault
+            vault_key = unlock_vault(master_pass, creds_manager)
+            if vault_key is None:
+                print_red("Incorrect master password!", file=stderr)
+                exit_app(EXIT_AUTH)
+
+            user_functions.init(exit_app, config, vault_key)
+
+        for action in actions:
+            exit_code = run_action(action, options, master_pass, creds_manager, writer)
+            if exit_code != EXIT_OK:
+                exit_app(exit_code)
+
+    exit_app(EXIT_OK)
+
+
+def get_vault_source() -> str:
+    """Returns the name of the vault the config points to, which tells whether a running agent holds it."""
+    if config.get("file_path"):
+        return "file://" + os.path.abspath(config.get("file_path"))
+
+    if config.get("db_type") == "sqlite":
+        return "sqlite://" + os.path.abspath(config.get("db_name"))
+
+    return f"{config.get('db_type')}://{config.get('db_user')}@{config.get('db_host')}:{config.get('db_port')}/{config.get('db_name')}"
+
+
+def start_agent(idle_timeout: Union[int, None] = None) -> NoReturn:
+    """Keeps the vault unlocked and answers requests from other rizpass processes until the agent has been idle for too long."""
+    from .agent import Agent, AgentError, DEFAULT_IDLE_TIMEOUT, get_socket_path, is_agent_supported
+
+    if not is_agent_supported():
+        print_red("The agent is not supported on this platform!", file=stderr)
+        exit_app(1)
+
+    socket_path = get_socket_path()
+    print_green(f"Agent listening on {socket_path}")
+    print_blue("Press Ctrl+C to stop it")
+
+    try:
+        Agent(vault_key, creds_manager, get_vault_source(), idle_timeout or DEFAULT_IDLE_TIMEOUT).serve(socket_path)
+    except (AgentError, OSError) as e:
+        print_red("Could not run the agent due to the following error:", file=stderr)
+        print_red(e, file=stderr)
+        exit_app(1)
+
+    print_blue("The agent has been idle for too long, stopping it")
+    exit_app(0)
 
 
 def setup_creds_manager():
@@ -382,24 +748,21 @@ def setup_creds_manager():
 
     if config.get("file_path"):
         from .file_manager import FileManager
-        creds_manager = FileManager(config.get("file_path"))
+        creds_manager = FileManager(
+            config.get("file_path"),
+            config.get("journal", False),
+            config.get("binary", False),
+            config.get("lazy", False)
+        )
         return
 
-    from .db_manager import DbConfig
-    db_config = DbConfig(
-        config.get("db_host"),
-        config.get("db_user"),
-        master_pass,
-        config.get("db_name"),
-        config.get("db_port")
-    )
+    if config.get("db_type") == "sqlite":
+        from .sqlite_manager import SqliteManager
+        creds_manager = SqliteManager(config.get("db_name"))
+        return
 
-    if config.get("db_type") == "mysql":
-        from .mysql_manager import MysqlManager
-        creds_manager = MysqlManager(db_config)
-    else:
-        from .mongo_manager import MongoManager
-        creds_manager = MongoManager(db_config)
+    from .db_manager import open_remote_manager
+    creds_manager = open_remote_manager(config, master_pass)
 
 
 menu_items: Dict[str, Tuple[str, Callable]] = {
@@ -418,7 +781,8 @@ menu_items: Dict[str, Tuple[str, Callable]] = {
     13: ("Import credentials from a JSON file", user_functions.import_credentials),
     14: ("List all raw credentials", user_functions.get_all_raw_credentials),
     15: ("Password checkup", user_functions.password_checkup),
-    16: ("Exit", lambda x, y: exit_app()),
+    16: ("Calibrate key derivation", user_functions.calibrate_kdf),
+    17: ("Exit", lambda x, y: exit_app()),
 
 
 }
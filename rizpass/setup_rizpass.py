@@ -27,6 +27,7 @@ def setup_mysql():
     from .better_input import better_input
     from .output import print_verbose, print_colored
     from .passwords import encrypt_and_encode, generate_salt
+    from .mysql_manager import CREATE_META_TABLE_QUERY, CREATE_TOMBSTONES_TABLE_QUERY
 
     global config
 
@@ -102,9 +103,14 @@ def setup_mysql():
             email VARCHAR({field_len}),
             password VARCHAR({field_len}) NOT NULL,
             salt VARCHAR(25) NOT NULL,
-            PRIMARY KEY( id ));"""
+            version INT NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+            PRIMARY KEY( id ),
+            INDEX( updated_at ));"""
         db_cursor.execute(createTableQuery)
-        print_green("Database table created!")
+        db_cursor.execute(CREATE_META_TABLE_QUERY)
+        db_cursor.execute(CREATE_TOMBSTONES_TABLE_QUERY)
+        print_green("Database tables created!")
 
         # Close the connection to database with root login
         db_cursor.close()
@@ -182,6 +188,12 @@ def setup_mongodb():
         db_db.create_collection("credentials")
         print_green("New database collection 'credentials' created!")
 
+        db_db.create_collection("vault_meta")
+        print_green("New database collection 'vault_meta' created!")
+
+        db_db.create_collection("credential_tombstones")
+        print_green("New database collection 'credential_tombstones' created!")
+
         # Close the connection to database with root login
         db_client.close()
 
@@ -200,6 +212,38 @@ def setup_mongodb():
         exit(1)
 
 
+def setup_sqlite():
+    from .better_input import better_input
+    from .sqlite_manager import SqliteManager
+
+    global config
+
+    try:
+        db_path = better_input(
+            prompt="Database file path (Optional, Default: ~/.rizpass.db): ",
+            optional=True,
+            attempts=1
+        ) or "~/.rizpass.db"
+        db_path = path.expanduser(db_path)
+
+        if path.isfile(db_path):
+            print_yellow(f"Using existing database: {db_path}")
+
+        # Creates the database and its tables
+        SqliteManager(db_path).close()
+        print_green("Database tables created!")
+
+        config["db_type"] = "sqlite"
+        config["db_name"] = db_path
+
+        print_green("Database setup successful!")
+    except Exception as e:
+        print_red("Database setup failed!", file=stderr)
+        print_red(e, file=stderr)
+        print("Exiting!")
+        exit(1)
+
+
 def setup_masterpass():
     # TODO: Print some guidlines for the password to follow and make sure that the master password input is strong
     global config, master_pass
@@ -246,9 +290,11 @@ def setup_password_manager():
 
     setup_masterpass()
 
-    db_type = input("Database type (MySQL/Mongo): ").lower()
+    db_type = input("Database type (MySQL/Mongo/SQLite): ").lower()
     if db_type == "mongo":
         setup_mongodb()
+    elif db_type == "sqlite":
+        setup_sqlite()
     else:
         setup_mysql()
 
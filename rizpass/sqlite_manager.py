@@ -0,0 +1,292 @@
+from sys import exit, stderr
+from os import O_CREAT, O_WRONLY, close as close_fd, open as open_fd, path
+from threading import RLock
+from typing import Dict, Iterator, List, Union
+
+from .credentials import RawCredential
+from .validator import ensure_type
+from .output import format_colors, print_red, print_verbose
+from .db_manager import DEFAULT_BATCH_SIZE, DbManager, iter_chunks
+
+# AUTOINCREMENT makes sure that the ids of removed credentials are never handed out again
+CREATE_CREDENTIALS_TABLE_QUERY = """CREATE TABLE IF NOT EXISTS credentials(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    username TEXT NOT NULL,
+    email TEXT NOT NULL,
+    password TEXT NOT NULL,
+    salt TEXT NOT NULL)"""
+CREATE_META_TABLE_QUERY = """CREATE TABLE IF NOT EXISTS vault_meta(
+    name TEXT NOT NULL PRIMARY KEY,
+    value TEXT NOT NULL) WITHOUT ROWID"""
+
+INSERT_CREDENTIAL_QUERY = "INSERT INTO credentials(title, username, email, password, salt) VALUES(?, ?, ?, ?, ?)"
+PUT_CREDENTIAL_QUERY = "INSERT OR REPLACE INTO credentials(id, title, username, email, password, salt) VALUES(?, ?, ?, ?, ?, ?)"
+SELECT_ALL_CREDENTIALS_QUERY = "SELECT id, title, username, email, password, salt FROM credentials ORDER BY id"
+SELECT_CREDENTIAL_QUERY = "SELECT id, title, username, email, password, salt FROM credentials WHERE id = ?"
+SELECT_CREDENTIALS_QUERY = "SELECT id, title, username, email, password, salt FROM credentials WHERE id IN ({})"
+CREDENTIAL_EXISTS_QUERY = "SELECT EXISTS(SELECT 1 FROM credentials WHERE id = ?)"
+COUNT_CREDENTIALS_QUERY = "SELECT COUNT(*) FROM credentials"
+SELECT_IDS_QUERY = "SELECT id FROM credentials ORDER BY id"
+DELETE_CREDENTIAL_QUERY = "DELETE FROM credentials WHERE id = ?"
+DELETE_ALL_CREDENTIALS_QUERY = "DELETE FROM credentials"
+UPDATE_CREDENTIAL_QUERY = "UPDATE credentials SET title = ?, username = ?, email = ?, password = ?, salt = ? WHERE id = ?"
+SELECT_META_QUERY = "SELECT value FROM vault_meta WHERE name = ?"
+UPSERT_META_QUERY = "INSERT INTO vault_meta(name, value) VALUES(?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value"
+SELECT_META_NAMES_QUERY = "SELECT name FROM vault_meta ORDER BY name"
+DELETE_META_QUERY = "DELETE FROM vault_meta WHERE name = ?"
+
+# Older versions of SQLite do not allow more than 999 variables in a query
+MAX_QUERY_VARIABLES = 999
+# Milliseconds to wait for another rizpass process to finish writing before giving up
+BUSY_TIMEOUT = 5000
+
+
+class SqliteManager(DbManager):
+    """
+    Stores the credentials in a SQLite database. The database uses write-ahead logging, so any number of rizpass processes
+    can read it while another one writes to it and a crash never leaves it half written.
+    """
+
+    def __init__(self, file_path: str):
+        import sqlite3
+        ensure_type(file_path, str, "file_path", "string")
+
+        self.file_path = path.expanduser(file_path)
+        self.lock = RLock()
+        self.transaction_depth = 0
+
+        print_verbose("Begin opening the sqlite database!")
+        try:
+            if not path.isfile(self.file_path):
+                # The database holds encrypted credentials, so only the user should be able to read it
+                close_fd(open_fd(self.file_path, O_WRONLY | O_CREAT, 0o600))
+
+            # Transactions are started explicitly by begin, everything else is committed right away.
+            # The connection is shared with the threads that read credentials in the background, see parallel.pipeline_map
+            self.connection = sqlite3.connect(self.file_path, isolation_level=None, check_same_thread=False)
+            self.connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT}")
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            # Every commit is flushed to the disk, so a credential that has been added is never lost to a power failure
+            self.connection.execute("PRAGMA synchronous = FULL")
+            self.connection.execute(CREATE_CREDENTIALS_TABLE_QUERY)
+            self.connection.execute(CREATE_META_TABLE_QUERY)
+        except Exception as e:
+            print()
+            print_red("There was an error while opening the SQLite database:", file=stderr)
+            print_red(e, file=stderr)
+            print()
+            print_red("Exiting with code 1!", file=stderr)
+            exit(1)
+        else:
+            print_verbose(format_colors("{green}Database opened successfully!{reset}"))
+
+    def execute(self, query: str, args: tuple = ()):
+        """
+        Executes the query with the args bound to its placeholders and returns the cursor.
+        The sqlite3 module keeps the compiled queries around, so every query is only compiled once.
+        """
+        print_verbose("Begin execution of query: ")
+        print_verbose(query)
+
+        with self.lock:
+            cursor = self.connection.execute(query, args)
+
+        print_verbose(format_colors("{green}Query executed successfully!{reset}"))
+        return cursor
+
+    def begin(self) -> None:
+        """
+        Starts a transaction. Transactions can be nested, in which case the changes are committed when the outermost one is.
+        The database is locked for writing until the transaction ends.
+        """
+        with self.lock:
+            if not self.transaction_depth:
+                # Taking the write lock right away means the transaction never has to wait for it halfway through
+                self.connection.execute("BEGIN IMMEDIATE")
+            self.transaction_depth += 1
+
+    def commit(self) -> None:
+        with self.lock:
+            if not self.transaction_depth:
+                return
+
+            self.transaction_depth -= 1
+            if not self.transaction_depth:
+                self.connection.execute("COMMIT")
+
+    def rollback(self) -> None:
+        """Ends all transactions and discards the changes made during them."""
+        with self.lock:
+            if not self.transaction_depth:
+                return
+
+            self.transaction_depth = 0
+            self.connection.execute("ROLLBACK")
+
+    def add_credential(self, title: str, username: str, email: str, password: str, salt: str) -> int:
+        """This method takes in the encrypted and encoded credentials and adds them to the database."""
+        ensure_type(title, str, "title", "string")
+        ensure_type(username, str, "username", "string")
+        ensure_type(email, str, "email", "string")
+        ensure_type(password, str, "password", "string")
+        ensure_type(salt, str, "salt", "string")
+
+        return self.execute(INSERT_CREDENTIAL_QUERY, (title, username, email, password, salt)).lastrowid
+
+    def get_all_credentials(self) -> List[RawCredential]:
+        return list(self.iter_credentials())
+
+    def iter_credentials(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[RawCredential]:
+        """Yields the credentials sorted by id, fetching batch_size rows at a time."""
+        ensure_type(batch_size, int, "batch_size", "int")
+
+        cursor = self.execute(SELECT_ALL_CREDENTIALS_QUERY)
+        try:
+            while True:
+                with self.lock:
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for i in rows:
+                    yield RawCredential(i[0], i[1], i[2], i[3], i[4], i[5])
+        finally:
+            with self.lock:
+                cursor.close()
+
+    def get_credential(self, id: int) -> Union[RawCredential, None]:
+        ensure_type(id, int, "id", "int")
+
+        query_result = self.execute(SELECT_CREDENTIAL_QUERY, (id, )).fetchone()
+        if not query_result:
+            return None
+
+        return RawCredential(
+            query_result[0],
+            query_result[1],
+            query_result[2],
+            query_result[3],
+            query_result[4],
+            query_result[5]
+        )
+
+    def get_many(self, ids: List[int]) -> List[RawCredential]:
+        ensure_type(ids, list, "ids", "list")
+        for id in ids:
+            ensure_type(id, int, "id", "int")
+
+        raw_creds: Dict[int, RawCredential] = dict()
+        for chunk in iter_chunks(ids, MAX_QUERY_VARIABLES):
+            query = SELECT_CREDENTIALS_QUERY.format(", ".join(["?"] * len(chunk)))
+            for i in self.execute(query, tuple(chunk)).fetchall():
+                raw_creds[i[0]] = RawCredential(i[0], i[1], i[2], i[3], i[4], i[5])
+
+        return [raw_creds[id] for id in ids if id in raw_creds]
+
+    def exists(self, id: int) -> bool:
+        ensure_type(id, int, "id", "int")
+
+        return bool(self.execute(CREDENTIAL_EXISTS_QUERY, (id, )).fetchone()[0])
+
+    def count(self) -> int:
+        return self.execute(COUNT_CREDENTIALS_QUERY).fetchone()[0]
+
+    def list_ids(self) -> List[int]:
+        return [i[0] for i in self.execute(SELECT_IDS_QUERY).fetchall()]
+
+    def remove_credential(self, id: int) -> None:
+        ensure_type(id, int, "id", "int")
+
+        self.execute(DELETE_CREDENTIAL_QUERY, (id, ))
+
+    def remove_all_credentials(self) -> None:
+        self.execute(DELETE_ALL_CREDENTIALS_QUERY)
+
+    def modify_credential(self, id: int, title: str, username: str, email: str, password: str, salt: str) -> None:
+        ensure_type(id, int, "id", "int")
+        ensure_type(title, str, "title", "string")
+        ensure_type(username, str, "username", "string")
+        ensure_type(email, str, "email", "string")
+        ensure_type(password, str, "password", "string")
+        ensure_type(salt, str, "salt", "string")
+
+        self.execute(UPDATE_CREDENTIAL_QUERY, (title, username, email, password, salt, id))
+
+    def __execute_many(self, query: str, args: List[tuple]) -> None:
+        print_verbose(f"Begin execution of query for {len(args)} row(s): ")
+        print_verbose(query)
+
+        with self.lock:
+            self.connection.executemany(query, args)
+
+        print_verbose(format_colors("{green}Query executed successfully!{reset}"))
+
+    def add_many(self, raw_creds: List[RawCredential]) -> None:
+        """Adds the encrypted credentials in a single transaction. The ids of the given credentials are ignored."""
+        ensure_type(raw_creds, list, "raw_creds", "list")
+
+        with self.batch():
+            self.__execute_many(INSERT_CREDENTIAL_QUERY, [
+                (raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt) for raw_cred in raw_creds
+            ])
+
+    def modify_many(self, raw_creds: List[RawCredential]) -> None:
+        ensure_type(raw_creds, list, "raw_creds", "list")
+
+        with self.batch():
+            self.__execute_many(UPDATE_CREDENTIAL_QUERY, [
+                (raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt, raw_cred.id) for raw_cred in raw_creds
+            ])
+
+    def put_many(self, raw_creds: List[RawCredential]) -> None:
+        """Adds the encrypted credentials with their own ids in a single transaction, replacing the credentials that already have them."""
+        ensure_type(raw_creds, list, "raw_creds", "list")
+
+        with self.batch():
+            self.__execute_many(PUT_CREDENTIAL_QUERY, [
+                (raw_cred.id, raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt) for raw_cred in raw_creds
+            ])
+
+    def remove_many(self, ids: List[int]) -> None:
+        ensure_type(ids, list, "ids", "list")
+        for id in ids:
+            ensure_type(id, int, "id", "int")
+
+        with self.batch():
+            self.__execute_many(DELETE_CREDENTIAL_QUERY, [(id, ) for id in ids])
+
+    def get_meta(self, name: str) -> Union[str, None]:
+        ensure_type(name, str, "name", "string")
+
+        query_result = self.execute(SELECT_META_QUERY, (name, )).fetchone()
+        return query_result[0] if query_result else None
+
+    def set_meta(self, name: str, value: str) -> None:
+        ensure_type(name, str, "name", "string")
+        ensure_type(value, str, "value", "string")
+
+        self.execute(UPSERT_META_QUERY, (name, value))
+
+    def get_meta_names(self) -> List[str]:
+        return [i[0] for i in self.execute(SELECT_META_NAMES_QUERY).fetchall()]
+
+    def remove_meta(self, name: str) -> None:
+        ensure_type(name, str, "name", "string")
+
+        self.execute(DELETE_META_QUERY, (name, ))
+
+    def close(self):
+        try:
+            if hasattr(self, "connection"):
+                self.rollback()
+                self.connection.close()
+                del self.connection
+        except Exception as e:
+            print_red("There was an error while closing the SQLite database:", file=stderr)
+            print_red(e, file=stderr)
+
+    def get_mode(self) -> str:
+        return "sqlite"
+
+    def __del__(self):
+        self.close()
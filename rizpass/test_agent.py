@@ -0,0 +1,102 @@
+import unittest
+import tempfile
+import socket
+import shutil
+import os
+import gc
+import warnings
+import io
+from unittest.mock import patch
+from threading import Thread
+
+from .agent import Agent, AgentError, connect_agent, is_agent_supported
+from .credentials import Credential, DecryptionError, encrypt_credentials
+from .memory_manager import MemoryManager
+from .vault import unlock_vault
+
+
+@unittest.skipUnless(is_agent_supported(), "Unix domain sockets are not supported")
+class TestAgent(unittest.TestCase):
+    def setUp(self):
+        self.manager = MemoryManager(encrypt_credentials("Master Password", [
+            Credential(1, "Test Title", "Test Username", "test@example.com", "Test Password"),
+            Credential(2, "Other Title", "Other Username", "other@example.com", "Other Password"),
+        ]))
+        self.agent = Agent(unlock_vault("Master Password", self.manager), self.manager, "memory://test", 5)
+
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, "agent.sock")
+        self.thread = Thread(target=self.agent.serve, args=(self.socket_path, ), daemon=True)
+        self.thread.start()
+        self.client = self.wait_for_agent()
+
+    def tearDown(self):
+        self.client.close()
+        # Stops the agent right away
+        self.agent.idle_timeout = 0
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as wake:
+            wake.connect(self.socket_path)
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def wait_for_agent(self):
+        for _ in range(100):
+            client = connect_agent(self.socket_path, "memory://test")
+            if client is not None:
+                return client
+            self.thread.join(0.01)
+        self.fail("The agent did not start")
+
+    def test_get(self):
+        cred = self.client.get_credential(2)
+        self.assertEqual((cred.title, cred.username, cred.password), ("Other Title", "Other Username", "Other Password"))
+        self.assertIsNone(self.client.get_credential(3))
+        self.assertRaises(TypeError, lambda: self.client.get_credential("2"))
+
+    def test_list(self):
+        self.assertEqual([(cred.title, decrypted) for cred, decrypted in self.client.get_credentials()], [("Test Title", True), ("Other Title", True)])
+        self.assertEqual([cred.id for cred, _ in self.client.get_credentials("other", "", "EXAMPLE")], [2])
+        self.assertEqual(self.client.get_credentials("", "", "missing"), [])
+
+    def test_undecryptable(self):
+        raw_cred = self.manager.get_credential(2)
+        self.manager.modify_credential(2, raw_cred.title, raw_cred.username, raw_cred.email, "SW52YWxpZA==", raw_cred.salt)
+
+        with patch("rizpass.credentials.stderr", io.StringIO()), patch("sys.stdout", io.StringIO()):
+            # The error placeholders are never handed out as the credential
+            self.assertRaises(DecryptionError, lambda: self.client.get_credential(2))
+            self.assertEqual([(cred.id, decrypted) for cred, decrypted in self.client.get_credentials("", "", "missing")], [(2, False)])
+        self.assertEqual(self.client.get_credential(1).title, "Test Title")
+
+    def test_invalid_requests(self):
+        self.assertRaises(AgentError, lambda: self.client.request("remove", id=1))
+        self.assertRaises(AgentError, lambda: self.client.request("get", id="1"))
+        # The connection can still be used after a request failed
+        self.assertEqual(self.client.get_credential(1).title, "Test Title")
+
+    def test_other_vault(self):
+        self.assertIsNone(connect_agent(self.socket_path, "memory://other"))
+        self.assertIsNone(connect_agent(os.path.join(self.directory, "missing.sock")))
+
+    def test_single_agent(self):
+        other_agent = Agent(self.agent.vault_key, self.manager, "memory://test", 5)
+        self.assertRaises(AgentError, lambda: other_agent.serve(self.socket_path))
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o077, 0)
+
+    def test_failed_ping(self):
+        # A server that hangs up without answering, e.g. one that is not an agent
+        socket_path = os.path.join(self.directory, "other.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(socket_path)
+            server.listen()
+            thread = Thread(target=lambda: server.accept()[0].close())
+            thread.start()
+
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always", ResourceWarning)
+                self.assertIsNone(connect_agent(socket_path))
+                gc.collect()
+            thread.join()
+
+        # The connection is closed rather than left to the garbage collector
+        self.assertFalse([warning for warning in caught if socket_path in str(warning.message)])
@@ -0,0 +1,59 @@
+import unittest
+import tempfile
+import os
+from time import time
+
+from .binary_vault import BinaryVault, HEADER, decode_record, encode_field, encode_record, is_binary_vault, write_binary_vault
+from .credentials import Credential, RawCredential
+from .passwords import generate_salt, generate_vault_key
+
+TEMP_FILE_PATH = f"{tempfile.gettempdir()}/rizpass_test_binary_vault_{int(time())}.bin"
+
+
+class TestBinaryVault(unittest.TestCase):
+    def tearDown(self):
+        if os.path.isfile(TEMP_FILE_PATH):
+            os.remove(TEMP_FILE_PATH)
+
+    def test_encode_field(self):
+        # Base64 is stored as the raw bytes it encodes, anything else as it is
+        self.assertEqual(len(encode_field("AAAAAAAA")), 5 + 6)
+        self.assertEqual(len(encode_field("Test Title")), 5 + 10)
+
+    def test_encode_and_decode_record(self):
+        vault_key = generate_vault_key()
+        raw_creds = [
+            Credential(1, "title", "username", "email", "password").get_raw_credential(vault_key, generate_salt(16)),
+            Credential(2, "", "", "", "").get_raw_credential("123", generate_salt(16)),
+            RawCredential(3, "Test Title", "Test Username", "AAA=", "Test Password ü", "$rp1$scrypt$n=1024,r=8,p=1$AAAA"),
+        ]
+
+        for raw_cred in raw_creds:
+            self.assertEqual(decode_record(raw_cred.id, encode_record(raw_cred)).get_obj(), raw_cred.get_obj())
+
+    def test_write_and_read(self):
+        raw_creds = [RawCredential(id, f"Test Title {id}", "Test Username", "Test Email", "Test Password", "Test Salt") for id in [2, 5, 7]]
+
+        with open(TEMP_FILE_PATH, "wb") as file:
+            write_binary_vault(file, [(raw_cred.id, encode_record(raw_cred)) for raw_cred in raw_creds], {"Test Meta": "Test Value"}, 9)
+
+        self.assertTrue(is_binary_vault(TEMP_FILE_PATH))
+        binary_vault = BinaryVault(TEMP_FILE_PATH)
+        self.assertEqual(binary_vault.get_ids(), [2, 5, 7])
+        self.assertEqual(binary_vault.next_id, 9)
+        self.assertEqual(binary_vault.meta, {"Test Meta": "Test Value"})
+        self.assertEqual(binary_vault.get_credential(5).get_obj(), raw_creds[1].get_obj())
+        binary_vault.close()
+
+    def test_unsupported_version(self):
+        with open(TEMP_FILE_PATH, "wb") as file:
+            write_binary_vault(file, [], {}, 1)
+            file.seek(4)
+            file.write(b"\x02\x00")
+
+        with self.assertRaises(ValueError):
+            BinaryVault(TEMP_FILE_PATH)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+
+from .credentials import RawCredential
+from .caching_manager import CachingManager
+from .memory_manager import MemoryManager
+
+
+class TestCachingManager(unittest.TestCase):
+    def setUp(self):
+        self.operations = []
+        self.inner = MemoryManager(
+            [RawCredential(i, f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt") for i in range(1, 4)],
+            # Records the round trips made to the wrapped manager
+            lambda operation, rows: self.operations.append(operation) or 0
+        )
+        self.manager = CachingManager(self.inner)
+
+    def test_repeated_reads(self):
+        self.assertEqual(self.manager.get_credential(1).title, "Test Title 1")
+        self.assertEqual(self.manager.get_credential(1).title, "Test Title 1")
+        self.assertTrue(self.manager.exists(1))
+        self.assertEqual([raw_cred.id for raw_cred in self.manager.get_many([3, 1, 4])], [3, 1])
+
+        # Only credentials that are not cached yet are read
+        self.assertEqual(self.operations, ["get_versions", "get_many", "get_versions", "get_many"])
+        self.assertIsNone(self.manager.get_credential(4))
+        self.assertRaises(TypeError, lambda: self.manager.get_credential("1"))
+
+    def test_write_through(self):
+        self.manager.get_many([1, 2, 3])
+
+        self.manager.modify_credential(1, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        self.manager.remove_credential(2)
+        self.assertEqual(self.inner.get_credential(1).title, "New Title")
+        self.assertEqual(self.manager.get_credential(1).title, "New Title")
+        self.assertIsNone(self.manager.get_credential(2))
+        self.assertEqual(list(self.manager.entries), [3, 1])
+
+        self.manager.remove_all_credentials()
+        self.assertEqual(len(self.manager.entries), 0)
+
+    def test_changes_by_other_clients(self):
+        self.manager.max_age = 0
+        self.manager.get_many([1, 2, 3])
+        self.inner.modify_credential(1, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        self.inner.remove_credential(2)
+        self.operations.clear()
+
+        self.assertEqual([raw_cred.title for raw_cred in self.manager.get_many([1, 2, 3])], ["New Title", "Test Title 3"])
+        # Unchanged credentials are only checked, changed ones are read again with the versions that were just checked
+        self.assertEqual(self.operations, ["get_versions", "get_many"])
+        self.assertEqual(list(self.manager.entries), [3, 1])
+
+    def test_storage_without_versions(self):
+        self.manager.max_age = 0
+        with patch.object(self.inner, "get_versions", return_value=None):
+            self.manager.get_credential(1)
+            self.inner.modify_credential(1, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+            self.assertEqual(self.manager.get_credential(1).title, "New Title")
+
+    def test_size(self):
+        self.manager.size = 2
+        self.manager.get_many([1, 2])
+        self.manager.get_credential(1)
+        self.manager.get_credential(3)
+
+        # The least recently used credential is dropped
+        self.assertEqual(list(self.manager.entries), [1, 3])
+
+    def test_rollback(self):
+        with self.assertRaises(ValueError):
+            with self.manager.batch():
+                self.manager.add_credential("Test Title 4", "Test Username", "Test Email", "Test Password", "Test Salt")
+                self.assertIsNotNone(self.manager.get_credential(4))
+                raise ValueError()
+
+        self.assertIsNone(self.manager.get_credential(4))
+        self.assertEqual(self.manager.get_mode(), "memory")
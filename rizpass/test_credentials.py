@@ -2,8 +2,9 @@ import unittest
 from unittest.mock import patch
 import base64
 
-from .credentials import Credential, RawCredential
+from .credentials import Credential, RawCredential, decrypt_credentials, encrypt_credentials, iter_decrypted_credentials, reencrypt_credentials
 from .passwords import encrypt_and_encode, decode_and_decrypt, generate_salt
+from .parallel import set_workers
 
 copied = False
 
@@ -39,6 +40,20 @@ class TestRawCredential(unittest.TestCase):
         self.assertEqual(cred.email, "email")
         self.assertEqual(cred.password, "password")
 
+    def test_get_cred_derives_key_once(self):
+        salt = generate_salt(16)
+        raw_cred = Credential(1, "title", "username", "email", "password").get_raw_credential("123", salt)
+
+        from . import passwords
+        with patch("rizpass.passwords.get_custom_key", wraps=passwords.get_custom_key) as get_custom_key:
+            cred = raw_cred.get_credential("123")
+
+        self.assertEqual(get_custom_key.call_count, 1)
+        self.assertEqual(cred.title, "title")
+        self.assertEqual(cred.username, "username")
+        self.assertEqual(cred.email, "email")
+        self.assertEqual(cred.password, "password")
+
     def test_str(self):
         raw_cred = RawCredential(1, "check_title", "check_username", "check_email", "check_password", "check_salt")
         str_cred = str(raw_cred)
@@ -50,6 +65,78 @@ class TestRawCredential(unittest.TestCase):
         self.assertEqual("check_salt" in str_cred, True)
 
 
+class TestBulkCredentials(unittest.TestCase):
+    def tearDown(self):
+        set_workers()
+
+    def get_creds(self, num: int):
+        return [Credential(i, f"title {i}", f"username {i}", f"email {i}", f"password {i}") for i in range(1, num + 1)]
+
+    def check_bulk_decryption(self):
+        raw_creds = encrypt_credentials("123", self.get_creds(6))
+        # Credential encrypted with another master password
+        raw_creds.insert(2, Credential(7, "title", "username", "email", "password").get_raw_credential("1234", generate_salt(16)))
+
+        with patch("sys.stderr"), patch("builtins.print"):
+            decrypted_creds = decrypt_credentials("123", raw_creds)
+
+        self.assertEqual([cred.id for cred, _ in decrypted_creds], [1, 2, 7, 3, 4, 5, 6])
+        self.assertEqual([decrypted for _, decrypted in decrypted_creds], [True, True, False, True, True, True, True])
+        self.assertEqual(decrypted_creds[0][0].title, "title 1")
+        self.assertEqual(decrypted_creds[6][0].password, "password 6")
+
+    def test_bulk_decryption_serial(self):
+        set_workers(1)
+        self.check_bulk_decryption()
+
+    def test_bulk_decryption_threads(self):
+        set_workers(4, "thread")
+        self.check_bulk_decryption()
+
+    def test_bulk_decryption_processes(self):
+        set_workers(2, "process")
+        self.check_bulk_decryption()
+
+    def check_pipelined_decryption(self):
+        raw_creds = encrypt_credentials("123", self.get_creds(6))
+        raw_creds.insert(2, Credential(7, "title", "username", "email", "password").get_raw_credential("1234", generate_salt(16)))
+
+        with patch("sys.stderr"), patch("builtins.print"):
+            decrypted_creds = list(iter_decrypted_credentials("123", (raw_cred for raw_cred in raw_creds)))
+
+        self.assertEqual([cred.id for cred, _ in decrypted_creds], [1, 2, 7, 3, 4, 5, 6])
+        self.assertEqual([decrypted for _, decrypted in decrypted_creds], [True, True, False, True, True, True, True])
+        self.assertEqual(decrypted_creds[6][0].password, "password 6")
+
+    def test_pipelined_decryption_threads(self):
+        set_workers(4, "thread")
+        self.check_pipelined_decryption()
+
+    def test_pipelined_decryption_processes(self):
+        set_workers(2, "process")
+        self.check_pipelined_decryption()
+
+    def test_bulk_decryption_fields(self):
+        raw_creds = encrypt_credentials("123", self.get_creds(2))
+        decrypted_creds = decrypt_credentials("123", raw_creds, ("password", ))
+
+        self.assertEqual(decrypted_creds[1][0].password, "password 2")
+        self.assertEqual(decrypted_creds[1][0].title, "")
+
+    def test_reencrypt_credentials(self):
+        set_workers(4)
+        raw_creds = encrypt_credentials("123", self.get_creds(4))
+        raw_creds.append(Credential(5, "title", "username", "email", "password").get_raw_credential("1234", generate_salt(16)))
+
+        with patch("sys.stderr"), patch("builtins.print"):
+            new_raw_creds = reencrypt_credentials("123", "456", raw_creds)
+
+        self.assertEqual([cred.id for cred in new_raw_creds], [1, 2, 3, 4])
+        for new_raw_cred, raw_cred in zip(new_raw_creds, raw_creds):
+            self.assertNotEqual(new_raw_cred.salt, raw_cred.salt)
+            self.assertEqual(new_raw_cred.get_credential("456").email, raw_cred.get_credential("123").email)
+
+
 class TestCredentail(unittest.TestCase):
     def test_init(self):
         cred = Credential(1, "title", "username", "email", "password")
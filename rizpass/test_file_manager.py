@@ -1,14 +1,31 @@
 import unittest
+from unittest.mock import patch
 import tempfile
 import os
 from time import time
+from concurrent.futures import ProcessPoolExecutor
 
-from .file_manager import FileManager
+from . import binary_vault, json_vault
+from .binary_vault import is_binary_vault
+from .credentials import RawCredential
+from .file_manager import JOURNAL_SUFFIX, LOCK_SUFFIX, FileManager, convert_file, fcntl
 
 TEMP_FILE_PATH = f"{tempfile.gettempdir()}/rizpass_test_file_manager_{int(time())}.json"
 
 
+def add_credentials(num: int) -> None:
+    manager = FileManager(TEMP_FILE_PATH, journal=num % 2 == 0)
+    for i in range(num):
+        manager.add_credential(f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt")
+    manager.close()
+
+
 class TestFileManager(unittest.TestCase):
+    def tearDown(self):
+        for file_path in [TEMP_FILE_PATH + LOCK_SUFFIX, TEMP_FILE_PATH + JOURNAL_SUFFIX]:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
     def read_from_file(self):
         file = open(TEMP_FILE_PATH, "r")
         contents = file.read()
@@ -85,7 +102,7 @@ class TestFileManager(unittest.TestCase):
         self.assertEqual(len(manager.credentials), 0)
 
         manager.close()
-        self.assertEqual(self.read_from_file(), "[]")
+        self.assertEqual(self.read_from_file(), '{"meta": {"next_id": "2"}, "credentials": []}')
         os.remove(TEMP_FILE_PATH)
 
     def test_remove_all_credentials(self):
@@ -97,7 +114,7 @@ class TestFileManager(unittest.TestCase):
         self.assertEqual(len(manager.credentials), 0)
 
         manager.close()
-        self.assertEqual(self.read_from_file(), "[]")
+        self.assertEqual(self.read_from_file(), '{"meta": {"next_id": "3"}, "credentials": []}')
         os.remove(TEMP_FILE_PATH)
 
     def test_modify_credential(self):
@@ -118,6 +135,414 @@ class TestFileManager(unittest.TestCase):
         )
         os.remove(TEMP_FILE_PATH)
 
+    def test_ids_not_reused(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        for i in range(1, 4):
+            manager.add_credential(f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.remove_credential(3)
+        manager.remove_credential(1)
+        self.assertEqual(manager.get_credential(1), None)
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual(manager.add_credential("Test Title 4", "Test Username", "Test Email", "Test Password", "Test Salt"), 4)
+        self.assertEqual([cred.id for cred in manager.get_all_credentials()], [2, 4])
+        self.assertEqual(manager.get_credential(4).title, "Test Title 4")
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_load_unsorted(self):
+        file = open(TEMP_FILE_PATH, "w")
+        file.write('[{"id": 5, "title": "Test Title 5", "username": "", "email": "", "password": "", "salt": ""}, {"id": 2, "title": "Test Title 2", "username": "", "email": "", "password": "", "salt": ""}]')
+        file.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual([cred.id for cred in manager.get_all_credentials()], [2, 5])
+        self.assertEqual(manager.add_credential("Test Title 6", "", "", "", ""), 6)
+        manager.modify_credential(2, "Test Title 2 Modified", "", "", "", "")
+        self.assertEqual([cred.title for cred in manager.get_all_credentials()], ["Test Title 2 Modified", "Test Title 5", "Test Title 6"])
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_meta(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        self.assertEqual(manager.get_meta("Test Meta"), None)
+        manager.set_meta("Test Meta", "Test Value")
+        manager.close()
+
+        self.assertEqual(
+            self.read_from_file(),
+            '{"meta": {"Test Meta": "Test Value"}, "credentials": [{"id": 1, "title": "Test Title", "username": "Test Username", "email": "Test Email", "password": "Test Password", "salt": "Test Salt"}]}'
+        )
+
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual(manager.get_meta("Test Meta"), "Test Value")
+        self.assertEqual(len(manager.credentials), 1)
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_journal(self):
+        manager = FileManager(TEMP_FILE_PATH, journal=True)
+        manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.compact_journal()
+        file_contents = self.read_from_file()
+
+        manager.add_credential("Test Title 2", "Test Username 2", "Test Email 2", "Test Password 2", "Test Salt 2")
+        manager.modify_credential(1, "Test Title 3", "Test Username 3", "Test Email 3", "Test Password 3", "Test Salt 3")
+        manager.remove_credential(2)
+        manager.set_meta("Test Meta", "Test Value")
+        manager.close()
+
+        # The changes only go to the journal
+        self.assertEqual(self.read_from_file(), file_contents)
+        self.assertTrue(os.path.isfile(TEMP_FILE_PATH + JOURNAL_SUFFIX))
+
+        manager = FileManager(TEMP_FILE_PATH, journal=True)
+        self.assertEqual([cred.title for cred in manager.get_all_credentials()], ["Test Title 3"])
+        self.assertEqual(manager.get_meta("Test Meta"), "Test Value")
+        self.assertEqual(manager.add_credential("Test Title 4", "", "", "", ""), 3)
+        manager.close()
+
+        # Without journal mode the journal is merged into the file
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertFalse(os.path.isfile(TEMP_FILE_PATH + JOURNAL_SUFFIX))
+        self.assertEqual([cred.id for cred in manager.get_all_credentials()], [1, 3])
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_journal_compaction(self):
+        manager = FileManager(TEMP_FILE_PATH, journal=True)
+        with patch("rizpass.file_manager.JOURNAL_MIN_SIZE", 0):
+            for i in range(20):
+                manager.add_credential(f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt")
+                # The journal is never allowed to grow larger than the file
+                self.assertLessEqual(manager.journal_size, manager.file_size)
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH, journal=True)
+        self.assertEqual(len(manager.get_all_credentials()), 20)
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+        if os.path.isfile(TEMP_FILE_PATH + JOURNAL_SUFFIX):
+            os.remove(TEMP_FILE_PATH + JOURNAL_SUFFIX)
+
+    def test_journal_incomplete_record(self):
+        manager = FileManager(TEMP_FILE_PATH, journal=True)
+        manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.compact_journal()
+        manager.add_credential("Test Title 2", "Test Username 2", "Test Email 2", "Test Password 2", "Test Salt 2")
+        manager.close()
+
+        journal_file = open(TEMP_FILE_PATH + JOURNAL_SUFFIX, "a")
+        journal_file.write('{"op": "remove", "i')
+        journal_file.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual(len(manager.get_all_credentials()), 2)
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_journal_write_after_incomplete_record(self):
+        manager = FileManager(TEMP_FILE_PATH, journal=True)
+        manager.add_credential("a", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.add_credential("b", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.close()
+
+        journal_file = open(TEMP_FILE_PATH + JOURNAL_SUFFIX, "a")
+        journal_file.write('{"op": "add", "cr')
+        journal_file.close()
+
+        # Records written after the incomplete one must not be glued onto it
+        manager = FileManager(TEMP_FILE_PATH, journal=True)
+        manager.add_credential("c", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.add_credential("d", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH, journal=True)
+        self.assertEqual([raw_cred.title for raw_cred in manager.get_all_credentials()], ["a", "b", "c", "d"])
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+        os.remove(TEMP_FILE_PATH + JOURNAL_SUFFIX)
+
+    def test_batch(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+
+        with patch.object(manager, "dump_creds", wraps=manager.dump_creds) as dump_creds:
+            with manager.batch():
+                for i in range(2, 12):
+                    manager.add_credential(f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt")
+                manager.modify_credential(1, "Test Title 1", "Test Username", "Test Email", "Test Password", "Test Salt")
+                manager.remove_credential(2)
+                dump_creds.assert_not_called()
+            self.assertEqual(dump_creds.call_count, 1)
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual(len(manager.get_all_credentials()), 10)
+        self.assertEqual(manager.get_credential(1).title, "Test Title 1")
+        manager.close()
+        self.assertFalse(os.path.isfile(TEMP_FILE_PATH + ".tmp"))
+        os.remove(TEMP_FILE_PATH)
+
+    def test_batch_rollback(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+
+        with self.assertRaises(ValueError):
+            with manager.batch():
+                manager.add_credential("Test Title 2", "Test Username 2", "Test Email 2", "Test Password 2", "Test Salt 2")
+                manager.remove_credential(1)
+                raise ValueError()
+
+        self.assertEqual([cred.title for cred in manager.get_all_credentials()], ["Test Title"])
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_bulk_operations(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        with patch.object(manager, "dump_creds", wraps=manager.dump_creds) as dump_creds:
+            manager.add_many([RawCredential(0, f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt") for i in range(5)])
+            manager.modify_many([RawCredential(2, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")])
+            manager.remove_many([1, 3])
+            self.assertEqual(dump_creds.call_count, 3)
+
+        self.assertEqual([(cred.id, cred.title) for cred in manager.get_all_credentials()], [(2, "New Title"), (4, "Test Title 3"), (5, "Test Title 4")])
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_journal_batch(self):
+        manager = FileManager(TEMP_FILE_PATH, journal=True)
+        manager.begin()
+        manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.add_credential("Test Title 2", "Test Username 2", "Test Email 2", "Test Password 2", "Test Salt 2")
+        manager.commit()
+        manager.close()
+
+        journal_file = open(TEMP_FILE_PATH + JOURNAL_SUFFIX, "r")
+        self.assertEqual(len(journal_file.readlines()), 1)
+        journal_file.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual(len(manager.get_all_credentials()), 2)
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_binary_file(self):
+        manager = FileManager(TEMP_FILE_PATH, binary=True)
+        self.assertTrue(is_binary_vault(TEMP_FILE_PATH))
+        manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.add_credential("Test Title 2", "Test Username 2", "Test Email 2", "Test Password 2", "Test Salt 2")
+        manager.set_meta("Test Meta", "Test Value")
+        manager.remove_credential(2)
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        with patch("rizpass.binary_vault.decode_record", wraps=binary_vault.decode_record) as decode_record:
+            self.assertEqual(manager.get_credential(1).title, "Test Title")
+            # Only the credential that was asked for is read from the file
+            self.assertEqual(decode_record.call_count, 1)
+        self.assertEqual(manager.get_meta("Test Meta"), "Test Value")
+        self.assertEqual(manager.add_credential("Test Title 3", "", "", "", ""), 3)
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual([cred.title for cred in manager.get_all_credentials()], ["Test Title", "Test Title 3"])
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_batch_interface(self):
+        manager = FileManager(TEMP_FILE_PATH, binary=True)
+        manager.add_many([RawCredential(0, f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt") for i in range(5)])
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        with patch("rizpass.binary_vault.decode_record", wraps=binary_vault.decode_record) as decode_record:
+            self.assertTrue(manager.exists(3))
+            self.assertFalse(manager.exists(6))
+            self.assertEqual(manager.count(), 5)
+            self.assertEqual(manager.list_ids(), [1, 2, 3, 4, 5])
+            # None of this needs the credentials themselves
+            decode_record.assert_not_called()
+
+            self.assertEqual([cred.title for cred in manager.get_many([4, 6, 2])], ["Test Title 3", "Test Title 1"])
+            self.assertEqual(decode_record.call_count, 2)
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_iter_credentials(self):
+        manager = FileManager(TEMP_FILE_PATH, binary=True)
+        manager.add_many([RawCredential(0, f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt") for i in range(5)])
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        with patch("rizpass.binary_vault.decode_record", wraps=binary_vault.decode_record) as decode_record:
+            creds = manager.iter_credentials(2)
+            self.assertEqual(next(creds).title, "Test Title 0")
+            # Only the first batch has been read from the file
+            self.assertEqual(decode_record.call_count, 2)
+            self.assertEqual([cred.id for cred in creds], [2, 3, 4, 5])
+
+        # Credentials read while iterating are not kept in memory
+        with patch("rizpass.binary_vault.decode_record", wraps=binary_vault.decode_record) as decode_record:
+            self.assertEqual(len(list(manager.iter_credentials())), 5)
+            self.assertEqual(decode_record.call_count, 5)
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_convert_file(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.set_meta("Test Meta", "Test Value")
+        manager.close()
+        json_contents = self.read_from_file()
+
+        convert_file(TEMP_FILE_PATH, True)
+        self.assertTrue(is_binary_vault(TEMP_FILE_PATH))
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual(manager.get_credential(1).title, "Test Title")
+        manager.close()
+
+        convert_file(TEMP_FILE_PATH, False)
+        self.assertEqual(self.read_from_file(), json_contents)
+        os.remove(TEMP_FILE_PATH)
+
+    @unittest.skipIf(fcntl is None, "fcntl is not available")
+    def test_convert_file_locking(self):
+        FileManager(TEMP_FILE_PATH).close()
+        locked = FileManager.locked
+        write_file = FileManager.write_file
+        other_writes = []
+        # Whether the lock was taken by someone else whenever the file was written
+        blocked = []
+
+        def write_before_lock(manager, exclusive=False):
+            # Another process adds a credential after the file was loaded for the conversion
+            if not other_writes:
+                other_writes.append(True)
+                other_manager = FileManager(TEMP_FILE_PATH)
+                other_manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+                other_manager.close()
+            return locked(manager, exclusive)
+
+        def write_file_locked(manager, file_path, binary):
+            lock_fd = os.open(TEMP_FILE_PATH + LOCK_SUFFIX, os.O_RDWR)
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                blocked.append(False)
+            except BlockingIOError:
+                blocked.append(True)
+            finally:
+                os.close(lock_fd)
+            write_file(manager, file_path, binary)
+
+        with patch.object(FileManager, "locked", write_before_lock), patch.object(FileManager, "write_file", write_file_locked):
+            convert_file(TEMP_FILE_PATH, True)
+
+        # The file is converted while nobody else can read or write it, with the changes of the other process
+        self.assertTrue(blocked[-1])
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual(manager.get_credential(1).title, "Test Title")
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_lazy(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        for i in range(1, 6):
+            manager.add_credential(f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt")
+        manager.set_meta("Test Meta", "Test Value")
+        manager.close()
+        file_contents = self.read_from_file()
+
+        manager = FileManager(TEMP_FILE_PATH, lazy=True)
+        with patch("rizpass.json_vault.load_json_str", wraps=json_vault.load_json_str) as load_json_str:
+            self.assertEqual(manager.get_credential(3).title, "Test Title 3")
+            # Only the credential that was asked for is parsed
+            self.assertEqual(load_json_str.call_count, 1)
+        self.assertEqual(manager.get_meta("Test Meta"), "Test Value")
+
+        manager.modify_credential(2, "Test Title 2", "Test Username", "Test Email", "Test Password", "Test Salt")
+        # Credentials that were not read are written back as they were
+        self.assertEqual(self.read_from_file(), file_contents)
+
+        manager.remove_credential(5)
+        self.assertEqual(manager.add_credential("Test Title 6", "", "", "", ""), 6)
+        self.assertEqual([cred.id for cred in manager.get_all_credentials()], [1, 2, 3, 4, 6])
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual([cred.title for cred in manager.get_all_credentials()], [f"Test Title {i}" for i in [1, 2, 3, 4, 6]])
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_lazy_unsupported_layout(self):
+        file = open(TEMP_FILE_PATH, "w")
+        file.write('[{"title": "Test Title", "id": 1, "username": "", "email": "", "password": "", "salt": ""}]')
+        file.close()
+
+        manager = FileManager(TEMP_FILE_PATH, lazy=True)
+        self.assertEqual(manager.get_credential(1).title, "Test Title")
+        manager.add_credential("Test Title 2", "", "", "", "")
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH, lazy=True)
+        self.assertEqual([cred.title for cred in manager.get_all_credentials()], ["Test Title", "Test Title 2"])
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    def test_change_detection(self):
+        manager_1 = FileManager(TEMP_FILE_PATH)
+        manager_2 = FileManager(TEMP_FILE_PATH, journal=True)
+
+        self.assertEqual(manager_1.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt"), 1)
+        self.assertEqual(manager_2.add_credential("Test Title 2", "Test Username 2", "Test Email 2", "Test Password 2", "Test Salt 2"), 2)
+        self.assertEqual(manager_1.get_credential(2).title, "Test Title 2")
+        manager_1.remove_credential(1)
+        self.assertEqual([cred.id for cred in manager_2.get_all_credentials()], [2])
+
+        # Nothing is reloaded as long as the file has not changed
+        with patch.object(manager_1, "load_creds") as load_creds:
+            manager_1.get_all_credentials()
+            load_creds.assert_not_called()
+
+        manager_1.close()
+        manager_2.close()
+        os.remove(TEMP_FILE_PATH)
+
+    @unittest.skipIf(fcntl is None, "fcntl is not available")
+    def test_locking(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        lock_fd = os.open(TEMP_FILE_PATH + LOCK_SUFFIX, os.O_RDWR)
+
+        with manager.locked():
+            # Readers do not block each other, but writers have to wait for them
+            fcntl.flock(lock_fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            with self.assertRaises(BlockingIOError):
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        with manager.batch():
+            with self.assertRaises(BlockingIOError):
+                fcntl.flock(lock_fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.close(lock_fd)
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
+    @unittest.skipIf(fcntl is None, "fcntl is not available")
+    def test_concurrent_writers(self):
+        FileManager(TEMP_FILE_PATH).close()
+
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            list(executor.map(add_credentials, [10, 11, 12, 13]))
+
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual([cred.id for cred in manager.get_all_credentials()], list(range(1, 47)))
+        manager.close()
+        os.remove(TEMP_FILE_PATH)
+
     # TODO: Find some way of testing this
     # def test_filter_credentials(self):
     #     manager = FileManager(TEMP_FILE_PATH)
@@ -0,0 +1,52 @@
+import unittest
+import tempfile
+import os
+from time import time
+
+from .json_vault import JsonVault
+
+TEMP_FILE_PATH = f"{tempfile.gettempdir()}/rizpass_test_json_vault_{int(time())}.json"
+
+
+class TestJsonVault(unittest.TestCase):
+    def write_to_file(self, contents: str):
+        file = open(TEMP_FILE_PATH, "w")
+        file.write(contents)
+        file.close()
+
+    def tearDown(self):
+        if os.path.isfile(TEMP_FILE_PATH):
+            os.remove(TEMP_FILE_PATH)
+
+    def test_index(self):
+        self.write_to_file(
+            '{"meta": {"Test Meta": "{\\"id\\": 5, }"}, "credentials": [{"id": 1, "title": "Test Title", "username": "", "email": "", "password": "}, ", "salt": ""}, '
+            '{"id": 3, "title": "Test Title 3", "username": "", "email": "", "password": "", "salt": ""}]}'
+        )
+
+        json_vault = JsonVault(TEMP_FILE_PATH)
+        self.assertEqual(json_vault.meta, {"Test Meta": '{"id": 5, }'})
+        self.assertEqual(json_vault.get_ids(), [1, 3])
+        self.assertEqual(json_vault.get_credential(1).password, "}, ")
+        self.assertEqual(json_vault.get_credential(3).title, "Test Title 3")
+        self.assertEqual(json_vault.get_record(3), b'{"id": 3, "title": "Test Title 3", "username": "", "email": "", "password": "", "salt": ""}')
+        json_vault.close()
+
+    def test_unsupported_layout(self):
+        for contents in [
+            "",
+            "[]",
+            # The id is not the first key
+            '[{"id": 1, "title": "", "username": "", "email": "", "password": "", "salt": ""}, {"title": "", "id": 2, "username": "", "email": "", "password": "", "salt": ""}]',
+            # Compact separators
+            '[{"id": 1, "title": "", "username": "", "email": "", "password": "", "salt": ""},{"id": 2, "title": "", "username": "", "email": "", "password": "", "salt": ""}]',
+            # Duplicate ids
+            '[{"id": 1, "title": "", "username": "", "email": "", "password": "", "salt": ""}, {"id": 1, "title": "", "username": "", "email": "", "password": "", "salt": ""}]',
+        ]:
+            self.write_to_file(contents)
+            with self.assertRaises(ValueError):
+                JsonVault(TEMP_FILE_PATH)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+import tempfile
+import json
+import io
+import os
+from time import time
+from unittest.mock import patch
+
+from . import user_functions
+from .credentials import Credential, encrypt_credentials
+from .machine import (
+    EXIT_AUTH, EXIT_FAILURE, EXIT_NOT_FOUND, EXIT_OK, EXIT_USAGE, RecordWriter, is_secret_source, read_secret, run_action
+)
+from .memory_manager import MemoryManager
+from .vault import unlock_vault
+
+TEMP_FILE_PATH = f"{tempfile.gettempdir()}/rizpass_test_machine_{int(time())}.json"
+
+
+class TestMachine(unittest.TestCase):
+    def setUp(self):
+        self.manager = MemoryManager(encrypt_credentials("Master Password", [
+            Credential(1, "Test Title", "Test Username", "test@example.com", "Test Password"),
+            Credential(2, "Other Title", "Other Username", "other@example.com", "Other Password"),
+        ]))
+        user_functions.init(lambda: None, dict(), unlock_vault("Master Password", self.manager))
+
+    def tearDown(self):
+        user_functions.init(lambda: None, dict(), None)
+        if os.path.isfile(TEMP_FILE_PATH):
+            os.remove(TEMP_FILE_PATH)
+
+    def run_action(self, action: int, output_format: str = "jsonl", **params):
+        output = io.StringIO()
+        exit_code = run_action(action, params, "Master Password", self.manager, RecordWriter(output_format, output))
+        return exit_code, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_secret_sources(self):
+        self.assertTrue(is_secret_source("env:RIZPASS_PASSWORD"))
+        self.assertTrue(is_secret_source("fd:3"))
+        self.assertFalse(is_secret_source("Master Password"))
+        self.assertFalse(is_secret_source("env:"))
+
+        with patch.dict(os.environ, {"RIZPASS_TEST_PASSWORD": "Test Password"}):
+            self.assertEqual(read_secret("env:RIZPASS_TEST_PASSWORD"), "Test Password")
+        self.assertIsNone(read_secret("env:RIZPASS_MISSING_PASSWORD"))
+
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b"Test Password\nSecond Line\n")
+        os.close(write_fd)
+        self.assertEqual(read_secret(f"fd:{read_fd}"), "Test Password")
+        os.close(read_fd)
+
+    def test_retrieve(self):
+        exit_code, records = self.run_action(4, ids=[2, 3])
+        self.assertEqual(exit_code, EXIT_NOT_FOUND)
+        self.assertEqual(records[0]["password"], "Other Password")
+        self.assertEqual(records[1], {"id": 3, "error": "Credential not found!"})
+
+        with patch("rizpass.machine.stdin", io.StringIO("1\n\n2\n")):
+            exit_code, records = self.run_action(4, "json", ids=["-"])
+        self.assertEqual(exit_code, EXIT_OK)
+        self.assertEqual([cred["title"] for cred in records[0]], ["Test Title", "Other Title"])
+
+        self.assertEqual(self.run_action(4), (EXIT_USAGE, []))
+
+    def test_filter(self):
+        exit_code, records = self.run_action(6, title_contains="other", email_contains="EXAMPLE")
+        self.assertEqual((exit_code, [cred["id"] for cred in records]), (EXIT_OK, [2]))
+        self.assertEqual(self.run_action(6, "json", title_contains="missing"), (EXIT_NOT_FOUND, [[]]))
+
+    def test_add_modify_remove(self):
+        with patch.dict(os.environ, {"RIZPASS_TEST_PASSWORD": "New Password"}):
+            exit_code, records = self.run_action(3, title="New Title", password="env:RIZPASS_TEST_PASSWORD")
+            self.assertEqual((exit_code, records), (EXIT_OK, [{"id": 3}]))
+            self.assertEqual(self.run_action(3, title="New Title")[0], EXIT_USAGE)
+
+        self.assertEqual(self.run_action(8, ids=[3], email="new@example.com")[0], EXIT_OK)
+        cred = user_functions.fetch_credential(self.manager, 3)
+        self.assertEqual((cred.title, cred.email, cred.password), ("New Title", "new@example.com", "New Password"))
+
+        exit_code, records = self.run_action(9, ids=[1, 4])
+        self.assertEqual((exit_code, records[1]), (EXIT_NOT_FOUND, {"id": 4, "error": "Credential not found!"}))
+        self.assertEqual(self.manager.list_ids(), [2, 3])
+
+        self.assertEqual(self.run_action(10)[0], EXIT_USAGE)
+        self.assertEqual(self.run_action(10, yes=True), (EXIT_OK, [{"removed": 2}]))
+
+    def test_export_and_import(self):
+        with patch.dict(os.environ, {"RIZPASS_TEST_PASSWORD": "File Password"}):
+            exit_code, records = self.run_action(12, path=TEMP_FILE_PATH, file_master_pass="env:RIZPASS_TEST_PASSWORD")
+            self.assertEqual((exit_code, records[0]["count"]), (EXIT_OK, 2))
+
+            self.assertEqual(self.run_action(13, path=TEMP_FILE_PATH)[0], EXIT_AUTH)
+            exit_code, records = self.run_action(13, path=TEMP_FILE_PATH, file_master_pass="env:RIZPASS_TEST_PASSWORD")
+            self.assertEqual((exit_code, records), (EXIT_OK, [{"count": 2}]))
+
+        self.assertEqual([cred["title"] for cred in self.run_action(7)[1]], ["Test Title", "Other Title"] * 2)
+
+        with open(TEMP_FILE_PATH, "r") as file:
+            file_creds = json.load(file)
+        file_creds[1]["password"] = "Invalid Password"
+        with open(TEMP_FILE_PATH, "w") as file:
+            json.dump(file_creds, file)
+
+        # Credentials that cannot be decrypted are left out and counted as a failure
+        with patch.dict(os.environ, {"RIZPASS_TEST_PASSWORD": "File Password"}):
+            with patch("rizpass.machine.stderr", io.StringIO()), patch("rizpass.credentials.stderr", io.StringIO()):
+                exit_code, records = self.run_action(13, path=TEMP_FILE_PATH, file_master_pass="env:RIZPASS_TEST_PASSWORD")
+        self.assertEqual((exit_code, records), (EXIT_FAILURE, [{"count": 1}]))
+        self.assertEqual(self.manager.count(), 5)
+
+    def test_undecryptable(self):
+        raw_cred = self.manager.get_credential(2)
+        self.manager.modify_credential(2, raw_cred.title, raw_cred.username, raw_cred.email, "SW52YWxpZA==", raw_cred.salt)
+        error = {"id": 2, "error": "Could not decrypt credential!"}
+
+        with patch("rizpass.credentials.stderr", io.StringIO()), patch("sys.stdout", io.StringIO()):
+            exit_code, records = self.run_action(4, ids=[2, 3])
+            self.assertEqual((exit_code, records), (EXIT_FAILURE, [error, {"id": 3, "error": "Credential not found!"}]))
+
+            with patch("pyperclip.copy") as copy:
+                self.assertEqual(self.run_action(5, ids=[2]), (EXIT_FAILURE, [error]))
+                copy.assert_not_called()
+
+            exit_code, records = self.run_action(6, title_contains="test")
+            self.assertEqual((exit_code, [record.get("error") for record in records]), (EXIT_FAILURE, [None, error["error"]]))
+            exit_code, records = self.run_action(7)
+            self.assertEqual((exit_code, records[1]), (EXIT_FAILURE, error))
+
+    def test_generate(self):
+        exit_code, records = self.run_action(2, length=20, uppercase=False, specials=False)
+        self.assertEqual(exit_code, EXIT_OK)
+        self.assertEqual(len(records[0]["password"]), 20)
+        self.assertFalse(any(char.isupper() for char in records[0]["password"]))
+
+        self.assertEqual(self.run_action(1, length=8)[0], EXIT_USAGE)
+        self.assertEqual(len(self.run_action(1)[1][0]["password"]), 32)
@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import patch
+
+from .credentials import Credential, RawCredential, encrypt_credentials, iter_decrypted_credentials
+from .memory_manager import FixedLatency, MemoryManager
+from .vault import VAULT_KEY_META, unlock_vault
+
+
+class TestMemoryManager(unittest.TestCase):
+    def get_raw_creds(self, num: int):
+        return [RawCredential(0, f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt") for i in range(num)]
+
+    def test_credentials(self):
+        manager = MemoryManager([RawCredential(5, "Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")])
+        self.assertEqual(manager.add_credential("Test Title 2", "Test Username", "Test Email", "Test Password", "Test Salt"), 6)
+
+        manager.modify_credential(5, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        self.assertEqual(manager.get_credential(5).title, "New Title")
+
+        manager.remove_credential(6)
+        self.assertIsNone(manager.get_credential(6))
+        self.assertEqual(manager.add_credential("Test Title 3", "Test Username", "Test Email", "Test Password", "Test Salt"), 7)
+
+        manager.set_meta("Test Meta", "Test Value")
+        self.assertEqual(manager.get_meta("Test Meta"), "Test Value")
+        self.assertRaises(TypeError, lambda: manager.get_credential("5"))
+
+    def test_bulk_operations(self):
+        manager = MemoryManager()
+        manager.add_many(self.get_raw_creds(5))
+        manager.modify_many([RawCredential(2, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")])
+        manager.remove_many([1, 3])
+
+        self.assertEqual(manager.list_ids(), [2, 4, 5])
+        self.assertEqual(manager.count(), 3)
+        self.assertTrue(manager.exists(2))
+        self.assertEqual([raw_cred.title for raw_cred in manager.get_many([5, 1, 2])], ["Test Title 4", "New Title"])
+        self.assertEqual([raw_cred.id for raw_cred in manager.iter_credentials(2)], [2, 4, 5])
+
+    def test_batch_rollback(self):
+        manager = MemoryManager()
+        manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+
+        with self.assertRaises(ValueError):
+            with manager.batch():
+                manager.add_many(self.get_raw_creds(2))
+                manager.remove_credential(1)
+                manager.set_meta("Test Meta", "Test Value")
+                raise ValueError()
+
+        self.assertEqual(manager.list_ids(), [1])
+        self.assertIsNone(manager.get_meta("Test Meta"))
+        self.assertEqual(manager.add_credential("Test Title 2", "Test Username", "Test Email", "Test Password", "Test Salt"), 2)
+
+    def test_latency(self):
+        manager = MemoryManager(latency=FixedLatency(0.01, 0.001))
+
+        with patch("rizpass.memory_manager.sleep") as sleep:
+            manager.add_many(self.get_raw_creds(10))
+            manager.get_credential(1)
+            list(manager.iter_credentials(4))
+
+        # One round trip per call and one per batch read while iterating
+        self.assertEqual([round(call.args[0], 3) for call in sleep.call_args_list], [0.02, 0.011, 0.014, 0.014, 0.012])
+
+    def test_unlock_and_decrypt(self):
+        manager = MemoryManager(encrypt_credentials("Master Password", [Credential(i, f"Test Title {i}", "", "", "") for i in range(1, 4)]))
+
+        vault_key = unlock_vault("Master Password", manager)
+        self.assertIsNotNone(vault_key)
+        self.assertIsNotNone(manager.get_meta(VAULT_KEY_META))
+        self.assertIsNone(unlock_vault("Wrong Password", manager))
+
+        decrypted_creds = list(iter_decrypted_credentials(vault_key, manager.iter_credentials()))
+        self.assertEqual([cred.title for cred, _ in decrypted_creds], ["Test Title 1", "Test Title 2", "Test Title 3"])
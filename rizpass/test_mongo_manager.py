@@ -0,0 +1,118 @@
+import unittest
+from collections import defaultdict
+from unittest.mock import MagicMock, patch
+
+from .credentials import RawCredential
+from .db_manager import DbConfig
+from .mongo_manager import CREDENTIALS_COUNTER, MongoManager
+
+
+class TestMongoManager(unittest.TestCase):
+    def setUp(self):
+        collections = defaultdict(MagicMock)
+        self.client = MagicMock()
+        self.client["rizpass"].__getitem__.side_effect = collections.__getitem__
+        with patch("pymongo.mongo_client.MongoClient", return_value=self.client):
+            self.manager = MongoManager(DbConfig("localhost", "user", "password", "rizpass"))
+
+        self.collection = collections["credentials"]
+        self.counters = collections["counters"]
+        self.tombstones = collections["credential_tombstones"]
+        self.meta = collections["vault_meta"]
+
+        self.seq = 0
+
+        def increment(query, update, **kwargs):
+            self.seq += update["$inc"]["seq"]
+            return {"_id": CREDENTIALS_COUNTER, "seq": self.seq}
+
+        self.counters.find_one_and_update.side_effect = increment
+        self.collection.find_one.return_value = {"id": 7}
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_add_credential(self):
+        self.seq = 7
+        self.assertEqual(self.manager.add_credential("Title", "Username", "Email", "Password", "Salt"), 8)
+        self.assertEqual(self.manager.add_credential("Title", "Username", "Email", "Password", "Salt"), 9)
+
+        # The counter is only brought up to date with the existing credentials once
+        self.counters.update_one.assert_called_once_with({"_id": CREDENTIALS_COUNTER}, {"$max": {"seq": 7}}, upsert=True)
+        self.assertEqual([call.args[0]["id"] for call in self.collection.insert_one.call_args_list], [8, 9])
+
+    def test_add_many(self):
+        self.manager.add_many([RawCredential(0, f"Title {i}", "Username", "Email", "Password", "Salt") for i in range(3)])
+
+        # The ids of all credentials are reserved with a single increment
+        self.counters.find_one_and_update.assert_called_once()
+        operations = self.collection.bulk_write.call_args.args[0]
+        self.assertEqual([operation._doc["id"] for operation in operations], [1, 2, 3])
+        self.assertEqual([operation._doc["title"] for operation in operations], ["Title 0", "Title 1", "Title 2"])
+        self.assertFalse(self.collection.bulk_write.call_args.kwargs["ordered"])
+
+        self.manager.add_many([])
+        self.assertEqual(self.collection.bulk_write.call_count, 1)
+
+    def test_modify_and_remove_many(self):
+        self.manager.modify_many([
+            RawCredential(1, "Title 1", "Username", "Email", "Password", "Salt"),
+            RawCredential(2, "Title 2", "Username", "Email", "Password", "Salt"),
+        ])
+        operations = self.collection.bulk_write.call_args.args[0]
+        self.assertEqual([operation._filter for operation in operations], [{"id": 1}, {"id": 2}])
+
+        self.manager.remove_many([1, 2])
+        self.collection.delete_many.assert_called_once_with({"id": {"$in": [1, 2]}})
+        self.assertRaises(TypeError, lambda: self.manager.remove_many(["1"]))
+
+    def test_iter_credentials(self):
+        self.collection.find.return_value = iter([{"id": 1, "title": "Title", "username": "Username", "email": "Email", "password": "Password", "salt": "Salt"}])
+
+        self.assertEqual([raw_cred.id for raw_cred in self.manager.iter_credentials(100)], [1])
+        self.assertEqual(self.collection.find.call_args.kwargs["batch_size"], 100)
+        self.assertEqual(self.collection.find.call_args.args[1]["_id"], 0)
+
+    def test_batch_interface(self):
+        self.collection.find.return_value = iter([
+            {"id": i, "title": "Title", "username": "Username", "email": "Email", "password": "Password", "salt": "Salt"} for i in (3, 1)
+        ])
+        self.assertEqual([raw_cred.id for raw_cred in self.manager.get_many([1, 2, 3])], [1, 3])
+        self.assertEqual(self.collection.find.call_args.args[0], {"id": {"$in": [1, 2, 3]}})
+
+        self.collection.count_documents.return_value = 1
+        self.assertTrue(self.manager.exists(1))
+        self.collection.count_documents.assert_called_with({"id": 1}, limit=1)
+
+    def test_versions(self):
+        self.manager.modify_credential(1, "Title", "Username", "Email", "Password", "Salt")
+        self.assertEqual(self.collection.update_one.call_args.args[1]["$inc"], {"version": 1})
+
+        self.collection.find.return_value = iter([{"id": 1, "version": 2}, {"id": 2}])
+        self.assertEqual(self.manager.get_versions([1, 2, 3]), {1: 2, 2: 0})
+        self.assertEqual(self.manager.get_versions([]), {})
+
+    def test_add_meta(self):
+        from pymongo.errors import DuplicateKeyError
+
+        self.assertEqual(self.manager.add_meta("Name", "Value"), "Value")
+        self.meta.insert_one.assert_called_once_with({"name": "Name", "value": "Value"})
+
+        # The record stored by another client first is kept
+        self.meta.insert_one.side_effect = DuplicateKeyError("Duplicate key")
+        self.meta.find_one.return_value = {"name": "Name", "value": "Stored Value"}
+        self.assertEqual(self.manager.add_meta("Name", "Value"), "Stored Value")
+        self.meta.update_one.assert_not_called()
+
+    def test_get_changes(self):
+        self.manager.remove_many([2])
+        self.assertEqual(self.tombstones.bulk_write.call_args.args[0][0]._filter, {"id": 2})
+
+        self.collection.find.return_value = iter([{"id": 1, "title": "Title", "username": "Username", "email": "Email", "password": "Password", "salt": "Salt"}])
+        self.tombstones.find.return_value = iter([{"id": 2}])
+        raw_creds, removed_ids, mark = self.manager.get_changes(100.0)
+
+        self.assertEqual([raw_cred.id for raw_cred in raw_creds], [1])
+        self.assertEqual(removed_ids, [2])
+        self.assertEqual(self.collection.find.call_args.args[0]["updated_at"]["$gte"].timestamp(), 100.0)
+        self.assertGreater(mark, 100.0)
@@ -0,0 +1,310 @@
+import unittest
+from threading import Thread
+from unittest.mock import MagicMock, patch
+
+from .credentials import RawCredential
+from .db_manager import CHANGE_OVERLAP, DbConfig
+from .mysql_manager import BULK_CHUNK_SIZE, ConnectionPool, MysqlManager
+
+
+class FakeConnection:
+    def __init__(self):
+        self.pings = 0
+        self.rollbacks = 0
+        self.closed = False
+        self.broken = False
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.broken:
+            raise ConnectionError("Connection is broken")
+
+    def rollback(self):
+        self.rollbacks += 1
+        if self.broken:
+            raise ConnectionError("Connection is broken")
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.connections = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.connections.append(connection)
+        return connection
+
+    def test_invalid_size(self):
+        self.assertRaises(TypeError, lambda: ConnectionPool(self.connect, "1"))
+        self.assertRaises(ValueError, lambda: ConnectionPool(self.connect, 0))
+
+    def test_reuse(self):
+        pool = ConnectionPool(self.connect, 2)
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.connections), 1)
+
+        with pool.connection() as first:
+            with pool.connection() as second:
+                self.assertIsNot(first, second)
+        self.assertEqual(len(self.connections), 2)
+
+    def test_ping_idle_connections(self):
+        pool = ConnectionPool(self.connect, 1)
+
+        with patch("rizpass.mysql_manager.monotonic", return_value=100):
+            with pool.connection():
+                pass
+            # Connections that were just used are not pinged
+            with pool.connection() as connection:
+                pass
+        self.assertEqual(connection.pings, 0)
+
+        with patch("rizpass.mysql_manager.monotonic", return_value=200):
+            with pool.connection() as connection:
+                pass
+        self.assertEqual(connection.pings, 1)
+
+    def test_discard_broken_connections(self):
+        pool = ConnectionPool(self.connect, 1)
+
+        with self.assertRaises(ConnectionError):
+            with pool.connection() as connection:
+                connection.broken = True
+                raise ConnectionError("Lost the connection")
+
+        # The broken connection could not be rolled back, so it has been replaced
+        self.assertTrue(connection.closed)
+        with pool.connection() as new_connection:
+            self.assertIsNot(connection, new_connection)
+        self.assertEqual(pool.open_count, 1)
+
+    def test_rollback_on_error(self):
+        pool = ConnectionPool(self.connect, 1)
+
+        with self.assertRaises(ValueError):
+            with pool.connection() as connection:
+                raise ValueError("Query failed")
+
+        self.assertEqual(connection.rollbacks, 1)
+        with pool.connection() as same_connection:
+            self.assertIs(connection, same_connection)
+
+    def test_wait_for_connection(self):
+        pool = ConnectionPool(self.connect, 1)
+        results = []
+
+        def use_connection():
+            with pool.connection() as connection:
+                results.append(connection)
+
+        with pool.connection():
+            thread = Thread(target=use_connection)
+            thread.start()
+            thread.join(0.1)
+            # The only connection is in use, so the thread has to wait for it
+            self.assertTrue(thread.is_alive())
+
+        thread.join()
+        self.assertEqual(results, self.connections)
+
+    def test_close(self):
+        pool = ConnectionPool(self.connect, 2)
+
+        with pool.connection() as in_use:
+            with pool.connection() as idle:
+                pass
+            pool.close()
+            self.assertTrue(idle.closed)
+            self.assertFalse(in_use.closed)
+
+        self.assertTrue(in_use.closed)
+        self.assertEqual(pool.open_count, 0)
+        self.assertRaises(ValueError, pool.acquire)
+
+
+# Tables and columns of a vault created by the current version of rizpass
+SCHEMA = ["credentials", "vault_meta", "credential_tombstones", "version", "updated_at"]
+
+
+class TestMysqlManager(unittest.TestCase):
+    def setUp(self):
+        self.manager = self.open_manager(SCHEMA)
+
+    def open_manager(self, schema: list, upgrade_error: Exception = None):
+        """Opens a manager on a vault with the given tables and columns, whose upgrades fail with upgrade_error."""
+        self.connection = MagicMock()
+        cursor = self.connection.cursor.return_value
+        cursor.fetchall.return_value = [(name, ) for name in schema]
+        if upgrade_error is not None:
+            cursor.execute.side_effect = lambda query, args=None: self.fail_upgrade(query, upgrade_error)
+
+        with patch("pymysql.connect", return_value=self.connection):
+            manager = MysqlManager(DbConfig("localhost", "user", "password", "rizpass"))
+
+        # Only the queries made after connecting are checked, the ones made when connecting are kept apart
+        self.connect_queries = self.get_queries()
+        cursor.reset_mock(return_value=False, side_effect=True)
+        return manager
+
+    def fail_upgrade(self, query: str, error: Exception):
+        if query.startswith("ALTER") or query.startswith("CREATE"):
+            raise error
+
+    def tearDown(self):
+        self.manager.close()
+
+    def get_queries(self):
+        """Returns the queries as pymysql sends them, with the args escaped and quoted into them."""
+        from pymysql.converters import escape_item
+
+        queries = []
+        for call in self.connection.cursor.return_value.execute.call_args_list:
+            query, args = (call.args + (None, ))[:2]
+            queries.append(query % tuple(escape_item(arg, "utf8mb4") for arg in args) if args is not None else query)
+        return queries
+
+    def test_add_many(self):
+        raw_creds = [RawCredential(0, f"Title {i}", "Username", "Email", "Password", "Salt") for i in range(BULK_CHUNK_SIZE + 1)]
+        self.manager.add_many(raw_creds)
+
+        queries = self.get_queries()
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(queries[0].count("'Username'"), BULK_CHUNK_SIZE)
+        self.assertIn(f"'Title {BULK_CHUNK_SIZE}'", queries[1])
+        # All chunks are written in a single transaction
+        self.connection.begin.assert_called_once()
+        self.connection.commit.assert_called_once()
+
+    def test_modify_and_remove_many(self):
+        self.manager.modify_many([
+            RawCredential(1, "Title 1", "Username", "Email", "Password", "Salt"),
+            RawCredential(2, "Title 2", "Username", "Email", "Password", "Salt"),
+        ])
+        self.manager.remove_many([1, 2, 3])
+
+        queries = self.get_queries()
+        self.assertEqual(len(queries), 3)
+        self.assertIn("SELECT 1 AS id, 'Title 1' AS title", queries[0])
+        self.assertIn("UNION ALL SELECT 2 AS id, 'Title 2' AS title", queries[0])
+        # Removed credentials leave tombstones behind in the same transaction
+        self.assertIn("SELECT id FROM credentials WHERE id IN (1, 2, 3)", queries[1])
+        self.assertEqual(queries[2], "DELETE FROM credentials WHERE id IN (1, 2, 3)")
+
+    def test_rollback(self):
+        self.connection.cursor.return_value.execute.side_effect = [None, ValueError("Query failed")]
+
+        with self.assertRaises(ValueError):
+            self.manager.add_many([RawCredential(0, "Title", "Username", "Email", "Password", "Salt")] * (BULK_CHUNK_SIZE + 1))
+
+        self.connection.rollback.assert_called_once()
+        self.connection.commit.assert_not_called()
+        self.assertIsNone(self.manager.transaction.connection)
+        self.assertEqual(self.manager.pool.open_count, 1)
+
+    def test_iter_credentials(self):
+        from pymysql.cursors import SSCursor
+
+        cursor = self.connection.cursor.return_value
+        cursor.fetchmany.side_effect = [[(i, "Title", "Username", "Email", "Password", "Salt") for i in (1, 2)], [(3, "Title", "Username", "Email", "Password", "Salt")], []]
+
+        self.assertEqual([raw_cred.id for raw_cred in self.manager.iter_credentials(2)], [1, 2, 3])
+        self.connection.cursor.assert_called_with(SSCursor)
+        cursor.fetchmany.assert_called_with(2)
+        # The cursor is closed before the connection goes back to the pool
+        cursor.close.assert_called_once()
+        self.assertEqual(len(self.manager.pool.idle), 1)
+
+    def test_batch_interface(self):
+        cursor = self.connection.cursor.return_value
+        cursor.fetchall.return_value = [(i, "Title", "Username", "Email", "Password", "Salt") for i in (3, 1)]
+        self.assertEqual([raw_cred.id for raw_cred in self.manager.get_many([1, 2, 3])], [1, 3])
+
+        cursor.fetchone.return_value = (1, )
+        self.assertTrue(self.manager.exists(1))
+        self.assertEqual(self.manager.count(), 1)
+
+        queries = self.get_queries()
+        self.assertEqual(queries[0], "SELECT id, title, username, email, password, salt FROM credentials WHERE id IN (1, 2, 3)")
+        self.assertEqual(queries[1], "SELECT EXISTS(SELECT 1 FROM credentials WHERE id = 1)")
+        self.assertEqual(queries[2], "SELECT COUNT(*) FROM credentials")
+
+    def test_versions(self):
+        self.connection.cursor.return_value.fetchall.return_value = [(1, 2)]
+        self.assertEqual(self.manager.get_versions([1, 2]), {1: 2})
+        self.manager.modify_credential(1, "Title", "Username", "Email", "Password", "Salt")
+
+        queries = self.get_queries()
+        self.assertEqual(queries[0], "SELECT id, version FROM credentials WHERE id IN (1, 2)")
+        self.assertIn("version = version + 1 WHERE id = 1", queries[1])
+
+    def test_add_meta(self):
+        import pymysql
+
+        cursor = self.connection.cursor.return_value
+        self.assertEqual(self.manager.add_meta("name", "value"), "value")
+
+        def insert_after_other_client(query: str, args=None):
+            if query.startswith("INSERT INTO vault_meta"):
+                raise pymysql.err.IntegrityError(1062, "Duplicate entry")
+
+        cursor.execute.side_effect = insert_after_other_client
+        cursor.fetchone.return_value = ("stored value", )
+        with self.manager.batch():
+            self.assertEqual(self.manager.add_meta("name", "value"), "stored value")
+
+        queries = self.get_queries()
+        # The record is never replaced and the one stored by the other client is read past the snapshot of the transaction
+        self.assertEqual(queries[0], "INSERT INTO vault_meta(name, value) VALUES('name', 'value')")
+        self.assertEqual(queries[2], "SELECT value FROM vault_meta WHERE name = 'name' LOCK IN SHARE MODE")
+
+    def test_upgrade_schema(self):
+        import pymysql
+
+        self.manager.close()
+        self.manager = self.open_manager(["credentials"])
+        # The missing table and column are added when connecting, outside of any transaction
+        self.assertIn("ALTER TABLE credentials ADD COLUMN version INT NOT NULL DEFAULT 1", self.connect_queries)
+        self.assertTrue(any("ADD COLUMN updated_at" in query for query in self.connect_queries))
+        for table in ["vault_meta", "credential_tombstones"]:
+            self.assertTrue(any(query.startswith(f"CREATE TABLE IF NOT EXISTS {table}") for query in self.connect_queries))
+        self.connection.begin.assert_not_called()
+
+        # Vaults that are up to date are left alone
+        self.manager.close()
+        self.manager = self.open_manager(SCHEMA)
+        self.assertEqual([query for query in self.connect_queries if not query.startswith("SELECT")], [])
+
+        self.manager.close()
+        self.manager = self.open_manager(["credentials"], pymysql.err.OperationalError(1142, "ALTER command denied"))
+        # Versions are not used if the column could not be added
+        self.assertIsNone(self.manager.get_versions([1]))
+        self.manager.modify_many([RawCredential(1, "Title", "Username", "Email", "Password", "Salt")])
+        self.assertNotIn("version", self.get_queries()[0])
+        # Changes are not tracked and removals leave no tombstones behind, so copies are made in full
+        self.assertIsNone(self.manager.get_changes(100.0))
+        self.manager.remove_many([1])
+        self.assertEqual(self.get_queries()[1:], ["DELETE FROM credentials WHERE id IN (1)"])
+
+    def test_get_changes(self):
+        cursor = self.connection.cursor.return_value
+        cursor.fetchone.return_value = (1000.5, )
+        cursor.fetchall.side_effect = [[(1, "Title", "Username", "Email", "Password", "Salt")], [(2, )]]
+
+        raw_creds, removed_ids, mark = self.manager.get_changes(100.0)
+        self.assertEqual([raw_cred.id for raw_cred in raw_creds], [1])
+        self.assertEqual(removed_ids, [2])
+        self.assertEqual(mark, 1000.5 - CHANGE_OVERLAP)
+
+        queries = self.get_queries()
+        self.assertEqual(queries[0], "SELECT UNIX_TIMESTAMP(CURRENT_TIMESTAMP(6))")
+        self.assertIn("WHERE updated_at >= FROM_UNIXTIME(100.0e0)", queries[1])
+        self.assertIn("WHERE deleted_at >= FROM_UNIXTIME(100.0e0)", queries[2])
@@ -0,0 +1,75 @@
+import unittest
+from random import random
+from time import sleep
+
+from .parallel import parallel_map, pipeline_map, set_workers
+
+
+def slow_str(item: int) -> str:
+    # Finishes the items out of order
+    sleep(random() / 1000)
+    return str(item)
+
+
+class TestParallel(unittest.TestCase):
+    def tearDown(self):
+        set_workers()
+
+    def test_parallel_map(self):
+        set_workers(4, "thread")
+        self.assertEqual(parallel_map(slow_str, list(range(50))), [str(i) for i in range(50)])
+        self.assertRaises(TypeError, lambda: parallel_map(str, range(5)))
+
+    def test_pipeline_map_order(self):
+        set_workers(4, "thread")
+        self.assertEqual(list(pipeline_map(slow_str, iter(range(100)), 7)), [(i, str(i)) for i in range(100)])
+
+        set_workers(2, "process")
+        self.assertEqual(list(pipeline_map(str, iter(range(100)), 30)), [(i, str(i)) for i in range(100)])
+
+    def test_pipeline_map_close(self):
+        set_workers(2, "thread")
+        read = []
+        applied = []
+
+        def items():
+            try:
+                for i in range(1000):
+                    read.append(i)
+                    yield i
+            finally:
+                read.append("closed")
+
+        def func(item: int) -> str:
+            applied.append(item)
+            sleep(0.001)
+            return str(item)
+
+        results = pipeline_map(func, items(), 10, prefetch=2)
+        self.assertEqual(next(results), (0, "0"))
+        # Only a few chunks are read ahead of the results that have been consumed
+        self.assertLessEqual(len(read), 50)
+        results.close()
+
+        # Items that were not started yet are dropped and the items are closed
+        self.assertLess(len(applied), 50)
+        self.assertEqual(read[-1], "closed")
+
+    def test_pipeline_map_errors(self):
+        set_workers(2, "thread")
+
+        def failing_items():
+            yield 1
+            raise ValueError("Could not read the items")
+
+        with self.assertRaises(ValueError):
+            list(pipeline_map(str, failing_items(), 1))
+
+        def failing_func(item: int) -> str:
+            raise KeyError(item)
+
+        with self.assertRaises(KeyError):
+            list(pipeline_map(failing_func, iter(range(10)), 3))
+
+        self.assertRaises(ValueError, lambda: next(pipeline_map(str, [], 0)))
+        self.assertRaises(ValueError, lambda: next(pipeline_map(str, [], 1, prefetch=0)))
@@ -1,7 +1,10 @@
 import unittest
+from unittest.mock import patch
 import string
+from base64 import b64encode
 
-from .passwords import decrypt_string, generate_password, generate_salt, get_pass_details, follows_password_requirements, encrypt_string, encrypt_and_encode, decode_and_decrypt
+from . import passwords
+from .passwords import KeyCache, calibrate_kdf_params, decode_salt, encode_salt, validate_kdf_params, decrypt_string, generate_password, get_cipher, get_custom_key, enable_key_cache, generate_salt, get_pass_details, follows_password_requirements, encrypt_string, encrypt_and_encode, decode_and_decrypt
 
 
 class TestPasswords(unittest.TestCase):
@@ -226,6 +229,139 @@ class TestPasswords(unittest.TestCase):
 
         self.assertEqual(payload, decrypted_password)
 
+    def test_shared_cipher(self):
+        """Tests if a cipher derived once gives the same output as deriving the key for every field"""
+        master_pass = "123"
+        salt = generate_salt(16)
+        cipher = get_cipher(master_pass, salt)
+
+        for payload in ["title", "username", "email", "password"]:
+            encrypted_payload = encrypt_and_encode(master_pass, payload, salt, cipher)
+            self.assertEqual(encrypted_payload, encrypt_and_encode(master_pass, payload, salt))
+            self.assertEqual(decode_and_decrypt(master_pass, encrypted_payload, salt, cipher), payload)
+
+
+class TestKeyCache(unittest.TestCase):
+    def tearDown(self):
+        enable_key_cache(0)
+
+    def test_get_and_put(self):
+        cache = KeyCache(4)
+        salt = generate_salt(16)
+
+        self.assertEqual(cache.get("123", salt), None)
+        cache.put("123", salt, b"k" * 32)
+        self.assertEqual(cache.get("123", salt), b"k" * 32)
+        # Keys derived from another master password must not be returned
+        self.assertEqual(cache.get("1234", salt), None)
+
+    def test_lru_eviction(self):
+        cache = KeyCache(2)
+        salts = [generate_salt(16) for _ in range(3)]
+
+        cache.put("123", salts[0], b"0" * 32)
+        cache.put("123", salts[1], b"1" * 32)
+        cache.get("123", salts[0])
+        cache.put("123", salts[2], b"2" * 32)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("123", salts[0]), b"0" * 32)
+        self.assertEqual(cache.get("123", salts[1]), None)
+        self.assertEqual(cache.get("123", salts[2]), b"2" * 32)
+
+    def test_idle_ttl(self):
+        cache = KeyCache(4, 10)
+        salt = generate_salt(16)
+
+        with patch("rizpass.passwords.monotonic", return_value=100):
+            cache.put("123", salt, b"k" * 32)
+        with patch("rizpass.passwords.monotonic", return_value=105):
+            self.assertEqual(cache.get("123", salt), b"k" * 32)
+        with patch("rizpass.passwords.monotonic", return_value=116):
+            self.assertEqual(cache.get("123", salt), None)
+        self.assertEqual(len(cache), 0)
+
+    def test_clear_wipes_keys(self):
+        cache = KeyCache(4)
+        salt = generate_salt(16)
+        cache.put("123", salt, b"k" * 32)
+        stored_key = next(iter(cache._KeyCache__keys.values()))[0]
+
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(stored_key, bytearray(32))
+
+    def test_get_custom_key_uses_cache(self):
+        enable_key_cache(16)
+        salt = generate_salt(16)
+
+        key = get_custom_key("123", salt)
+        with patch("cryptography.hazmat.primitives.kdf.pbkdf2.PBKDF2HMAC") as kdf:
+            self.assertEqual(get_custom_key("123", salt), key)
+            kdf.assert_not_called()
+
+        passwords.clear_key_cache()
+        self.assertEqual(len(passwords.key_cache), 0)
+
+
+class TestKdfParams(unittest.TestCase):
+    SCRYPT_PARAMS = {"kdf": passwords.KDF_SCRYPT, "n": 2 ** 10, "r": 8, "p": 1}
+
+    def tearDown(self):
+        passwords.set_kdf_params(passwords.LEGACY_KDF_PARAMS)
+
+    def test_encode_and_decode_salt(self):
+        salt = generate_salt(16)
+
+        encoded_salt = encode_salt(salt, self.SCRYPT_PARAMS)
+        self.assertTrue(encoded_salt.startswith("$rp1$scrypt$"))
+        self.assertEqual(decode_salt(encoded_salt), (salt, self.SCRYPT_PARAMS))
+
+    def test_legacy_salt(self):
+        """Tests if salts of records created before the KDF was configurable are still read as PBKDF2 with 100000 iterations"""
+        salt = generate_salt(16)
+        legacy_salt = b64encode(salt).decode("ascii")
+
+        self.assertEqual(encode_salt(salt, passwords.LEGACY_KDF_PARAMS), legacy_salt)
+        self.assertEqual(decode_salt(legacy_salt), (salt, passwords.LEGACY_KDF_PARAMS))
+
+    def test_validate_kdf_params(self):
+        self.assertEqual(validate_kdf_params({**self.SCRYPT_PARAMS, "salt": "abc"}), self.SCRYPT_PARAMS)
+
+        for params in [
+            {"kdf": "md5"},
+            {"kdf": passwords.KDF_PBKDF2},
+            {"kdf": passwords.KDF_PBKDF2, "iterations": "100000"},
+            {"kdf": passwords.KDF_PBKDF2, "iterations": 0},
+            {**self.SCRYPT_PARAMS, "n": 1000},
+            {**self.SCRYPT_PARAMS, "n": 2 ** 30},
+            {**self.SCRYPT_PARAMS, "r": 1000},
+        ]:
+            with self.assertRaises(ValueError):
+                validate_kdf_params(params)
+
+        with self.assertRaises(ValueError):
+            decode_salt("$rp1$scrypt$n=3,r=8,p=1$" + b64encode(generate_salt(16)).decode("ascii"))
+
+    def test_scrypt_encryption(self):
+        salt = generate_salt(16)
+        cipher = get_cipher("123", salt, self.SCRYPT_PARAMS)
+        encrypted_payload = encrypt_and_encode("123", "payload", salt, cipher)
+
+        self.assertEqual(decode_and_decrypt("123", encrypted_payload, salt, get_cipher("123", salt, self.SCRYPT_PARAMS)), "payload")
+        self.assertNotEqual(encrypted_payload, encrypt_and_encode("123", "payload", salt))
+
+    def test_calibrate_kdf_params(self):
+        with patch("rizpass.passwords.time_kdf", return_value=0.01):
+            self.assertEqual(calibrate_kdf_params(passwords.KDF_SCRYPT, 0.08), {"kdf": passwords.KDF_SCRYPT, "n": 2 ** 17, "r": 8, "p": 1})
+            self.assertEqual(calibrate_kdf_params(passwords.KDF_PBKDF2, 0.04), {"kdf": passwords.KDF_PBKDF2, "iterations": 200000})
+            # Calibration must never pick parameters weaker than the defaults
+            self.assertEqual(calibrate_kdf_params(passwords.KDF_PBKDF2, 0.001), passwords.LEGACY_KDF_PARAMS)
+
+        with self.assertRaises(ValueError):
+            calibrate_kdf_params("md5", 0.5)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import tempfile
+import os
+from time import time
+from unittest.mock import patch
+
+from .credentials import RawCredential
+from .memory_manager import MemoryManager
+from .replica_manager import ReplicaManager
+from .sqlite_manager import SqliteManager
+
+TEMP_FILE_PATH = f"{tempfile.gettempdir()}/rizpass_test_replica_manager_{int(time())}.db"
+
+
+class TestReplicaManager(unittest.TestCase):
+    def setUp(self):
+        self.operations = []
+        self.remote = MemoryManager(
+            [RawCredential(i, f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt") for i in range(1, 4)],
+            # Records the round trips made to the remote manager
+            lambda operation, rows: self.operations.append((operation, rows)) or 0
+        )
+        self.remote.set_meta("Test Meta", "Test Value")
+        self.manager = self.open_manager(lambda: self.remote)
+
+    def tearDown(self):
+        self.manager.close()
+        for file_path in [TEMP_FILE_PATH, TEMP_FILE_PATH + "-wal", TEMP_FILE_PATH + "-shm"]:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
+    def open_manager(self, connect, source: str = "memory://test"):
+        # Refreshes are made by the tests themselves
+        return ReplicaManager(SqliteManager(TEMP_FILE_PATH), connect, "memory", source, 3600)
+
+    def test_first_sync(self):
+        self.assertEqual([raw_cred.title for raw_cred in self.manager.get_all_credentials()], ["Test Title 1", "Test Title 2", "Test Title 3"])
+        self.assertEqual(self.manager.get_meta("Test Meta"), "Test Value")
+        self.assertEqual(self.manager.get_mode(), "memory")
+
+    def test_delta_sync(self):
+        self.manager.list_ids()
+        self.remote.modify_credential(2, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        self.remote.remove_credential(3)
+        self.remote.add_credential("Test Title 4", "Test Username", "Test Email", "Test Password", "Test Salt")
+        self.operations.clear()
+
+        self.manager.sync()
+        self.assertEqual([raw_cred.title for raw_cred in self.manager.get_many([1, 2, 3, 4])], ["Test Title 1", "New Title", "Test Title 4"])
+        # Only the changed credentials are transferred
+        self.assertIn(("get_changes", 2), self.operations)
+        self.assertNotIn("get_all_credentials", [operation for operation, _ in self.operations])
+
+    def test_write_through(self):
+        self.manager.list_ids()
+        id = self.manager.add_credential("Test Title 4", "Test Username", "Test Email", "Test Password", "Test Salt")
+        self.assertEqual(self.remote.get_credential(id).title, "Test Title 4")
+        self.assertEqual(self.manager.get_credential(id).title, "Test Title 4")
+
+        self.manager.remove_many([1, 2])
+        self.assertEqual(self.manager.list_ids(), [3, id])
+
+        with self.assertRaises(ValueError):
+            with self.manager.batch():
+                self.manager.modify_credential(3, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+                raise ValueError()
+        self.assertEqual(self.manager.get_credential(3).title, "Test Title 3")
+
+    def test_failed_commit(self):
+        self.manager.list_ids()
+        with patch.object(self.remote, "commit", side_effect=ConnectionError("Commit failed")):
+            with self.assertRaises(ConnectionError):
+                with self.manager.batch():
+                    self.manager.modify_credential(1, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+
+        # Later writes are not taken for part of the failed batch, so they are copied right away
+        id = self.manager.add_credential("Test Title 4", "Test Username", "Test Email", "Test Password", "Test Salt")
+        self.assertEqual(self.manager.get_credential(id).title, "Test Title 4")
+
+    def test_removed_without_tombstone(self):
+        self.manager.list_ids()
+        # A credential removed by an older client leaves no tombstone behind
+        self.remote.credentials.pop(1)
+
+        self.manager.sync()
+        self.assertEqual(self.manager.list_ids(), [2, 3])
+
+    def test_read_during_sync(self):
+        self.manager.list_ids()
+        self.remote.credentials.pop(1)
+        # Forces the whole vault to be copied again, which first empties the replica
+        self.remote.get_changes = lambda mark: None
+        remote_count = self.remote.count
+        seen_ids = []
+
+        def count() -> int:
+            # Called while the sync is still running
+            seen_ids.append(self.manager.list_ids())
+            return remote_count()
+
+        self.remote.count = count
+        self.manager.sync()
+        # Reads see the replica as it was before the sync until it is done
+        self.assertEqual(seen_ids, [[1, 2, 3]])
+        self.assertEqual(self.manager.list_ids(), [2, 3])
+
+    def test_offline(self):
+        # Metadata is copied once it has been read, the vault key is read whenever the vault is unlocked
+        self.manager.get_meta("Test Meta")
+        self.manager.list_ids()
+        self.manager.close()
+
+        def connect():
+            raise SystemExit(1)
+
+        # The copy can be read while the remote database cannot be reached
+        self.manager = self.open_manager(connect)
+        self.assertEqual(self.manager.count(), 3)
+        self.assertEqual(self.manager.get_meta("Test Meta"), "Test Value")
+        self.assertRaises(SystemExit, lambda: self.manager.remove_credential(1))
+
+    def test_other_source(self):
+        self.manager.list_ids()
+        self.manager.close()
+
+        remote = MemoryManager([RawCredential(7, "Other Title", "Test Username", "Test Email", "Test Password", "Test Salt")])
+        self.manager = self.open_manager(lambda: remote, "memory://other")
+        self.assertEqual([raw_cred.title for raw_cred in self.manager.get_all_credentials()], ["Other Title"])
+        self.assertIsNone(self.manager.get_meta("Test Meta"))
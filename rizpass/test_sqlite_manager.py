@@ -0,0 +1,89 @@
+import unittest
+import tempfile
+import os
+import stat
+from time import time
+
+from .credentials import RawCredential
+from .sqlite_manager import SqliteManager
+
+TEMP_FILE_PATH = f"{tempfile.gettempdir()}/rizpass_test_sqlite_manager_{int(time())}.db"
+
+
+class TestSqliteManager(unittest.TestCase):
+    def setUp(self):
+        self.manager = SqliteManager(TEMP_FILE_PATH)
+
+    def tearDown(self):
+        self.manager.close()
+        for file_path in [TEMP_FILE_PATH, TEMP_FILE_PATH + "-wal", TEMP_FILE_PATH + "-shm"]:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
+    def test_create_database(self):
+        self.assertEqual(stat.S_IMODE(os.stat(TEMP_FILE_PATH).st_mode), 0o600)
+        self.assertEqual(self.manager.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(self.manager.get_mode(), "sqlite")
+
+    def test_credentials(self):
+        self.assertEqual(self.manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt"), 1)
+        self.assertEqual(self.manager.add_credential("Test Title 2", "Test Username 2", "Test Email 2", "Test Password 2", "Test Salt 2"), 2)
+
+        self.manager.modify_credential(1, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        self.assertEqual(self.manager.get_credential(1).title, "New Title")
+        self.assertIsNone(self.manager.get_credential(3))
+
+        self.manager.remove_credential(2)
+        self.assertEqual([raw_cred.id for raw_cred in self.manager.get_all_credentials()], [1])
+
+        # Ids are never reused
+        self.manager.remove_all_credentials()
+        self.assertEqual(self.manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt"), 3)
+        self.assertRaises(TypeError, lambda: self.manager.get_credential("1"))
+
+    def test_persistence(self):
+        self.manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+        self.manager.set_meta("Test Meta", "Test Value")
+        self.manager.set_meta("Test Meta", "New Value")
+        self.manager.close()
+
+        self.manager = SqliteManager(TEMP_FILE_PATH)
+        self.assertEqual(self.manager.get_credential(1).title, "Test Title")
+        self.assertEqual(self.manager.get_meta("Test Meta"), "New Value")
+        self.assertIsNone(self.manager.get_meta("Missing Meta"))
+
+    def test_bulk_operations(self):
+        self.manager.add_many([RawCredential(0, f"Test Title {i}", "Test Username", "Test Email", "Test Password", "Test Salt") for i in range(5)])
+        self.manager.modify_many([RawCredential(2, "New Title", "Test Username", "Test Email", "Test Password", "Test Salt")])
+        self.manager.remove_many([1, 3])
+
+        self.assertEqual(self.manager.list_ids(), [2, 4, 5])
+        self.assertEqual(self.manager.count(), 3)
+        self.assertTrue(self.manager.exists(2))
+        self.assertFalse(self.manager.exists(1))
+        self.assertEqual([raw_cred.title for raw_cred in self.manager.get_many([5, 1, 2])], ["Test Title 4", "New Title"])
+        self.assertEqual([raw_cred.id for raw_cred in self.manager.iter_credentials(2)], [2, 4, 5])
+
+    def test_batch_rollback(self):
+        self.manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+
+        with self.assertRaises(ValueError):
+            with self.manager.batch():
+                self.manager.add_credential("Test Title 2", "Test Username 2", "Test Email 2", "Test Password 2", "Test Salt 2")
+                with self.manager.batch():
+                    self.manager.remove_credential(1)
+                raise ValueError()
+
+        self.assertEqual([raw_cred.title for raw_cred in self.manager.get_all_credentials()], ["Test Title"])
+
+    def test_concurrent_reader(self):
+        self.manager.add_credential("Test Title", "Test Username", "Test Email", "Test Password", "Test Salt")
+
+        reader = SqliteManager(TEMP_FILE_PATH)
+        self.manager.begin()
+        self.manager.add_credential("Test Title 2", "Test Username 2", "Test Email 2", "Test Password 2", "Test Salt 2")
+        # Readers are not blocked by a writer and do not see its changes until they are committed
+        self.assertEqual(reader.count(), 1)
+        self.manager.commit()
+        self.assertEqual(reader.count(), 2)
+        reader.close()
@@ -42,6 +42,24 @@ class TestValidator(unittest.TestCase):
         self.assertEqual(validation_result[0], False)
         self.assertEqual(len(validation_result[1]), 1)
 
+        test_config = {"db_type": "sqlite", "db_name": "~/.rizpass.db"}
+        validation_result = validate_config(test_config)
+        self.assertEqual(validation_result[0], True)
+
+        test_config = {"db_type": "sqlite"}
+        validation_result = validate_config(test_config)
+        self.assertEqual(validation_result[0], False)
+        self.assertEqual(len(validation_result[1]), 1)
+
+        test_config = {"db_type": "mysql", "db_host": "localhost", "db_user": "rizpass", "db_name": "rizpass", "db_replica": "~/.rizpass_replica.db"}
+        validation_result = validate_config(test_config)
+        self.assertEqual(validation_result[0], True)
+
+        test_config = {"db_type": "mysql", "db_host": "localhost", "db_user": "rizpass", "db_name": "rizpass", "db_replica": 1}
+        validation_result = validate_config(test_config)
+        self.assertEqual(validation_result[0], False)
+        self.assertEqual(len(validation_result[1]), 1)
+
 
 if __name__ == "__main__":
     unittest.main()
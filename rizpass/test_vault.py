@@ -0,0 +1,167 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import os
+from time import time
+
+from . import passwords, vault
+from .credentials import Credential
+from .file_manager import LOCK_SUFFIX, FileManager
+from .passwords import KDF_SCRYPT, LEGACY_KDF_PARAMS, generate_salt, generate_vault_key, get_kdf_params, set_kdf_params
+from .vault import VAULT_KEY_META, VERIFY_SAMPLE_SIZE, check_master_password, get_key_record_kdf_params, is_migrated, rewrap_vault_key, unlock_vault, unwrap_vault_key, wrap_vault_key
+
+TEMP_FILE_PATH = f"{tempfile.gettempdir()}/rizpass_test_vault_{int(time())}.json"
+
+
+class TestVault(unittest.TestCase):
+    def tearDown(self):
+        for file_path in [TEMP_FILE_PATH, TEMP_FILE_PATH + LOCK_SUFFIX]:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
+    def add_credentials(self, manager: FileManager, master_pass, num: int):
+        for i in range(1, num + 1):
+            raw_cred = Credential(i, f"title {i}", f"username {i}", f"email {i}", f"password {i}").get_raw_credential(master_pass, generate_salt(16))
+            manager.add_credential(raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, raw_cred.salt)
+
+    def test_wrap_and_unwrap(self):
+        vault_key = generate_vault_key()
+        key_record = wrap_vault_key("123", vault_key)
+
+        self.assertEqual(unwrap_vault_key("123", key_record).data_key, vault_key.data_key)
+        with self.assertRaises(Exception):
+            unwrap_vault_key("1234", key_record)
+
+    def test_new_vault(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        vault_key = unlock_vault("123", manager)
+
+        self.assertNotEqual(vault_key, None)
+        self.assertEqual(is_migrated(manager.get_meta(VAULT_KEY_META)), True)
+        self.assertEqual(unlock_vault("1234", manager), None)
+        self.assertEqual(unlock_vault("123", manager).data_key, vault_key.data_key)
+        manager.close()
+
+    def test_migration(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        self.add_credentials(manager, "123", 3)
+
+        # A wrong master password must not create a vault key
+        self.assertEqual(unlock_vault("1234", manager), None)
+        self.assertEqual(manager.get_meta(VAULT_KEY_META), None)
+
+        vault_key = unlock_vault("123", manager)
+        manager.close()
+
+        manager = FileManager(TEMP_FILE_PATH)
+        self.assertEqual(is_migrated(manager.get_meta(VAULT_KEY_META)), True)
+        for raw_cred in manager.get_all_credentials():
+            self.assertEqual(raw_cred.get_credential(vault_key).title, f"title {raw_cred.id}")
+        manager.close()
+
+    def test_wrong_password_single_derivation(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        self.add_credentials(manager, "123", 2)
+        unlock_vault("123", manager)
+
+        with patch("rizpass.passwords.derive_key", wraps=passwords.derive_key) as derive_key:
+            self.assertEqual(unlock_vault("1234", manager), None)
+            self.assertEqual(derive_key.call_count, 1)
+        manager.close()
+
+    def test_wrong_password_legacy_vault(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        self.add_credentials(manager, "123", 10)
+
+        with patch("rizpass.vault.decrypt_credential_fields", wraps=vault.decrypt_credential_fields) as decrypt_fields:
+            self.assertEqual(check_master_password("1234", manager.get_all_credentials()), False)
+            self.assertEqual(decrypt_fields.call_count, VERIFY_SAMPLE_SIZE)
+
+        self.assertEqual(check_master_password("123", manager.get_all_credentials()), True)
+        self.assertEqual(check_master_password("1234", []), True)
+        manager.close()
+
+    def test_concurrent_vault_key_creation(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        self.add_credentials(manager, "123", 3)
+        other_vault_key = generate_vault_key()
+        add_meta = manager.add_meta
+
+        def add_meta_after_other_process(name: str, value: str) -> str:
+            # Another process stores its vault key right before this one
+            manager.set_meta(name, wrap_vault_key("123", other_vault_key, migrated=False))
+            return add_meta(name, value)
+
+        with patch.object(manager, "add_meta", side_effect=add_meta_after_other_process):
+            vault_key = unlock_vault("123", manager)
+
+        # The vault key stored first is used, so both processes can decrypt what the other one encrypts
+        self.assertEqual(vault_key.data_key, other_vault_key.data_key)
+        self.assertEqual(unwrap_vault_key("123", manager.get_meta(VAULT_KEY_META)).data_key, other_vault_key.data_key)
+        for raw_cred in manager.get_all_credentials():
+            self.assertEqual(raw_cred.get_credential(other_vault_key).title, f"title {raw_cred.id}")
+        manager.close()
+
+    def test_corrupted_credentials(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        self.add_credentials(manager, "123", 10)
+        for raw_cred in manager.get_many(list(range(1, VERIFY_SAMPLE_SIZE + 1))):
+            manager.modify_credential(raw_cred.id, raw_cred.title, raw_cred.username, raw_cred.email, raw_cred.password, "$corrupted")
+
+        # Credentials that cannot even be decoded say nothing about the master password
+        self.assertEqual(check_master_password("123", manager.get_all_credentials()), True)
+        self.assertEqual(check_master_password("1234", manager.get_all_credentials()), False)
+        self.assertEqual(check_master_password("123", manager.get_many([1, 2])), False)
+        manager.close()
+
+    def test_interrupted_migration(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        self.add_credentials(manager, "123", 3)
+
+        vault_key = generate_vault_key()
+        manager.set_meta(VAULT_KEY_META, wrap_vault_key("123", vault_key, migrated=False))
+        migrated_cred = manager.get_credential(2).get_credential("123").get_raw_credential(vault_key, generate_salt(16))
+        manager.modify_credential(2, migrated_cred.title, migrated_cred.username, migrated_cred.email, migrated_cred.password, migrated_cred.salt)
+
+        self.assertEqual(unlock_vault("123", manager).data_key, vault_key.data_key)
+        self.assertEqual(is_migrated(manager.get_meta(VAULT_KEY_META)), True)
+        for raw_cred in manager.get_all_credentials():
+            self.assertEqual(raw_cred.get_credential(vault_key).password, f"password {raw_cred.id}")
+        manager.close()
+
+    def test_rewrap(self):
+        manager = FileManager(TEMP_FILE_PATH)
+        self.add_credentials(manager, "123", 2)
+        vault_key = unlock_vault("123", manager)
+        raw_creds = [raw_cred.get_obj() for raw_cred in manager.get_all_credentials()]
+
+        with patch.object(manager, "modify_credential") as modify_credential:
+            rewrap_vault_key("456", vault_key, manager)
+            modify_credential.assert_not_called()
+
+        self.assertEqual(unlock_vault("123", manager), None)
+        self.assertEqual(unlock_vault("456", manager).data_key, vault_key.data_key)
+        self.assertEqual([raw_cred.get_obj() for raw_cred in manager.get_all_credentials()], raw_creds)
+        manager.close()
+
+    def test_key_record_kdf_params(self):
+        scrypt_params = {"kdf": KDF_SCRYPT, "n": 2 ** 10, "r": 8, "p": 1}
+        manager = FileManager(TEMP_FILE_PATH)
+        vault_key = unlock_vault("123", manager)
+
+        try:
+            set_kdf_params(scrypt_params)
+            rewrap_vault_key("123", vault_key, manager)
+            set_kdf_params(LEGACY_KDF_PARAMS)
+
+            self.assertEqual(get_key_record_kdf_params(manager.get_meta(VAULT_KEY_META)), scrypt_params)
+            self.assertEqual(unlock_vault("123", manager).data_key, vault_key.data_key)
+            # Credentials exported with the master password must use the parameters of the vault
+            self.assertEqual(get_kdf_params(), scrypt_params)
+        finally:
+            set_kdf_params(LEGACY_KDF_PARAMS)
+            manager.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
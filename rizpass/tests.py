@@ -4,6 +4,18 @@ from .test_better_input import *
 from .test_validator import *
 from .test_passwords import *
 from .test_credentials import *
+from .test_parallel import *
 from .test_file_manager import *
+from .test_binary_vault import *
+from .test_json_vault import *
+from .test_mysql_manager import *
+from .test_mongo_manager import *
+from .test_sqlite_manager import *
+from .test_memory_manager import *
+from .test_caching_manager import *
+from .test_replica_manager import *
+from .test_agent import *
+from .test_machine import *
+from .test_vault import *
 
 unittest.main()
\ No newline at end of file
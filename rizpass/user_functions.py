@@ -1,27 +1,60 @@
 from sys import stderr
-from typing import Callable, List
+from typing import Callable, Iterator, List, Tuple
 from base64 import b64encode
 from getpass import getpass
 import pyperclip
 import os
 import json
+from itertools import chain
 from typing import Union
 
-from rizpass.db_manager import DbManager
+from rizpass.db_manager import DEFAULT_BATCH_SIZE, DbManager, iter_chunks
 
 from .better_input import better_input, confirm, pos_int_input
 from .validator import ensure_type
 from .output import print_red, print_colored, print_green, print_yellow, print_magenta
-from .credentials import Credential, RawCredential
+from .credentials import Credential, DecryptionError, RawCredential, decrypt_credentials, iter_decrypted_credentials, reencrypt_credentials
+from .passwords import VaultKey
 from .misc import print_strong_pass_guidelines
 
 config: dict = dict()
+vault_key: Union[VaultKey, None] = None
+# Set when the credentials are read through a running agent instead of the vault key, see agent.py
+agent = None
 
 
 def exit_app():
     pass
 
 
+def fetch_credential(creds_manager: DbManager, id: int) -> Union[Credential, None]:
+    """
+    Returns the decrypted credential with the given id, through the agent if one is in use.
+    Raises DecryptionError if it cannot be decrypted.
+    """
+    if agent is not None:
+        return agent.get_credential(id)
+
+    raw_cred = creds_manager.get_credential(id)
+    if raw_cred is None:
+        return None
+
+    cred, decrypted = decrypt_credentials(vault_key, [raw_cred])[0]
+    if not decrypted:
+        raise DecryptionError()
+    return cred
+
+
+def iter_credentials(creds_manager: DbManager) -> Iterator[Tuple[Credential, bool]]:
+    """Yields a (credential, decrypted successfully) pair for each credential, through the agent if one is in use."""
+    if agent is not None:
+        yield from agent.get_credentials()
+        return
+
+    # Credentials are fetched, decrypted and yielded at the same time instead of one step after the other
+    yield from iter_decrypted_credentials(vault_key, creds_manager.iter_credentials())
+
+
 def generate_password(master_pass: str, creds_manager: DbManager, ) -> None:
     from .passwords import generate_password as generate_random_password, follows_password_requirements
 
@@ -129,7 +162,7 @@ def generate_strong_password(master_pass: str, creds_manager: DbManager, ) -> No
 
 
 def add_credential(master_pass: str, creds_manager: DbManager, user_password: str = None) -> None:
-    from . passwords import generate_salt, encrypt_and_encode
+    from . passwords import generate_salt, encrypt_and_encode, get_cipher
     from . output import format_colors
     ensure_type(user_password, Union[str, None], "user_password", "string | None")
 
@@ -155,10 +188,11 @@ def add_credential(master_pass: str, creds_manager: DbManager, user_password: st
         return
 
     salt = generate_salt(16)
-    encrypted_title = encrypt_and_encode(master_pass, title, salt)
-    encrypted_username = encrypt_and_encode(master_pass, username, salt)
-    encrypted_email = encrypt_and_encode(master_pass, email, salt)
-    encrypted_password = encrypt_and_encode(master_pass, password, salt)
+    cipher = get_cipher(vault_key, salt)
+    encrypted_title = encrypt_and_encode(vault_key, title, salt, cipher)
+    encrypted_username = encrypt_and_encode(vault_key, username, salt, cipher)
+    encrypted_email = encrypt_and_encode(vault_key, email, salt, cipher)
+    encrypted_password = encrypt_and_encode(vault_key, password, salt, cipher)
     encoded_salt = b64encode(salt).decode("ascii")
 
     print()
@@ -183,21 +217,17 @@ def get_credential(master_pass: str, creds_manager: DbManager, ) -> None:
         print_red("Aborting operation due to invalid input!", file=stderr)
         return
 
-    raw_cred = None
-
-    raw_cred = creds_manager.get_credential(id)
-
-    if raw_cred == None:
-        print_yellow("No credential with given id found!")
-        return
-
     try:
-        cred: Credential = raw_cred.get_credential(master_pass)
+        cred = fetch_credential(creds_manager, id)
     except Exception as e:
         print_red("Could not get credential due to the following error:", file=stderr)
         print_red(e, file=stderr)
         return
 
+    if cred == None:
+        print_yellow("No credential with given id found!")
+        return
+
     print(cred)
     confirm("Copy password to clipboard? [Y/n]: ", True) and cred.copy_pass()
 
@@ -217,71 +247,50 @@ def filter_credentials(master_pass: str, creds_manager: DbManager, ) -> None:
 
     print()
 
+    any_creds = any_matches = False
+
     try:
-        raw_creds: List[RawCredential] = creds_manager.get_all_credentials()
+        # Credentials are fetched, decrypted and printed at the same time, so matches show up as soon as they are found
+        for cred, _ in iter_credentials(creds_manager):
+            any_creds = True
+            if not cred.matches(title_filter, username_filter, email_filter):
+                continue
+
+            if not any_matches:
+                print("Following credentials meet your given filters:")
+                any_matches = True
+            print(cred)
     except Exception as e:
         print_red("Could not filter credentials due to the following error:", file=stderr)
         print_red(e, file=stderr)
         return
 
-    if not raw_creds:
+    if not any_creds:
         print_yellow("No credentials to filter from!")
         return
 
-    filtered_creds: List[Credential] = []
-    for raw_cred in raw_creds:
-        title = raw_cred.get_title(master_pass)
-        title_match = title_filter.lower() in title.lower()
-        if not title_match:
-            continue
-
-        email = raw_cred.get_email(master_pass)
-        email_match = email_filter.lower() in email.lower()
-        if not email_match:
-            continue
-
-        username = raw_cred.get_username(master_pass)
-        username_match = username_filter.lower() in username.lower()
-        if not username_match:
-            continue
-
-        cred = Credential(raw_cred.id, title, username, email, raw_cred.get_password(master_pass))
-
-        filtered_creds.append(cred)
-
-    if not filtered_creds:
+    if not any_matches:
         print_yellow("No credentials meet your given filter.")
-        return
-
-    print("Following credentials meet your given filters:")
-    for credential in filtered_creds:
-        print(credential)
 
 
 def get_all_credentials(master_pass: str, creds_manager: DbManager, ) -> None:
-    raw_creds: List[RawCredential] = []
+    any_creds = False
+
     try:
-        raw_creds.extend(creds_manager.get_all_credentials())
+        for cred, _ in iter_credentials(creds_manager):
+            if not any_creds:
+                print_magenta("Printing all credentials...")
+                any_creds = True
+
+            print(cred)
+            print()
     except Exception as e:
         print_red("Could not get all credentials due to the following error:", file=stderr)
         print_red(e, file=stderr)
         return
 
-    if not raw_creds:
+    if not any_creds:
         print_yellow("No credentials stored yet.")
-        return
-
-    print_magenta("Printing all credentials...")
-    for raw_cred in raw_creds:
-        try:
-            cred = raw_cred.get_credential(master_pass)
-        except Exception as e:
-            print_red("Could not get credential due to the following error:", file=stderr)
-            print_red(e, file=stderr)
-            continue
-
-        print(cred)
-        print()
 
 
 def get_all_raw_credentials(master_pass: str, creds_manager: DbManager, ) -> None:
@@ -302,7 +311,7 @@ def get_all_raw_credentials(master_pass: str, creds_manager: DbManager, ) -> Non
 
 
 def modify_credential(master_pass: str, creds_manager: DbManager, ) -> None:
-    from .passwords import generate_salt,  encrypt_and_encode
+    from .passwords import generate_salt,  encrypt_and_encode, get_cipher
     from . output import format_colors
 
     id = pos_int_input("Credential ID: ")
@@ -311,7 +320,7 @@ def modify_credential(master_pass: str, creds_manager: DbManager, ) -> None:
         return
 
     try:
-        old_cred = creds_manager.get_credential(id).get_credential(master_pass)
+        old_cred = creds_manager.get_credential(id).get_credential(vault_key)
     except Exception as e:
         print_red("Could not get credential due to the following error:", file=stderr)
         print_red(e, file=stderr)
@@ -345,26 +354,31 @@ def modify_credential(master_pass: str, creds_manager: DbManager, ) -> None:
         return
 
     salt = generate_salt(16)
+    cipher = get_cipher(vault_key, salt)
 
     new_pass = encrypt_and_encode(
-        master_pass,
+        vault_key,
         new_password if new_password else old_cred.password,
-        salt
+        salt,
+        cipher
     )
     new_title = encrypt_and_encode(
-        master_pass,
+        vault_key,
         new_title if new_title else old_cred.title,
-        salt
+        salt,
+        cipher
     )
     new_email = encrypt_and_encode(
-        master_pass,
+        vault_key,
         new_email if new_email else old_cred.email,
-        salt
+        salt,
+        cipher
     )
     new_username = encrypt_and_encode(
-        master_pass,
+        vault_key,
         new_username if new_username else old_cred.username,
-        salt
+        salt,
+        cipher
     )
 
     try:
@@ -392,13 +406,13 @@ def remove_credential(master_pass: str, creds_manager: DbManager, ) -> None:
         return
 
     try:
-        cred = creds_manager.get_credential(id)
+        cred_exists = creds_manager.exists(id)
     except Exception as e:
         print_red("Could not get credential due to the following error:", file=stderr)
         print_red(e, file=stderr)
         return
 
-    if cred == None:
+    if not cred_exists:
         print_red(f"No credential with id: {id} exists!", file=stderr)
         return
 
@@ -436,8 +450,9 @@ def remove_all_credentials(master_pass: str, creds_manager: DbManager, ) -> None
 
 
 def change_masterpass(master_pass: str, creds_manager: DbManager, ) -> None:
-    from .passwords import generate_salt, encrypt_and_encode, follows_password_requirements
+    from .passwords import follows_password_requirements, clear_key_cache
     from .output import format_colors
+    from .vault import rewrap_vault_key
 
     global config
 
@@ -468,10 +483,10 @@ def change_masterpass(master_pass: str, creds_manager: DbManager, ) -> None:
             if confirm(format_colors("Are you {red}SURE{reset} you want to continue? [{red}y{reset}/{green}N{reset}] ")):
                 break
 
-    # Change database password
-    if config.get("db_type", None):
+    # Change database password. A sqlite database is only protected by the vault key
+    if config.get("db_type", None) in ["mysql", "mongo"]:
         # TODO: Implement input validation
-        from .db_manager import DbConfig
+        from .db_manager import DbConfig, open_remote_manager
 
         db_name = 'MongoDB' if config['db_type'] == 'mongo' else 'MySQL'
         root_user = better_input(f"Input {db_name} root username: ")
@@ -479,14 +494,14 @@ def change_masterpass(master_pass: str, creds_manager: DbManager, ) -> None:
 
         if config["db_type"] == "mysql":
             from .mysql_manager import MysqlManager
-            temp_db_manager = MysqlManager(DbConfig(config["db_host"], root_user, root_pass, "", config.get("db_port", None)))
-            temp_db_manager.mysql_cursor.execute(
+            temp_db_manager = MysqlManager(DbConfig(config["db_host"], root_user, root_pass, "", config.get("db_port", None)), 1)
+            temp_db_manager.execute(
                 "ALTER USER %s@'%%' IDENTIFIED BY %s;",
                 (config["db_user"],  new_masterpass, )
             )
+            temp_db_manager.close()
 
         elif config["db_type"] == "mongo":
-            from .mongo_manager import MongoManager
             from pymongo.mongo_client import MongoClient
 
             db_client = MongoClient(
@@ -509,54 +524,13 @@ def change_masterpass(master_pass: str, creds_manager: DbManager, ) -> None:
             print_green("Changed database user's password successfully!")
 
         creds_manager.close()
+        creds_manager = open_remote_manager(config, new_masterpass)
 
-        db_config = DbConfig(
-            config["db_host"],
-            config["db_user"],
-            new_masterpass,
-            config["db_name"],
-            config.get("db_port", None)
-        )
-        if config["db_type"] == "mysql":
-            creds_manager = MysqlManager(db_config)
-        elif config["db_type"] == "mongo":
-            creds_manager = MongoManager(db_config)
+    # The credentials are encrypted with the vault key so only the vault key needs to be wrapped with the new master password
+    rewrap_vault_key(new_masterpass, vault_key, creds_manager)
 
-    # Decrypt passwords and encrypt them with new salt and master password
-    raw_creds = creds_manager.get_all_credentials()
-    for raw_cred in raw_creds:
-        # TODO: Deal with stuff if the decryption fails
-        old_cred = raw_cred.get_credential(master_pass)
-        salt = generate_salt(16)
-        new_pass = encrypt_and_encode(
-            new_masterpass,
-            old_cred.password,
-            salt
-        )
-        new_title = encrypt_and_encode(
-            new_masterpass,
-            old_cred.title,
-            salt
-        )
-        new_email = encrypt_and_encode(
-            new_masterpass,
-            old_cred.email,
-            salt
-        )
-        new_username = encrypt_and_encode(
-            new_masterpass,
-            old_cred.username,
-            salt
-        )
-
-        creds_manager.modify_credential(
-            raw_cred.id,
-            new_title,
-            new_username,
-            new_email,
-            new_pass,
-            b64encode(salt).decode("ascii")
-        )
+    # Keys derived from the old master password are of no use anymore
+    clear_key_cache()
 
     print_green("Changed credential's master password successfully!")
 
@@ -564,8 +538,50 @@ def change_masterpass(master_pass: str, creds_manager: DbManager, ) -> None:
     return master_pass, creds_manager
 
 
+def read_export_file(file_path: str) -> List[RawCredential]:
+    """Returns the credentials in a file written by write_export_file, still encrypted with the file's master password."""
+    with open(file_path, "r") as file:
+        file_creds = json.load(file)
+
+    return [
+        RawCredential(
+            id=file_cred["id"],
+            title=file_cred["title"],
+            username=file_cred["username"],
+            email=file_cred["email"],
+            password=file_cred["password"],
+            salt=file_cred["salt"],
+        )
+        for file_cred in file_creds or []
+    ]
+
+
+def write_export_file(creds_manager: DbManager, file_path: str, file_master_pass: str) -> int:
+    """
+    Writes the credentials to a JSON file, encrypted with file_master_pass, and returns how many were written.
+    Nothing is written if there are no credentials.
+    """
+    raw_cred_batches = iter_chunks(creds_manager.iter_credentials(), DEFAULT_BATCH_SIZE)
+    first_batch = next(raw_cred_batches, None)
+    if not first_batch:
+        return 0
+
+    # The credentials are written a batch at a time in the same layout as json.dump would write them
+    count = 0
+    with open(file_path, "w") as file:
+        file.write("[")
+        separator = ""
+        for raw_creds in chain([first_batch], raw_cred_batches):
+            for cred in reencrypt_credentials(vault_key, file_master_pass, raw_creds):
+                file.write(separator + json.dumps(cred.get_obj()))
+                separator = ", "
+                count += 1
+        file.write("]")
+
+    return count
+
+
 def import_credentials(master_pass: str, creds_manager: DbManager, ) -> None:
-    from .passwords import generate_salt
     filename = better_input("Filename: ", validator=lambda x: True if os.path.isfile(x) else "File not found!")
     if filename == None:
         print("Aborting operation due to invalid input!", file=stderr)
@@ -577,44 +593,29 @@ def import_credentials(master_pass: str, creds_manager: DbManager, ) -> None:
         return
 
     file_master_pass: str = getpass("Input master password for file: ")
-    file_creds = json.load(open(filename, "r"))
+    raw_creds = read_export_file(filename)
 
-    if not file_creds:
+    if not raw_creds:
         print("There are no credentials in the file.")
 
     print("\nBegin importing file credentials...")
 
-    for file_cred in file_creds:
-
-        raw_cred = RawCredential(
-            id=file_cred["id"],
-            title=file_cred["title"],
-            username=file_cred["username"],
-            email=file_cred["email"],
-            password=file_cred["password"],
-            salt=file_cred["salt"],
-        )
-
-        salt = generate_salt(16)
-
-        new_cred = raw_cred.get_credential(file_master_pass).get_raw_credential(master_pass, salt)
-
-        creds_manager.add_credential(
-            new_cred.title,
-            new_cred.username,
-            new_cred.email,
-            new_cred.password,
-            new_cred.salt,
-        )
+    from .vault import check_master_password
+    if not check_master_password(file_master_pass, raw_creds):
+        print_red("Incorrect master password for file!", file=stderr)
+        print_red("Aborting operation!", file=stderr)
+        return
 
-        print_green("Credential added.")
-        print()
+    # Write all credentials in one go instead of once per credential
+    new_creds = reencrypt_credentials(file_master_pass, vault_key, raw_creds)
+    creds_manager.add_many(new_creds)
 
+    print_green(f"Added {len(new_creds)} credential(s).")
+    print()
     print_green("Imported credentials successfully!")
 
 
 def export_credentials(master_pass: str, creds_manager: DbManager, ) -> None:
-    from .passwords import generate_salt
     file_path = os.path.expanduser(better_input("File Name and Path: "))
     file_master_pass = getpass("(Optional) File Master Password: ") or master_pass
 
@@ -622,28 +623,10 @@ def export_credentials(master_pass: str, creds_manager: DbManager, ) -> None:
         print_red("Aborting operation due to invalid input!", file=stderr)
         return
 
-    raw_creds: List[RawCredential] = creds_manager.get_all_credentials()
-    if not raw_creds:
+    if not write_export_file(creds_manager, file_path, file_master_pass):
         print("No credentials to export.")
         return
 
-    cred_objs = []
-
-    for raw_cred in raw_creds:
-        salt = generate_salt(16)
-        cred = raw_cred.get_credential(master_pass).get_raw_credential(file_master_pass, salt)
-
-        cred_objs.append({
-            "id": cred.id,
-            "title": cred.title,
-            "username": cred.username,
-            "email": cred.email,
-            "password": cred.password,
-            "salt": b64encode(salt).decode('ascii'),
-        })
-
-    json.dump(cred_objs, open(file_path, "w"))
-
     print()
     print_green("Exported credentials successfully!")
 
@@ -657,31 +640,31 @@ def copy_password(master_pass: str, creds_manager: DbManager, ) -> None:
     id = int(id)
 
     try:
-        raw_cred = creds_manager.get_credential(id)
+        cred = fetch_credential(creds_manager, id)
     except Exception as e:
         print_red(f"Could not get credential due to the following error:", file=stderr)
         print_red(e, file=stderr)
         return
 
-    if not raw_cred:
+    if not cred:
         print_red("Credential not found!", file=stderr)
         return
 
-    raw_cred.copy_pass(master_pass)
+    cred.copy_pass()
 
 
 def password_checkup(master_pass: str, creds_manager: DbManager, ) -> None:
     from .passwords import follows_password_requirements
-    from .credentials import decode_decrypt_with_exception_handling, RawCredential
 
+    raw_cred_batches = iter_chunks(creds_manager.iter_credentials(), DEFAULT_BATCH_SIZE)
     try:
-        raw_creds: List[RawCredential] = creds_manager.get_all_credentials()
+        first_batch = next(raw_cred_batches, None)
     except Exception as e:
         print_red("Could not get all credentials due to the following error:", file=stderr)
         print_red(e, file=stderr)
         return
 
-    if not raw_creds:
+    if not first_batch:
         print("No credentials to check.")
         return
 
@@ -693,24 +676,29 @@ def password_checkup(master_pass: str, creds_manager: DbManager, ) -> None:
 
     duplicate_num = weak_num = undecryptable_num = 0
 
-    for raw_cred in raw_creds:
-        cred_id = raw_cred.id
-        cred_password = decode_decrypt_with_exception_handling("password", master_pass, raw_cred.password, raw_cred.salt)
+    decrypted_creds = (
+        decrypted_cred
+        for raw_creds in chain([first_batch], raw_cred_batches)
+        for decrypted_cred in decrypt_credentials(vault_key, raw_creds, ("password", ))
+    )
+
+    for cred, decrypted in decrypted_creds:
+        cred_id = cred.id
 
-        if not cred_password[0]:
+        if not decrypted:
             print_colored(f"Credential {{red}}{cred_id}{{reset}} cannot be checked!")
             undecryptable_num += 1
             continue
 
-        if cred_password[1] in duplicate_passwords:
+        if cred.password in duplicate_passwords:
             duplicate_num += 1
-            duplicate_passwords[cred_password[1]].append(cred_id)
+            duplicate_passwords[cred.password].append(cred_id)
         else:
-            duplicate_passwords[cred_password[1]] = [cred_id]
+            duplicate_passwords[cred.password] = [cred_id]
 
-        if not follows_password_requirements(cred_password[1])[0]:
+        if not follows_password_requirements(cred.password)[0]:
             weak_num += 1
-            weak_passwords[cred_id] = cred_password[1]
+            weak_passwords[cred_id] = cred.password
 
     print()
 
@@ -747,8 +735,60 @@ def password_checkup(master_pass: str, creds_manager: DbManager, ) -> None:
         print("Please address these issues ASAP!")
 
 
-def init(exit_app_param: Callable, config_param: dict) -> None:
-    global exit_app, config
+def calibrate_kdf(master_pass: str, creds_manager: DbManager, ) -> None:
+    from .passwords import KDF_PBKDF2, KDF_SCRYPT, KDF_PARAM_NAMES, calibrate_kdf_params, format_kdf_params, get_kdf_params, set_kdf_params, time_kdf
+    from .vault import rewrap_vault_key
+
+    current_params = get_kdf_params()
+    print_colored(f"Current key derivation: {{blue}}{current_params['kdf']}{{reset}} ({format_kdf_params(current_params)})")
+    print()
+
+    kdf = better_input(
+        f"Key derivation function ({KDF_PBKDF2}, {KDF_SCRYPT}) (Default: {KDF_SCRYPT}): ",
+        optional=True,
+        validator=lambda x: True if x in KDF_PARAM_NAMES else f"Key derivation function must be one of: {', '.join(KDF_PARAM_NAMES)}"
+    ) or KDF_SCRYPT
+
+    target_ms = better_input(
+        "Target time per key derivation in milliseconds (Default: 500): ",
+        optional=True,
+        validator=lambda x: True if x.isnumeric() and int(x) > 0 else "Target time must be a positive integer"
+    )
+    target_ms = int(target_ms) if target_ms else 500
+
+    print()
+    print("Benchmarking this machine...")
+    try:
+        new_params = calibrate_kdf_params(kdf, target_ms / 1000)
+        elapsed_ms = time_kdf(new_params, 1) * 1000
+    except Exception as e:
+        print_red("Could not calibrate the key derivation due to the following error:", file=stderr)
+        print_red(e, file=stderr)
+        return
+
+    print_colored(f"Calibrated key derivation: {{blue}}{new_params['kdf']}{{reset}} ({format_kdf_params(new_params)}), takes {{blue}}{elapsed_ms:.0f}ms{{reset}} on this machine")
+
+    if not confirm("Use these parameters for this vault? [Y/n]: ", True):
+        return
+
+    try:
+        set_kdf_params(new_params)
+        # The vault key is the only thing derived from the master password, so it is the only thing to rewrap
+        rewrap_vault_key(master_pass, vault_key, creds_manager)
+    except Exception as e:
+        set_kdf_params(current_params)
+        print_red("Could not store the new parameters due to the following error:", file=stderr)
+        print_red(e, file=stderr)
+        return
+
+    print()
+    print_green("The vault key is now protected with the new parameters!")
+
+
+def init(exit_app_param: Callable, config_param: dict, vault_key_param: Union[VaultKey, None], agent_param=None) -> None:
+    global exit_app, config, vault_key, agent
 
     exit_app = exit_app_param
     config = config_param
+    vault_key = vault_key_param
+    agent = agent_param
@@ -20,11 +20,13 @@ def validate_config(config_obj: any) -> Tuple[bool, List[str]]:
     errors: List[str] = []
 
     config_fields = {
-        "db_type": {"data_type": str, "data_type_name": "string",  "occurred": False, "optional": False, "allowed": ["mongo", "mysql"]},
-        "db_host": {"data_type": str, "data_type_name": "string",  "occurred": False, "optional": False},
-        "db_user": {"data_type": str, "data_type_name": "string",  "occurred": False, "optional": False},
+        "db_type": {"data_type": str, "data_type_name": "string",  "occurred": False, "optional": False, "allowed": ["mongo", "mysql", "sqlite"]},
+        # A sqlite database is a file, so there is no server to connect to
+        "db_host": {"data_type": str, "data_type_name": "string",  "occurred": False, "optional": config_obj.get("db_type") == "sqlite"},
+        "db_user": {"data_type": str, "data_type_name": "string",  "occurred": False, "optional": config_obj.get("db_type") == "sqlite"},
         "db_name": {"data_type": str, "data_type_name": "string",  "occurred": False, "optional": False},
         "db_port": {"data_type": int, "data_type_name": "integer",  "occurred": False, "optional": True},
+        "db_replica": {"data_type": str, "data_type_name": "string",  "occurred": False, "optional": True},
     }
 
     for key in config_obj.keys():
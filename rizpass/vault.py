@@ -0,0 +1,211 @@
+from sys import stderr
+from json import loads as load_json_str, dumps as dump_json_str
+from base64 import b64decode, b64encode
+from functools import partial
+from itertools import islice
+from typing import Dict, Iterable, List, Tuple, Union
+
+from .credentials import CREDENTIAL_FIELDS, RawCredential, decrypt_credential_fields, decrypt_credentials, encrypt_credentials
+from .db_manager import DbManager, iter_chunks
+from .output import print_colored, print_red, print_verbose
+from .passwords import VaultKey, generate_vault_key, generate_salt, get_custom_key, get_kdf_params, set_kdf_params, validate_kdf_params
+from .validator import ensure_type
+
+VAULT_KEY_META = "vault_key"
+VAULT_KEY_VERSION = 1
+VAULT_KEY_AAD = b"rizpass vault key"
+# Number of credentials a master password is checked against when there is no vault key to check it against
+VERIFY_SAMPLE_SIZE = 3
+
+
+def wrap_vault_key(master_pass: str, vault_key: VaultKey, migrated: bool = True) -> str:
+    """
+    Encrypts the vault key with a key derived from the master password using the configured KDF parameters
+    and returns the key record to be stored in the vault.
+    """
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    ensure_type(master_pass, str, "master_pass", "string")
+    ensure_type(vault_key, VaultKey, "vault_key", "VaultKey")
+
+    kdf_params = get_kdf_params()
+    salt = generate_salt(16)
+    nonce = generate_salt(12)
+    wrapped_key = AESGCM(get_custom_key(master_pass, salt, kdf_params)).encrypt(nonce, bytes(vault_key.data_key), VAULT_KEY_AAD)
+
+    return dump_json_str({
+        "version": VAULT_KEY_VERSION,
+        **kdf_params,
+        "salt": b64encode(salt).decode("ascii"),
+        "nonce": b64encode(nonce).decode("ascii"),
+        "wrapped_key": b64encode(wrapped_key).decode("ascii"),
+        "migrated": migrated,
+    })
+
+
+def unwrap_vault_key(master_pass: str, key_record: str) -> VaultKey:
+    """
+    Decrypts the vault key stored in the key record with the master password.
+    Raises cryptography.exceptions.InvalidTag if the master password is incorrect.
+    """
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    ensure_type(master_pass, str, "master_pass", "string")
+    ensure_type(key_record, str, "key_record", "string")
+
+    kdf_params = get_key_record_kdf_params(key_record)
+    key_record = load_json_str(key_record)
+
+    data_key = AESGCM(get_custom_key(master_pass, b64decode(key_record["salt"]), kdf_params)).decrypt(
+        b64decode(key_record["nonce"]),
+        b64decode(key_record["wrapped_key"]),
+        VAULT_KEY_AAD
+    )
+
+    return VaultKey(data_key)
+
+
+def get_key_record_kdf_params(key_record: str) -> Dict[str, Union[str, int]]:
+    """Returns the parameters of the KDF used to wrap the vault key."""
+    key_record = load_json_str(key_record)
+    if key_record.get("version") != VAULT_KEY_VERSION:
+        raise ValueError(f"Unsupported vault key version: {key_record.get('version')}")
+
+    return validate_kdf_params(key_record)
+
+
+def is_migrated(key_record: str) -> bool:
+    return load_json_str(key_record).get("migrated", True)
+
+
+def check_master_password(master_pass: Union[str, VaultKey], raw_creds: Iterable[RawCredential]) -> bool:
+    """
+    Returns True if the master password decrypts any of the credentials or there are none. Only credentials that fail
+    to authenticate count against the master password, so that a wrong one is rejected after VERIFY_SAMPLE_SIZE key
+    derivations instead of one for every credential, while corrupted credentials are skipped. Nothing is printed.
+    """
+    from cryptography.exceptions import InvalidTag
+    from .parallel import parallel_map
+
+    raw_creds = iter(raw_creds)
+    failures = 0
+    checked_any = False
+    # Most of the time the first credential is enough, so only read the rest of the sample if it fails
+    sample_size = 1
+
+    while failures < VERIFY_SAMPLE_SIZE:
+        sample = list(islice(raw_creds, sample_size))
+        if not sample:
+            return not checked_any
+        checked_any = True
+
+        for values, errors in parallel_map(partial(decrypt_credential_fields, master_pass, CREDENTIAL_FIELDS), sample):
+            # Fields that are not empty are only decrypted with the right master password
+            if not errors or any(values.values()):
+                return True
+            if all(isinstance(error, InvalidTag) for _, error in errors):
+                failures += 1
+
+        sample_size = VERIFY_SAMPLE_SIZE - failures
+
+    return False
+
+
+def migrate_credentials(master_pass: str, vault_key: VaultKey, creds_manager: DbManager) -> None:
+    """
+    Re-encrypts the credentials that are still encrypted directly with the master password using the vault key.
+    Credentials that were already migrated before an interrupted migration are left untouched.
+    """
+    from .parallel import parallel_map
+
+    raw_creds = creds_manager.get_all_credentials()
+    results = parallel_map(partial(decrypt_credential_fields, vault_key, CREDENTIAL_FIELDS), raw_creds)
+    pending_creds = [raw_cred for raw_cred, (_, errors) in zip(raw_creds, results) if errors]
+
+    if not pending_creds:
+        return
+
+    print_verbose(f"Migrating {len(pending_creds)} credential(s) to the vault key...")
+    decrypted_creds = decrypt_credentials(master_pass, pending_creds)
+
+    for cred, decrypted in decrypted_creds:
+        if not decrypted:
+            print_colored(f"Credential {{red}}{cred.id}{{reset}} could not be decrypted with the master password and has not been migrated!", file=stderr)
+
+    creds_manager.modify_many(encrypt_credentials(vault_key, [cred for cred, decrypted in decrypted_creds if decrypted]))
+
+
+def create_vault_key(master_pass: str, creds_manager: DbManager) -> Union[Tuple[Union[VaultKey, None], str], None]:
+    """
+    Creates a vault key for a vault that does not have one yet and returns it along with its key record.
+    If another rizpass process stored a vault key first, its key record is returned along with None instead.
+    Returns None if the master password is incorrect.
+    """
+    ids = creds_manager.list_ids()
+    # Only the credentials the master password is checked against have to be read
+    raw_creds = (raw_cred for chunk in iter_chunks(ids, VERIFY_SAMPLE_SIZE) for raw_cred in creds_manager.get_many(chunk))
+
+    # Make sure that the master password is correct before anything gets encrypted with it
+    if not check_master_password(master_pass, raw_creds):
+        return None
+
+    print_verbose("Creating a vault key...")
+    vault_key = generate_vault_key()
+    key_record = wrap_vault_key(master_pass, vault_key, migrated=not ids)
+    stored_key_record = creds_manager.add_meta(VAULT_KEY_META, key_record)
+    if stored_key_record != key_record:
+        print_verbose("Another rizpass process has created the vault key first, using that one instead...")
+        return None, stored_key_record
+
+    return vault_key, key_record
+
+
+def unlock_vault(master_pass: str, creds_manager: DbManager) -> Union[VaultKey, None]:
+    """
+    Returns the vault key of the vault. Vaults without a vault key are migrated to one first.
+    Returns None if the master password is incorrect.
+    """
+    ensure_type(master_pass, str, "master_pass", "string")
+
+    key_record = creds_manager.get_meta(VAULT_KEY_META)
+    vault_key = None
+
+    if key_record is None:
+        # Another rizpass process might be creating the vault key at the same time. The key is only stored if there is
+        # none yet, so that every process ends up using the one that was stored first
+        with creds_manager.batch():
+            key_record = creds_manager.get_meta(VAULT_KEY_META)
+            if key_record is None:
+                created_key = create_vault_key(master_pass, creds_manager)
+                if created_key is None:
+                    return None
+                vault_key, key_record = created_key
+
+    if vault_key is None:
+        from cryptography.exceptions import InvalidTag
+        try:
+            # The authentication tag of the wrapped vault key rejects a wrong master password after a single key derivation
+            vault_key = unwrap_vault_key(master_pass, key_record)
+            # Whatever gets encrypted with a password from now on uses the same KDF parameters as the vault key
+            set_kdf_params(get_key_record_kdf_params(key_record))
+        except InvalidTag:
+            return None
+        except Exception as e:
+            print_red("Could not load the vault key due to the following error:", file=stderr)
+            print_red(e, file=stderr)
+            return None
+
+    if not is_migrated(key_record):
+        # The migrated credentials and the key record marking them as migrated are written together
+        with creds_manager.batch():
+            migrate_credentials(master_pass, vault_key, creds_manager)
+            creds_manager.set_meta(VAULT_KEY_META, wrap_vault_key(master_pass, vault_key))
+
+    return vault_key
+
+
+def rewrap_vault_key(new_master_pass: str, vault_key: VaultKey, creds_manager: DbManager) -> None:
+    """Stores the vault key wrapped with the new master password. The credentials themselves are not touched."""
+    ensure_type(new_master_pass, str, "new_master_pass", "string")
+
+    creds_manager.set_meta(VAULT_KEY_META, wrap_vault_key(new_master_pass, vault_key))
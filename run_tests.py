@@ -4,7 +4,19 @@ from rizpass.test_better_input import *
 from rizpass.test_validator import *
 from rizpass.test_passwords import *
 from rizpass.test_credentials import *
+from rizpass.test_parallel import *
 from rizpass.test_file_manager import *
+from rizpass.test_binary_vault import *
+from rizpass.test_json_vault import *
+from rizpass.test_mysql_manager import *
+from rizpass.test_mongo_manager import *
+from rizpass.test_sqlite_manager import *
+from rizpass.test_memory_manager import *
+from rizpass.test_caching_manager import *
+from rizpass.test_replica_manager import *
+from rizpass.test_agent import *
+from rizpass.test_machine import *
+from rizpass.test_vault import *
 
 
 unittest.main()
\ No newline at end of file